@@ -134,4 +134,52 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
 MEDIA_URL = '/media/'
-MEDIA_ROOT = os.path.join(BASE_DIR, 'media')  # si BASE_DIR es str; si es Path usa BASE_DIR
\ No newline at end of file
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')  # si BASE_DIR es str; si es Path usa BASE_DIR
+
+# --- Tienda: almacenamiento de datos (ver store/storage.py) ---
+# 'json'  : un archivo JSON por colección en STORE_DATA_DIR (por defecto).
+# 'sqlite': base SQLite en modo WAL (STORE_SQLITE_PATH). Para pasar los
+#           datos actuales: python manage.py import_json_to_sqlite
+STORE_STORAGE_BACKEND = 'json'
+STORE_DATA_DIR = BASE_DIR / 'store' / 'data'
+STORE_SQLITE_PATH = BASE_DIR / 'store' / 'data' / 'store.sqlite3'
+
+# Carritos (solo backend 'json'):
+# 'sharded': un archivo por usuario en store/data/carts/ (migra carts.json).
+# 'single' : todos en store/data/carts.json.
+STORE_CART_STORAGE = 'sharded'
+
+# Escrituras JSON: cada archivo se escribe en un temporal y se renombra
+# (os.replace) con un candado fcntl entre workers. Con STORE_FSYNC = True
+# además se espera a que los datos lleguen al disco (más lento, más seguro).
+STORE_FSYNC = True
+
+# Guardado de órdenes (solo backend 'json'):
+# 'journal': cada orden/cambio de estado se agrega como una línea a
+#            store/data/orders.journal (orders.json queda como snapshot).
+# 'document': modo clásico, reescribe orders.json completo en cada cambio.
+STORE_ORDER_STORAGE = 'journal'
+# Cada cuántas líneas del journal se compacta automáticamente en orders.json
+STORE_ORDER_JOURNAL_COMPACT_EVERY = 500
+
+# Reservas de stock (ver store/reservation_service.py): cuántos segundos
+# queda apartado lo que un cliente agrega al carrito o lleva al checkout.
+STORE_RESERVATION_TTL_SECONDS = 15 * 60
+
+# Claves de idempotencia (ver store/idempotency_store.py): cuántos segundos
+# se guarda la respuesta de cada pedido con clave. Se guardan en el backend
+# (STORE_STORAGE_BACKEND), así valen para todos los workers.
+STORE_IDEMPOTENCY_TTL_SECONDS = 60 * 60
+# Máximo de claves guardadas: si se llena, se borran las que vencen antes.
+STORE_IDEMPOTENCY_MAX_ENTRIES = 10000
+# Cuánto dura la marca de "pedido en curso" de una clave: si el worker muere
+# a mitad del pedido, pasado este tiempo un reintento vuelve a ejecutarlo.
+STORE_IDEMPOTENCY_LEASE_SECONDS = 2 * 60
+
+# Archivo de órdenes (solo backend 'json', ver store/order_archive.py):
+# 'python manage.py archive_orders' (desde un cron) muda las órdenes
+# terminadas de hace más de STORE_ORDER_HOT_DAYS días a segmentos
+# comprimidos en store/data/orders_archive/, uno por período:
+# 'month', 'quarter' o 'year' (un cambio vale para lo que se archive después).
+STORE_ORDER_HOT_DAYS = 90
+STORE_ORDER_ARCHIVE_WINDOW = 'month'
@@ -3,62 +3,94 @@
 # Este archivo será el "motor" o "controlador" de la lógica de negocio
 # para todo lo relacionado con las Sucursales.
 
-import json
-import os
+import threading
+
 # Importamos el "molde" de Sucursal (el objeto Branch) desde models.py
 from .models import Branch 
-
-# --- Configuración de rutas ---
-# Necesitamos saber dónde estamos parados para encontrar el JSON.
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-# Definimos la ruta exacta de nuestro "mini-base de datos" JSON.
-BRANCHES_FILE = os.path.join(BASE_DIR, 'data', 'sucursales.json')
+# Las sucursales se guardan en la colección 'branches' del backend
+# (JSON: store/data/sucursales.json, SQLite: tabla 'branches').
+from .storage import get_storage_backend
 
 
 # Esta clase agrupa toda la funcionalidad de las sucursales.
-# Actúa como un intermediario entre los datos (el JSON) y el resto de la app.
+# Actúa como un intermediario entre los datos (el almacenamiento) y el resto de la app.
+#
+# Las sucursales quedan en memoria, pero se vuelven a leer SOLO si la
+# colección cambió (su huella, como en UserService): si se edita
+# sucursales.json (u otro worker guarda una sucursal), se ve sin
+# reiniciar el servidor y sin releer el archivo en cada pedido.
 class BranchService:
     
     # El "constructor": Se ejecuta automáticamente cuando creamos un BranchService.
     def __init__(self):
-        # Apenas se crea el servicio, cargamos todas las sucursales desde el JSON
-        # y las guardamos en la variable interna "_branches".
-        self._branches = self._load_branches()
+        self._lock = threading.RLock()
+        self._backend = None
+        self._stamp = None  # Huella de la colección en la última carga
+        self._loaded = False  # (Sin archivo la huella es None: cargamos igual una vez)
+        self._branches = []
+        # Diccionario {id: Branch} para buscar una sucursal sin recorrer la lista.
+        self._branches_by_id = {}
+        # Apenas se crea el servicio, cargamos todas las sucursales.
+        self._refresh()
+
+    def _refresh(self):
+        """Recarga las sucursales SOLO si cambiaron desde la última vez."""
+        backend = get_storage_backend()
+        if backend is not self._backend:
+            # Cambió el backend (ej: en los tests): empezamos de cero.
+            with self._lock:
+                self._backend = backend
+                self._store = backend.collection('branches')
+                self._loaded = False
+        if self._loaded and self._store.stamp() == self._stamp:
+            return
+        with self._lock:
+            # Otro hilo pudo haber recargado mientras esperábamos.
+            stamp = self._store.stamp()
+            if not self._loaded or stamp != self._stamp:
+                branches = self._load_branches()
+                # Armamos el diccionario primero y recién después publicamos
+                # los dos (quien esté leyendo en otro hilo ve los viejos).
+                branches_by_id = {b.branch_id: b for b in branches}
+                self._branches = branches
+                self._branches_by_id = branches_by_id
+                self._stamp = stamp
+                self._loaded = True
 
-    # Función interna (privada) para leer el archivo JSON.
+    # Función interna (privada) para leer las sucursales guardadas.
     def _load_branches(self):
-        """Lee el JSON y lo convierte en una lista de objetos Branch."""
+        """Lee las sucursales y las convierte en una lista de objetos Branch."""
         
-        # Intentamos leer el archivo.
+        # Intentamos leer la colección.
         try:
-            # Abrimos el archivo JSON en modo lectura ('r') y con codificación UTF-8.
-            with open(BRANCHES_FILE, 'r', encoding='utf-8') as f:
-                # 1. Cargamos el JSON y lo convertimos a una lista de diccionarios de Python.
-                data = json.load(f)
-                
-                # 2. Convertimos esa lista de diccionarios en una lista de Objetos "Branch".
-                #    Usamos el "molde" (la clase Branch) que importamos antes.
-                return [
-                    Branch(
-                        branch_id=b['id'],
-                        name=b['name'],
-                        address=b['address'],
-                        latitude=b['latitude'],
-                        longitude=b['longitude'],
-                        is_open=b['is_open'],
-                        opening_hours=b['opening_hours'],
-                        phone=b['phone']
-                    ) for b in data
-                ]
+            # 1. Pedimos la lista de diccionarios al almacenamiento.
+            data = self._store.all()
+            if not data:
+                raise FileNotFoundError("la colección 'branches' está vacía")
+            
+            # 2. Convertimos esa lista de diccionarios en una lista de Objetos "Branch".
+            #    Usamos el "molde" (la clase Branch) que importamos antes.
+            return [
+                Branch(
+                    branch_id=b['id'],
+                    name=b['name'],
+                    address=b['address'],
+                    latitude=b['latitude'],
+                    longitude=b['longitude'],
+                    is_open=b['is_open'],
+                    opening_hours=b['opening_hours'],
+                    phone=b['phone']
+                ) for b in data
+            ]
         
         # --- Manejo de Errores ---
-        # Si algo falla al leer el archivo (ej: no existe, el JSON está mal escrito)...
+        # Si algo falla al leer (ej: no existe, el JSON está mal escrito)...
         except Exception as e: 
             # ...imprimimos un mensaje de error muy claro en la consola.
             print("!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!")
             print(f"ERROR GRAVE AL CARGAR SUCURSALES: {e}")
-            print(f"La ruta del archivo que se intentó leer es:")
-            print(BRANCHES_FILE)
+            print(f"El origen que se intentó leer es:")
+            print(getattr(self._store, 'path', self._store))
             print("Por favor, verifica que el archivo exista y que el JSON sea válido.")
             print("!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!")
             # Devolvemos una lista vacía para que la aplicación no se caiga.
@@ -70,14 +102,16 @@ class BranchService:
 
     def get_all_branches(self):
         """Función pública: Devuelve TODAS las sucursales."""
+        self._refresh()
         # Convierte nuestra lista de objetos Branch a una lista de diccionarios simples.
         return [b.to_dict() for b in self._branches]
 
     def get_branch_by_id(self, branch_id):
         """Función pública: Busca y devuelve UNA sucursal por su ID."""
         
-        # Buscamos en la lista interna la primera sucursal que coincida con el ID.
-        branch = next((b for b in self._branches if b.branch_id == branch_id), None)
+        self._refresh()
+        # Buscamos en el diccionario interno (O(1), sin recorrer la lista).
+        branch = self._branches_by_id.get(branch_id)
         
         # Si la encontramos, la devolvemos (convertida a diccionario).
         # Si no la encontramos (branch es None), devolvemos None.
@@ -0,0 +1,89 @@
+# store/cart_pricing.py
+
+# Cálculo de precios de carritos en UN solo lugar. Antes cada vista
+# (carrito, checkout, admin de carritos) y Cart.get_total() tenían su
+# propio bucle que buscaba los productos de a uno.
+#
+# CartPricer junta los IDs de TODOS los productos que aparecen en los
+# carritos y los busca en el catálogo de una sola vez.
+#
+# El stock "disponible" de cada línea descuenta lo que tienen reservado
+# OTROS clientes (ver reservation_service.py); lo reservado por el dueño
+# del carrito sí cuenta para él.
+
+from .product_service import ProductService
+from .reservation_service import get_reservation_service
+
+
+class CartPricer:
+    """
+    Calcula subtotales, total y problemas (productos que ya no existen o
+    sin stock suficiente) de uno o varios carritos.
+
+    El resultado de price_cart() es un diccionario:
+        {
+            "lines": [{"product_id", "product", "quantity",
+                       "unit_price", "subtotal", "available", "in_stock"}, ...],
+            "total": 1234.5,
+            "missing": [105, ...],                 # IDs que no existen
+            "out_of_stock": [{"product_id", "title",
+                              "requested", "available"}, ...]
+        }
+    """
+
+    def __init__(self, product_service=None, reservations=None):
+        self._products = product_service or ProductService()
+        self._reservations = reservations or get_reservation_service()
+
+    def price_cart(self, cart):
+        """Precio de UN carrito (objeto Cart)."""
+        return self.price_carts([cart])[0]
+
+    def price_carts(self, carts):
+        """
+        Precio de varios carritos (lista de objetos Cart), en el mismo
+        orden. Todos los productos se buscan en una sola consulta.
+        """
+        carts = list(carts)
+        product_ids = {item.product_id for cart in carts for item in cart.items.values()}
+        products = self._products.get_products_by_ids(product_ids)
+        return [self._price(cart, products) for cart in carts]
+
+    def _price(self, cart, products):
+        available = self._reservations.available_for(
+            {pid: products[pid]['stock'] for pid in cart.items if pid in products}, cart.user_id
+        )
+        lines = []
+        total = 0
+        missing = []
+        out_of_stock = []
+        for item in cart.items.values():
+            product = products.get(item.product_id)
+            if not product:
+                missing.append(item.product_id)
+                continue
+            subtotal = product['price'] * item.quantity
+            in_stock = available[item.product_id] >= item.quantity
+            if not in_stock:
+                out_of_stock.append({
+                    "product_id": item.product_id,
+                    "title": product['title'],
+                    "requested": item.quantity,
+                    "available": available[item.product_id]
+                })
+            lines.append({
+                "product_id": item.product_id,
+                "product": product,
+                "quantity": item.quantity,
+                "unit_price": product['price'],
+                "subtotal": subtotal,
+                "available": available[item.product_id],
+                "in_stock": in_stock
+            })
+            total += subtotal
+        return {
+            "lines": lines,
+            "total": total,
+            "missing": missing,
+            "out_of_stock": out_of_stock
+        }
@@ -0,0 +1,634 @@
+# store/catalog_indexes.py
+
+# "Índices" del catálogo: estructuras en memoria que el CatalogRepository
+# mantiene al día cada vez que se crea, modifica o borra un producto.
+# Sirven para NO recorrer todo el catálogo en cada búsqueda.
+#
+# Cada índice implementa:
+#   rebuild(products, categories) -> se arma desde cero (al cargar datos)
+#   add(product) / remove(product) -> alta y baja de un producto
+#   before_update(product) / after_update(product) -> alrededor de una
+#       modificación (por defecto: remove + add)
+
+import re
+import unicodedata
+from abc import ABC, abstractmethod
+from bisect import bisect_left, bisect_right, insort
+
+from .models import ReadOnlyDict
+
+
+class CatalogIndex(ABC):
+    """Molde base para los índices del catálogo."""
+
+    name = None  # Con este nombre se lo pide al repositorio: repo.index('...')
+
+    def __init__(self):
+        self.categories = {}  # {category_id: Category} (lo mantiene el repositorio)
+        self.clear()
+
+    @abstractmethod
+    def clear(self):
+        pass
+
+    def rebuild(self, products, categories):
+        self.categories = {c.category_id: c for c in categories}
+        self.clear()
+        for product in products:
+            self.add(product)
+
+    @abstractmethod
+    def add(self, product):
+        pass
+
+    @abstractmethod
+    def remove(self, product):
+        pass
+
+    def before_update(self, product):
+        self.remove(product)
+
+    def after_update(self, product):
+        self.add(product)
+
+
+class ProductLookupIndex(CatalogIndex):
+    """
+    Diccionarios id -> producto, y también:
+      category_id -> {id: producto}
+      branch_id   -> {id: producto}
+    Buscar por ID es O(1) y filtrar por categoría/sucursal cuesta lo que
+    mide el resultado, no el catálogo entero.
+    """
+
+    name = 'lookup'
+
+    def clear(self):
+        self.by_id = {}
+        self.by_category = {}
+        self.by_branch = {}
+        self._pending = {}  # product_id -> (category_id, branch_id) antes de modificar
+
+    def add(self, product):
+        product_id = product.product_id
+        self.by_id[product_id] = product
+        self.by_category.setdefault(product.category_id, {})[product_id] = product
+        self.by_branch.setdefault(product.branch_id, {})[product_id] = product
+
+    def remove(self, product):
+        self._remove_keys(product.product_id, product.category_id, product.branch_id)
+
+    def _remove_keys(self, product_id, category_id, branch_id):
+        self.by_id.pop(product_id, None)
+        for buckets, key in ((self.by_category, category_id), (self.by_branch, branch_id)):
+            bucket = buckets.get(key)
+            if bucket is not None:
+                bucket.pop(product_id, None)
+                if not bucket:
+                    del buckets[key]
+
+    # Si la categoría y la sucursal no cambian, el producto se queda donde
+    # estaba (así los listados mantienen su orden).
+
+    def before_update(self, product):
+        self._pending[product.product_id] = (product.category_id, product.branch_id)
+
+    def after_update(self, product):
+        old_category, old_branch = self._pending.pop(product.product_id)
+        if (old_category, old_branch) != (product.category_id, product.branch_id):
+            self._remove_keys(product.product_id, old_category, old_branch)
+            self.add(product)
+
+    # --- Consultas ---
+
+    def in_category(self, category_id):
+        return list(self.by_category.get(category_id, {}).values())
+
+    def in_branch(self, branch_id):
+        return list(self.by_branch.get(branch_id, {}).values())
+
+
+# --- Búsqueda de texto ---
+
+_WORD = re.compile(r'[a-z0-9]+')
+
+
+def fold_text(text):
+    """Minúsculas y sin tildes: 'Tórta Ñandú' -> 'torta nandu'."""
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    return ''.join(ch for ch in decomposed if not unicodedata.combining(ch)).lower()
+
+
+def tokenize(text):
+    """Las palabras de un texto, ya "plegadas" (ver fold_text)."""
+    return _WORD.findall(fold_text(text))
+
+
+class ProductSearchIndex(CatalogIndex):
+    """
+    Índice invertido de título y descripción ("búsqueda de texto"):
+
+      postings  palabra -> {product_id: peso}
+      terms     lista ORDENADA de todas las palabras (para prefijos)
+
+    El peso de una palabra en un producto es 3 por cada vez que aparece en
+    el título y 1 por cada vez en la descripción. Buscar "tor choc"
+    encuentra los productos que tienen una palabra que empieza con "tor" Y
+    otra que empieza con "choc"; primero los de más peso (una palabra
+    completa suma el doble que un prefijo).
+
+    Una búsqueda recorre solo las palabras que empiezan con lo buscado
+    (bisect sobre 'terms') y sus productos: no depende del tamaño del
+    catálogo.
+    """
+
+    name = 'search'
+    TITLE_WEIGHT = 3
+    DESCRIPTION_WEIGHT = 1
+    EXACT_BONUS = 2
+
+    def clear(self):
+        self.postings = {}
+        self.terms = []
+        self._product_terms = {}  # product_id -> palabras (para sacarlo)
+
+    def _weights(self, product):
+        weights = {}
+        for text, weight in ((product.title, self.TITLE_WEIGHT), (product.description, self.DESCRIPTION_WEIGHT)):
+            for term in tokenize(text):
+                weights[term] = weights.get(term, 0) + weight
+        return weights
+
+    def add(self, product):
+        weights = self._weights(product)
+        for term, weight in weights.items():
+            posting = self.postings.get(term)
+            if posting is None:
+                posting = self.postings[term] = {}
+                insort(self.terms, term)
+            posting[product.product_id] = weight
+        self._product_terms[product.product_id] = list(weights)
+
+    def remove(self, product):
+        for term in self._product_terms.pop(product.product_id, ()):
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            posting.pop(product.product_id, None)
+            if not posting:
+                del self.postings[term]
+                position = bisect_left(self.terms, term)
+                if position < len(self.terms) and self.terms[position] == term:
+                    del self.terms[position]
+
+    # --- Consultas ---
+
+    def _matching_terms(self, word):
+        """Las palabras del índice que empiezan con 'word' (incluida ella misma)."""
+        terms = self.terms
+        position = bisect_left(terms, word)
+        while position < len(terms) and terms[position].startswith(word):
+            yield terms[position]
+            position += 1
+
+    def search(self, query):
+        """
+        IDs de los productos que coinciden con TODAS las palabras de
+        'query', del más relevante al menos (a igual puntaje, por ID).
+        """
+        scores = self.scores(query)
+        return sorted(scores, key=lambda product_id: (-scores[product_id], product_id))
+
+    def scores(self, query):
+        """{product_id: puntaje} de los productos que coinciden con 'query'."""
+        scores = None
+        for word in dict.fromkeys(tokenize(query)):
+            word_scores = {}
+            for term in self._matching_terms(word):
+                bonus = self.EXACT_BONUS if term == word else 1
+                for product_id, weight in self.postings[term].items():
+                    # Si varias palabras del producto empiezan igual, cuenta la mejor
+                    word_scores[product_id] = max(word_scores.get(product_id, 0), weight * bonus)
+            if scores is None:
+                scores = word_scores
+            else:
+                scores = {product_id: score + word_scores[product_id]
+                          for product_id, score in scores.items() if product_id in word_scores}
+            if not scores:
+                return {}
+        return scores or {}  # (None: la búsqueda no tenía ninguna palabra)
+
+
+# --- Sugerencias mientras se escribe ("typeahead") ---
+
+def _suggest_keys(text):
+    """
+    Claves de autocompletado de un texto: una por cada palabra, desde esa
+    palabra hasta el final. 'Torta de Chocolate' ->
+    ['torta de chocolate', 'de chocolate', 'chocolate']
+    (así "choco" también encuentra esa torta).
+    """
+    words = tokenize(text)
+    return [' '.join(words[i:]) for i in range(len(words))]
+
+
+def suggest_prefix(text):
+    """Lo que escribió el usuario, normalizado como las claves."""
+    return ' '.join(tokenize(text))
+
+
+class ProductSuggestIndex(CatalogIndex):
+    """
+    Listas ORDENADAS de (clave, id) para autocompletar títulos de
+    productos y nombres de categorías (ver _suggest_keys):
+
+      product_keys  sucursal -> [(clave, product_id), ...]  (y None -> todas)
+      category_keys [(clave, category_id), ...]
+      branch_categories  sucursal -> {category_id: cantidad de productos}
+
+    Las claves que empiezan con lo escrito están todas juntas: bisect
+    encuentra la primera y se leen hasta juntar 'limit' distintas. El
+    costo depende de 'limit', no del tamaño del catálogo.
+    """
+
+    name = 'suggest'
+
+    def clear(self):
+        self.product_keys = {None: []}
+        self.category_keys = sorted((key, category_id)
+                                    for category_id, category in self.categories.items()
+                                    for key in _suggest_keys(category.name))
+        self.branch_categories = {}
+        self._indexed = {}  # product_id -> (sucursal, categoría, claves) para sacarlo
+
+    def add(self, product):
+        keys = _suggest_keys(product.title)
+        branch_id = product.branch_id
+        for scope in (None, branch_id):
+            entries = self.product_keys.setdefault(scope, [])
+            for key in keys:
+                insort(entries, (key, product.product_id))
+        counts = self.branch_categories.setdefault(branch_id, {})
+        counts[product.category_id] = counts.get(product.category_id, 0) + 1
+        self._indexed[product.product_id] = (branch_id, product.category_id, keys)
+
+    def remove(self, product):
+        indexed = self._indexed.pop(product.product_id, None)
+        if indexed is None:
+            return
+        branch_id, category_id, keys = indexed
+        for scope in (None, branch_id):
+            entries = self.product_keys.get(scope, [])
+            for key in keys:
+                position = bisect_left(entries, (key, product.product_id))
+                if position < len(entries) and entries[position] == (key, product.product_id):
+                    del entries[position]
+        counts = self.branch_categories.get(branch_id, {})
+        counts[category_id] = counts.get(category_id, 0) - 1
+        if counts[category_id] <= 0:
+            del counts[category_id]
+
+    # --- Consultas ---
+
+    @staticmethod
+    def _first_ids(entries, prefix, limit, accept=None):
+        """Los primeros 'limit' IDs distintos cuya clave empieza con 'prefix'."""
+        found = []
+        position = bisect_left(entries, (prefix,))
+        while position < len(entries) and len(found) < limit:
+            key, item_id = entries[position]
+            if not key.startswith(prefix):
+                break
+            if item_id not in found and (accept is None or accept(item_id)):
+                found.append(item_id)
+            position += 1
+        return found
+
+    def suggest_products(self, text, branch_id=None, limit=8):
+        prefix = suggest_prefix(text)
+        if not prefix:
+            return []
+        return self._first_ids(self.product_keys.get(branch_id, []), prefix, limit)
+
+    def suggest_categories(self, text, branch_id=None, limit=3):
+        prefix = suggest_prefix(text)
+        if not prefix:
+            return []
+        accept = None
+        if branch_id is not None:
+            # Solo categorías con algún producto en esa sucursal
+            accept = self.branch_categories.get(branch_id, {}).__contains__
+        return self._first_ids(self.category_keys, prefix, limit, accept)
+
+
+# --- Orden (para paginar el listado por precio, título o stock) ---
+
+SORT_FIELDS = ('id', 'price', 'title', 'stock')
+
+
+def sort_key(product, field):
+    """(valor, id) de un producto para ordenar por 'field' (uno de SORT_FIELDS)."""
+    if field == 'title':
+        value = fold_text(product.title)
+    elif field == 'id':
+        value = product.product_id
+    else:
+        value = getattr(product, field) or 0
+    return (value, product.product_id)
+
+
+def keyset_slice(entries, after=None, limit=25, descending=False):
+    """
+    Hasta 'limit' elementos de 'entries' (lista ORDENADA de claves
+    (valor, id)) que vienen DESPUÉS de la clave 'after' (paginación
+    "keyset": el cursor es la última clave de la página anterior).
+    """
+    if descending:
+        high = len(entries) if after is None else bisect_left(entries, tuple(after))
+        return entries[max(high - limit, 0):high][::-1]
+    low = 0 if after is None else bisect_right(entries, tuple(after))
+    return entries[low:low + limit]
+
+
+class ProductSortIndex(CatalogIndex):
+    """
+    Una lista ORDENADA de (valor, id) por cada campo de SORT_FIELDS.
+    Una página del listado ordenado es un bisect + un corte de la lista:
+    no se ordena nada en cada petición.
+    """
+
+    name = 'sorted'
+
+    def clear(self):
+        self.by_field = {field: [] for field in SORT_FIELDS}
+        self._keys = {}  # product_id -> {campo: clave} (para sacarlo)
+
+    def add(self, product):
+        keys = {field: sort_key(product, field) for field in SORT_FIELDS}
+        for field, key in keys.items():
+            insort(self.by_field[field], key)
+        self._keys[product.product_id] = keys
+
+    def remove(self, product):
+        for field, key in self._keys.pop(product.product_id, {}).items():
+            entries = self.by_field[field]
+            position = bisect_left(entries, key)
+            if position < len(entries) and entries[position] == key:
+                del entries[position]
+
+    def page(self, field, after=None, limit=25, descending=False):
+        """Claves (valor, id) de una página (ver keyset_slice)."""
+        return keyset_slice(self.by_field[field], after, limit, descending)
+
+
+# --- Filtros combinados y conteos por faceta ---
+
+# Límites de los rangos de precio de la faceta "precio" (en pesos)
+PRICE_BUCKETS = (10_000, 20_000, 30_000, 40_000, 50_000)
+# Filtros que entiende ProductFacetIndex.match()
+FACET_FILTERS = ('category_id', 'branch_id', 'min_price', 'max_price', 'price_bucket',
+                 'in_stock', 'min_weight', 'max_weight')
+
+
+def price_bucket(price):
+    """Número de rango de precio: 0 = menos de PRICE_BUCKETS[0], ..."""
+    return bisect_right(PRICE_BUCKETS, price or 0)
+
+
+def _bits_of(bitmap):
+    """Las posiciones de los bits en 1 (de menor a mayor)."""
+    while bitmap:
+        lowest = bitmap & -bitmap
+        yield lowest.bit_length() - 1
+        bitmap ^= lowest
+
+
+class ProductFacetIndex(CatalogIndex):
+    """
+    Filtros combinados con "bitmaps": cada producto ocupa una posición
+    (slot) y cada valor de un filtro guarda un número entero de Python
+    cuyo bit N está en 1 si el producto del slot N lo cumple:
+
+      by_category  category_id -> bitmap
+      by_branch    branch_id   -> bitmap
+      by_bucket    rango de precio (ver PRICE_BUCKETS) -> bitmap
+      in_stock     bitmap de los que tienen stock
+      by_price / by_weight  listas ORDENADAS de (valor, slot), para rangos
+
+    Combinar filtros es un AND de bitmaps y contar una faceta es contar
+    los bits de un AND (int.bit_count): no se recorre ningún producto.
+    """
+
+    name = 'facets'
+
+    def clear(self):
+        self.by_category = {}
+        self.by_branch = {}
+        self.by_bucket = {}
+        self.in_stock = 0
+        self.all = 0
+        self.by_price = []
+        self.by_weight = []
+        self.products = {}     # slot -> producto
+        self._slots = {}       # product_id -> (slot, valores con los que se indexó)
+        self._free = []        # slots de productos borrados (se reusan)
+        self._next_slot = 0
+
+    def add(self, product):
+        if self._free:
+            slot = self._free.pop()
+        else:
+            slot = self._next_slot
+            self._next_slot += 1
+        bit = 1 << slot
+        weight = getattr(product, 'weight', None)
+        values = (product.category_id, product.branch_id, price_bucket(product.price),
+                  product.stock > 0, (product.price or 0, slot),
+                  (weight, slot) if weight is not None else None)
+        category_id, branch_id, bucket, has_stock, price_key, weight_key = values
+        self.by_category[category_id] = self.by_category.get(category_id, 0) | bit
+        self.by_branch[branch_id] = self.by_branch.get(branch_id, 0) | bit
+        self.by_bucket[bucket] = self.by_bucket.get(bucket, 0) | bit
+        if has_stock:
+            self.in_stock |= bit
+        self.all |= bit
+        insort(self.by_price, price_key)
+        if weight_key is not None:
+            insort(self.by_weight, weight_key)
+        self.products[slot] = product
+        self._slots[product.product_id] = (slot, values)
+
+    def remove(self, product):
+        entry = self._slots.pop(product.product_id, None)
+        if entry is None:
+            return
+        slot, (category_id, branch_id, bucket, has_stock, price_key, weight_key) = entry
+        keep = ~(1 << slot)
+        for bitmaps, key in ((self.by_category, category_id), (self.by_branch, branch_id),
+                             (self.by_bucket, bucket)):
+            bitmaps[key] &= keep
+            if not bitmaps[key]:
+                del bitmaps[key]
+        self.in_stock &= keep
+        self.all &= keep
+        for entries, key in ((self.by_price, price_key), (self.by_weight, weight_key)):
+            if key is None:
+                continue
+            position = bisect_left(entries, key)
+            if position < len(entries) and entries[position] == key:
+                del entries[position]
+        del self.products[slot]
+        self._free.append(slot)
+
+    # --- Consultas ---
+
+    @staticmethod
+    def _range_bits(entries, low, high):
+        """Bitmap de los slots con low <= valor <= high (cuesta lo que mide el rango)."""
+        start = 0 if low is None else bisect_left(entries, (low,))
+        end = len(entries) if high is None else bisect_right(entries, (high, float('inf')))
+        bitmap = 0
+        for _, slot in entries[start:end]:
+            bitmap |= 1 << slot
+        return bitmap
+
+    def slots_of(self, product_ids):
+        """Bitmap de unos productos (ej: los que encontró la búsqueda de texto)."""
+        bitmap = 0
+        for product_id in product_ids:
+            entry = self._slots.get(product_id)
+            if entry is not None:
+                bitmap |= 1 << entry[0]
+        return bitmap
+
+    def match(self, category_id=None, branch_id=None, min_price=None, max_price=None,
+              price_bucket=None, in_stock=None, min_weight=None, max_weight=None,
+              within=None, skip=()):
+        """
+        Bitmap de los productos que cumplen TODOS los filtros dados
+        ('within': un bitmap de partida; 'skip': filtros que se ignoran,
+        para contar una faceta sin su propio filtro).
+        """
+        bitmap = self.all if within is None else within
+        if category_id is not None and 'category_id' not in skip:
+            bitmap &= self.by_category.get(category_id, 0)
+        if branch_id is not None:
+            bitmap &= self.by_branch.get(branch_id, 0)
+        if (min_price is not None or max_price is not None) and 'price' not in skip:
+            bitmap &= self._range_bits(self.by_price, min_price, max_price)
+        if price_bucket is not None and 'price' not in skip:
+            bitmap &= self.by_bucket.get(price_bucket, 0)
+        if in_stock and 'in_stock' not in skip:
+            bitmap &= self.in_stock
+        if min_weight is not None or max_weight is not None:
+            bitmap &= self._range_bits(self.by_weight, min_weight, max_weight)
+        return bitmap
+
+    def products_in(self, bitmap):
+        """Los productos de un bitmap (en el orden de sus slots)."""
+        return [self.products[slot] for slot in _bits_of(bitmap)]
+
+    def facet_counts(self, within=None, **filters):
+        """
+        Conteos por faceta para los filtros dados. Cada faceta se cuenta
+        SIN su propio filtro (así se ve cuántos habría al cambiarlo). Un
+        rango de precio va de 'min' (inclusive) a 'max' (sin incluir):
+            {"total", "categories": {id: n}, "price_buckets": [{min, max, count}],
+             "stock": {"in_stock": n, "out_of_stock": n}}
+        """
+        matched = self.match(within=within, **filters)
+        without_category = self.match(within=within, skip=('category_id',), **filters)
+        without_price = self.match(within=within, skip=('price',), **filters)
+        without_stock = self.match(within=within, skip=('in_stock',), **filters)
+        in_stock = (without_stock & self.in_stock).bit_count()
+        bounds = (None,) + PRICE_BUCKETS + (None,)
+        return {
+            "total": matched.bit_count(),
+            "categories": {category_id: count for category_id, bitmap in self.by_category.items()
+                           if (count := (without_category & bitmap).bit_count())},
+            "price_buckets": [{"bucket": bucket, "min": bounds[bucket], "max": bounds[bucket + 1],
+                               "count": (without_price & self.by_bucket.get(bucket, 0)).bit_count()}
+                              for bucket in range(len(PRICE_BUCKETS) + 1)],
+            "stock": {"in_stock": in_stock, "out_of_stock": without_stock.bit_count() - in_stock}
+        }
+
+
+# --- Catálogo ya armado por sucursal ---
+
+class BranchCatalogIndex(CatalogIndex):
+    """
+    Las páginas del catálogo por sucursal, ya armadas ("vistas
+    materializadas"):
+
+      rows  sucursal -> {product_id: dict del producto + 'category_name'
+            (sin 'version')}
+            (y None -> TODOS los productos, para el admin sin filtro)
+
+    Cada fila se rearma cuando su producto cambia (precio, stock,
+    sucursal, ...); si cambian las categorías el repositorio rearma todo.
+    Una página de sucursal cuesta lo que miden SUS productos: ni se
+    filtra el catálogo ni se busca el nombre de cada categoría.
+    """
+
+    name = 'branch_catalog'
+
+    def clear(self):
+        self.rows = {None: {}}
+        self._pending = {}  # product_id -> sucursal antes de modificar
+
+    def _row(self, product):
+        # (to_dict() es de solo lectura: la fila es una copia propia)
+        row = dict(product.to_dict())
+        # 'version' es para el descuento optimista de stock (sube al
+        # guardar, después de armar la fila): las páginas no la usan
+        row.pop('version', None)
+        category = self.categories.get(product.category_id)
+        row['category_name'] = category.name if category else 'Sin Categoría'
+        return ReadOnlyDict(row)
+
+    def add(self, product):
+        row = self._row(product)
+        self.rows[None][product.product_id] = row
+        self.rows.setdefault(product.branch_id, {})[product.product_id] = row
+
+    def remove(self, product):
+        self._remove(product.product_id, product.branch_id)
+
+    def _remove(self, product_id, branch_id):
+        self.rows[None].pop(product_id, None)
+        rows = self.rows.get(branch_id)
+        if rows is not None:
+            rows.pop(product_id, None)
+            if not rows:
+                del self.rows[branch_id]
+
+    # Si la sucursal no cambia, la fila nueva reemplaza a la vieja en su
+    # lugar (así la página mantiene su orden).
+
+    def before_update(self, product):
+        self._pending[product.product_id] = product.branch_id
+
+    def after_update(self, product):
+        old_branch = self._pending.pop(product.product_id)
+        if old_branch != product.branch_id:
+            self._remove(product.product_id, old_branch)
+            self.add(product)
+        else:
+            row = self._row(product)
+            self.rows[None][product.product_id] = row
+            self.rows.setdefault(product.branch_id, {})[product.product_id] = row
+
+    # --- Consultas ---
+
+    def page(self, branch_id=None, product_ids=None):
+        """
+        Las filas de una sucursal (None: todas), SIN copiarlas: son de
+        solo lectura (quien quiera agregarles claves se hace su copia).
+        Con 'product_ids', solo esas (en ese orden).
+        """
+        rows = self.rows.get(branch_id, {})
+        if product_ids is None:
+            # (list() copia de una vez: si otro hilo agrega un producto
+            # mientras la armamos, no se rompe nada)
+            return list(rows.values())
+        return [rows[product_id] for product_id in product_ids if product_id in rows]
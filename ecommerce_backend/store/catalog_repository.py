@@ -0,0 +1,456 @@
+# store/catalog_repository.py
+
+# Este archivo guarda el catálogo (categorías + productos) UNA sola vez
+# por proceso. Antes, cada vista creaba su propio ProductService() y volvía
+# a leer y parsear los dos JSON en cada petición.
+
+import threading
+from contextlib import contextmanager
+# Importamos los "moldes" que necesita el catálogo
+from .models import Category, CakeProduct
+# Índices en memoria (id -> producto, categoría -> productos, ...)
+from .catalog_indexes import (ProductLookupIndex, ProductSearchIndex, ProductSuggestIndex,
+                              ProductSortIndex, ProductFacetIndex, BranchCatalogIndex)
+# Las colecciones 'categories' y 'products' del backend (JSON o SQLite)
+from .storage import get_storage_backend
+
+
+class CatalogRepository:
+    """
+    Catálogo compartido y thread-safe.
+
+    - Carga los datos solo cuando la huella de su colección cambia
+      (en JSON: mtime/tamaño del archivo; en SQLite: la versión de la tabla).
+    - Cada escritura hecha desde este proceso actualiza la huella y el
+      contador 'version', así no volvemos a leer lo que nosotros mismos
+      acabamos de guardar.
+    - Las listas 'products' y 'categories' se reemplazan enteras
+      (copy-on-write): quien esté recorriendo la lista vieja en otro hilo
+      no se ve afectado.
+    - Mantiene índices en memoria (ver catalog_indexes.py) que se
+      actualizan EN EL LUGAR en cada alta, modificación y baja (con
+      self.lock tomado). Por eso toda consulta a un índice también toma
+      self.lock y devuelve listas nuevas: nadie recorre un diccionario o
+      una lista de un índice mientras otro hilo lo cambia.
+    """
+
+    # Índices que se arman para cada catálogo
+    index_types = [ProductLookupIndex, ProductSearchIndex, ProductSuggestIndex, ProductSortIndex,
+                   ProductFacetIndex, BranchCatalogIndex]
+
+    def __init__(self, categories_collection, products_collection):
+        self._categories_store = categories_collection
+        self._products_store = products_collection
+        # RLock: los métodos de escritura llaman a refresh() teniendo el lock.
+        self.lock = threading.RLock()
+        self._categories = []
+        self._products = []
+        self._categories_by_id = {}
+        self._indexes = self._build_indexes([], [])
+        self._stamps = None  # Huella de las dos colecciones en la última carga
+        self.version = 0     # Sube con cada recarga o escritura
+        self.backend = None  # Backend del que salieron las colecciones
+
+    # --- Lectura (con invalidación por huella) ---
+
+    def _current_stamps(self):
+        return (self._categories_store.stamp(), self._products_store.stamp())
+
+    def refresh(self):
+        """Recarga los datos SOLO si cambiaron en disco desde la última vez."""
+        stamps = self._current_stamps()
+        if stamps == self._stamps:
+            return
+        with self.lock:
+            # Otro hilo pudo haber recargado mientras esperábamos el lock.
+            stamps = self._current_stamps()
+            if stamps != self._stamps:
+                self._reload(stamps)
+
+    def _reload(self, stamps):
+        # Armamos TODO primero y recién después lo publicamos.
+        categories = self._load_categories()
+        categories_by_id = {c.category_id: c for c in categories}
+        products = self._load_products(categories_by_id)
+        indexes = self._build_indexes(products, categories)
+        self._categories = categories
+        self._categories_by_id = categories_by_id
+        self._products = products
+        self._indexes = indexes
+        self._stamps = stamps
+        self.version += 1
+
+    def _build_indexes(self, products, categories):
+        indexes = {}
+        for index_type in self.index_types:
+            index = index_type()
+            index.rebuild(products, categories)
+            indexes[index_type.name] = index
+        return indexes
+
+    def index(self, name):
+        """
+        Devuelve un índice del catálogo (ya al día con el disco). Los
+        índices cambian en el lugar: hay que consultarlo con self.lock tomado.
+        """
+        self.refresh()
+        return self._indexes[name]
+
+    # --- Búsquedas rápidas (por diccionario) ---
+
+    def get_product(self, product_id):
+        with self.lock:
+            return self.index('lookup').by_id.get(product_id)
+
+    def get_products(self, product_ids):
+        """Varios productos de una vez: {id: producto} (los que existan)."""
+        with self.lock:
+            by_id = self.index('lookup').by_id  # Un solo refresh() para todos
+            return {pid: by_id[pid] for pid in product_ids if pid in by_id}
+
+    def get_category(self, category_id):
+        self.refresh()
+        return self._categories_by_id.get(category_id)
+
+    def has_category(self, category_id):
+        return self.get_category(category_id) is not None
+
+    def products_in_category(self, category_id):
+        with self.lock:
+            return self.index('lookup').in_category(category_id)
+
+    def products_in_branch(self, branch_id):
+        with self.lock:
+            return self.index('lookup').in_branch(branch_id)
+
+    def branch_catalog(self, branch_id=None, product_ids=None):
+        """Filas ya armadas del catálogo de una sucursal (ver BranchCatalogIndex)."""
+        with self.lock:
+            return self.index('branch_catalog').page(branch_id, product_ids)
+
+    def search_products(self, query):
+        """Productos que coinciden con el texto 'query', los más relevantes primero."""
+        return [product for product, _ in self.search_scored(query)]
+
+    def search_scored(self, query):
+        """Lo mismo que search_products(), como [(producto, puntaje), ...]."""
+        with self.lock:
+            # (Los dos índices del mismo momento: nadie los cambia en el medio)
+            by_id = self.index('lookup').by_id
+            scores = self.index('search').scores(query)
+            ranked = sorted(scores, key=lambda product_id: (-scores[product_id], product_id))
+            return [(by_id[product_id], scores[product_id]) for product_id in ranked if product_id in by_id]
+
+    def filter_products(self, query=None, with_counts=False, **filters):
+        """
+        Productos que cumplen los filtros combinados (ver
+        ProductFacetIndex.match) y, si hay, el texto 'query' (en ese caso
+        los más relevantes primero). Devuelve (productos, conteos por
+        faceta o None).
+        """
+        with self.lock:
+            index = self.index('facets')
+            ranked = within = None
+            if query:
+                ranked = self.search_products(query)
+                within = index.slots_of(p.product_id for p in ranked)
+            products = index.products_in(index.match(within=within, **filters))
+            counts = index.facet_counts(within=within, **filters) if with_counts else None
+        if ranked is not None:
+            matched = {p.product_id for p in products}
+            products = [p for p in ranked if p.product_id in matched]
+        return products, counts
+
+    def sorted_page(self, field, after=None, limit=25, descending=False):
+        """Una página de TODO el catálogo ordenado por 'field' (ver ProductSortIndex)."""
+        with self.lock:
+            by_id = self.index('lookup').by_id
+            keys = self.index('sorted').page(field, after, limit, descending)
+            return [(by_id[key[1]], key) for key in keys if key[1] in by_id]
+
+    def suggest(self, text, branch_id=None, limit=8):
+        """
+        Autocompletado: (productos, categorías) cuyo título/nombre tiene
+        una palabra que empieza con 'text' (ver ProductSuggestIndex).
+        """
+        with self.lock:
+            by_id = self.index('lookup').by_id
+            index = self.index('suggest')
+            product_ids = index.suggest_products(text, branch_id, limit)
+            category_ids = index.suggest_categories(text, branch_id)
+            categories = self._categories_by_id
+            return ([by_id[product_id] for product_id in product_ids if product_id in by_id],
+                    [categories[category_id] for category_id in category_ids if category_id in categories])
+
+    @property
+    def categories(self):
+        self.refresh()
+        return self._categories
+
+    @property
+    def products(self):
+        self.refresh()
+        return self._products
+
+    # --- Carga de Datos (Privado) ---
+
+    def _load_categories(self):
+        """Carga la colección 'categories' en una lista de objetos Category."""
+        # Convierte la lista de dicts en lista de Objetos
+        return [Category(c['id'], c['name']) for c in self._categories_store.all()]
+
+    def _load_products(self, categories_by_id):
+        """Carga la colección 'products' en una lista de objetos CakeProduct."""
+        products_list = []
+        for item in self._products_store.all():
+            category_id = item.get('category_id')
+
+            # --- Validación de Dependencia ---
+            # Verificamos que la categoría del producto (category_id)
+            # realmente exista entre las categorías cargadas (búsqueda O(1)).
+            if not category_id or category_id not in categories_by_id:
+                print(f"Advertencia: Producto {item['id']} omitido. Categoría {category_id} no válida.")
+                continue # Ignoramos este producto y pasamos al siguiente
+
+            # Preparamos los argumentos para el constructor de Product/CakeProduct
+            common_args = (
+                item['id'],
+                item['title'],
+                item['description'],
+                item['price'],
+                item['stock'],
+                category_id,
+                item.get('branch_id'), # Añadimos la sucursal
+                item.get('image_url')
+            )
+
+            # Creamos el objeto (asumimos que todos son CakeProduct)
+            product = CakeProduct(*common_args, weight=item.get('weight'), version=item.get('version', 0),
+                                  last_checkout=item.get('last_checkout'))
+            products_list.append(product)
+
+        return products_list
+
+    # --- Escritura (siempre con el lock tomado) ---
+    #
+    # Se guarda SOLO el registro que cambió (en SQLite es una fila; en JSON
+    # el backend reescribe el archivo). En memoria reemplazamos la lista
+    # entera (copy-on-write) y actualizamos los índices en el lugar (por
+    # eso las lecturas de índices también toman self.lock).
+
+    def add_product(self, product):
+        with self.lock, self._write_to(products=True):
+            self._products_store.put(product.product_id, product.to_record())
+            self._products = self._products + [product]
+            for index in self._indexes.values():
+                index.add(product)
+
+    @contextmanager
+    def updating(self, product):
+        """
+        Envuelve los cambios a un producto (sus setters) para que los
+        índices se enteren de los valores viejos y de los nuevos:
+
+            with repo.updating(product):
+                product.price = 100
+            repo.save_product(product)
+        """
+        with self.lock:
+            for index in self._indexes.values():
+                index.before_update(product)
+            saved = _slot_values(product)
+            try:
+                yield product
+            except BaseException:
+                # Algo falló a mitad de camino (ej: un precio inválido
+                # después de haber cambiado el título): el producto vuelve
+                # a quedar como estaba, así nadie ve un cambio a medias.
+                _restore_slots(product, saved)
+                raise
+            finally:
+                # Con los valores nuevos (o los viejos, si hubo error)
+                for index in self._indexes.values():
+                    index.after_update(product)
+
+    def save_product(self, product):
+        """Guarda un producto que ya está en la lista (tras modificarlo)."""
+        with self.lock, self._write_to(products=True):
+            product.version += 1
+            try:
+                self._products_store.put(product.product_id, product.to_record())
+            except Exception:
+                # La memoria quedó adelantada respecto del disco (una
+                # versión que nunca se guardó): forzamos una recarga.
+                self.invalidate()
+                raise
+
+    def save_products(self, products):
+        """
+        Guarda varios productos ya modificados en UNA sola escritura
+        (en JSON: una reescritura del archivo; en SQLite: una transacción).
+        """
+        if not products:
+            return
+        with self.lock, self._write_to(products=True):
+            for product in products:
+                product.version += 1
+            try:
+                self._products_store.put_many([p.to_record() for p in products])
+            except Exception:
+                # La memoria quedó adelantada respecto del disco:
+                # forzamos una recarga en la próxima lectura.
+                self.invalidate()
+                raise
+
+    def compare_and_decrement(self, changes):
+        """
+        Descuento de stock "compare-and-set" (todo o nada):
+
+            changes = {product_id: (versión leída, cantidad a descontar)}
+
+        Con el candado de productos tomado (un instante, no durante toda la
+        compra) verifica que NINGÚN producto haya cambiado desde que se
+        leyó (misma versión) y que alcance el stock; si todo está bien,
+        descuenta todo en una sola escritura.
+
+        Devuelve (True, None) o (False, (motivo, product_id)), con motivo
+        'missing', 'conflict' (otro lo cambió: volver a leer y reintentar)
+        o 'insufficient'.
+        """
+        with self.exclusive():
+            by_id = self._indexes['lookup'].by_id
+            products = []
+            for product_id, (expected_version, quantity) in changes.items():
+                product = by_id.get(product_id)
+                if product is None:
+                    return False, ('missing', product_id)
+                if product.version != expected_version:
+                    return False, ('conflict', product_id)
+                if product.stock < quantity:
+                    return False, ('insufficient', product_id)
+                products.append((product, quantity))
+            for product, quantity in products:
+                with self.updating(product):  # (el índice ordenado por stock)
+                    product.stock -= quantity
+            self.save_products([product for product, _ in products])
+            return True, None
+
+    def invalidate(self):
+        """Olvida la huella: la próxima lectura vuelve a cargar del disco."""
+        with self.lock:
+            self._stamps = None
+
+    def remove_product(self, product):
+        with self.lock, self._write_to(products=True):
+            self._products_store.delete(product.product_id)
+            self._products = [p for p in self._products if p is not product]
+            for index in self._indexes.values():
+                index.remove(product)
+
+    def add_category(self, category):
+        with self.lock, self._write_to(categories=True):
+            self._categories_store.put(category.category_id, category.to_dict())
+            self._set_categories(self._categories + [category])
+
+    def save_category(self, category):
+        with self.lock, self._write_to(categories=True):
+            self._categories_store.put(category.category_id, category.to_dict())
+            self._set_categories(self._categories)
+
+    def remove_category(self, category):
+        with self.lock, self._write_to(categories=True):
+            self._categories_store.delete(category.category_id)
+            self._set_categories([c for c in self._categories if c is not category])
+
+    def _set_categories(self, categories):
+        # Las categorías cambian muy poco: rearmamos los índices (algunos
+        # guardan el nombre de la categoría de cada producto).
+        self._categories = categories
+        self._categories_by_id = {c.category_id: c for c in categories}
+        self._indexes = self._build_indexes(self._products, categories)
+
+    @contextmanager
+    def exclusive(self):
+        """
+        Para "leer, cambiar y guardar" un producto sin pisar lo que otro
+        worker escribió: toma el lock del catálogo y el candado de
+        productos (entre procesos) y recarga lo último del disco. Hay que
+        volver a buscar el producto ADENTRO del bloque (la recarga arma
+        objetos nuevos):
+
+            with repo.exclusive():
+                product = repo.get_product(101)
+                with repo.updating(product):
+                    product.price = 100
+                repo.save_product(product)
+        """
+        with self.lock, self.products_lock():
+            self.refresh()
+            yield self
+
+    def products_lock(self):
+        """
+        Candado (entre hilos y procesos) de la colección de productos.
+        Para operaciones de varios pasos que no pueden intercalarse con
+        otras escrituras del catálogo (ver checkout_service.py).
+        """
+        return self._products_store.lock()
+
+    @contextmanager
+    def _write_to(self, categories=False, products=False):
+        """
+        Envuelve una escritura con el candado (entre procesos) de la
+        colección y, al terminar, actualiza su huella para no recargar lo
+        que nosotros mismos acabamos de guardar.
+
+        Si ANTES de escribir la huella ya no era la que conocíamos, otro
+        worker escribió en el medio: no tocamos la huella y la próxima
+        lectura recarga todo (así vemos también su cambio).
+        """
+        store = self._categories_store if categories else self._products_store
+        index = 0 if categories else 1
+        with store.lock():
+            before = store.stamp()
+            yield
+            after = store.stamp()
+        if self._stamps is not None:
+            stamps = list(self._stamps)
+            if stamps[index] == before:
+                stamps[index] = after
+                self._stamps = tuple(stamps)
+        self.version += 1
+
+
+def _slot_values(obj):
+    """Copia de todos los atributos (__slots__) de un objeto: {nombre: valor}."""
+    return {name: getattr(obj, name)
+            for cls in type(obj).__mro__ for name in getattr(cls, '__slots__', ())
+            if hasattr(obj, name)}
+
+
+def _restore_slots(obj, values):
+    """Vuelve a poner los valores guardados con _slot_values() (sin pasar por los setters)."""
+    for name, value in values.items():
+        setattr(obj, name, value)
+
+
+# --- Instancia compartida (una por proceso) ---
+
+_shared_repository = None
+_shared_lock = threading.Lock()
+
+
+def get_catalog_repository():
+    """Devuelve el catálogo compartido del proceso (lo crea la primera vez)."""
+    global _shared_repository
+    backend = get_storage_backend()
+    repository = _shared_repository
+    if repository is None or repository.backend is not backend:
+        with _shared_lock:
+            if _shared_repository is None or _shared_repository.backend is not backend:
+                _shared_repository = CatalogRepository(
+                    backend.collection('categories'), backend.collection('products')
+                )
+                _shared_repository.backend = backend
+            repository = _shared_repository
+    return repository
@@ -0,0 +1,198 @@
+# store/checkout_service.py
+
+# El checkout como UNA unidad de trabajo ("todo o nada").
+#
+# Antes CheckoutView.post reescribía products.json una vez por línea del
+# carrito, después orders.json y después el carrito, sin ninguna garantía:
+# si el proceso moría en el medio quedaba stock descontado sin orden.
+#
+# Ahora el checkout tiene dos partes:
+#
+#   Con el candado de productos tomado (solo lo que toca el stock):
+#     1. Se valida el carrito (precios, productos borrados, stock) con
+#        CartPricer.
+#     2. Se guarda la "intención" en la colección 'checkouts': qué stock
+#        hay que descontar, la orden ya armada y el carrito comprado. Esa
+#        escritura es atómica y es el COMMIT: a partir de ahí el checkout
+#        se completa sí o sí, aunque el proceso se corte.
+#     3. Se descuenta el stock de TODAS las líneas en una sola escritura.
+#        Cada producto guarda, en esa MISMA escritura, el ID del checkout
+#        ('last_checkout'): así la recuperación sabe con certeza si el
+#        stock ya se descontó, sin adivinar por los valores de stock.
+#        Después se marca la intención con 'stock_applied'.
+#
+#   Ya sin el candado (cada paso se puede repetir sin cambiar el resultado):
+#     4. la orden (si todavía no existe una con este checkout_id)
+#     5. el carrito se vacía y se liberan sus reservas de stock
+#     6. se borra la intención.
+#
+# Si el proceso muere en el medio, el próximo checkout (o
+# 'python manage.py recover_checkouts') encuentra la intención pendiente y
+# termina lo que faltaba: nunca queda stock descontado sin su orden.
+#
+# Una intención con el stock ya descontado puede estar terminándose AHORA
+# en otro worker (los pasos 4 a 6 van sin candado): la recuperación solo
+# la toma si pasó más de RECOVER_AFTER_SECONDS desde que se creó.
+
+import uuid
+from datetime import datetime, timedelta
+
+from .cart_pricing import CartPricer
+from .cart_service import CartService
+from .catalog_repository import get_catalog_repository
+from .order_service import OrderService
+from .product_service import ProductService
+from .reservation_service import get_reservation_service
+from .storage import get_storage_backend
+
+
+class CheckoutError(Exception):
+    """El carrito no se puede comprar (vacío, producto borrado o sin stock)."""
+    pass
+
+
+class CheckoutService:
+
+    # Cuánto esperar antes de dar por cortado un checkout que ya descontó
+    # el stock (los pasos que faltan tardan milisegundos).
+    RECOVER_AFTER_SECONDS = 60
+
+    def __init__(self):
+        self._repo = get_catalog_repository()
+        self._intents = get_storage_backend().collection('checkouts')
+        self._carts = CartService()
+        self._orders = OrderService()
+        self._reservations = get_reservation_service()
+        self._pricer = CartPricer(ProductService(self._repo), self._reservations)
+
+    # --- Métodos Públicos (APIs del Servicio) ---
+
+    def checkout(self, user_id, user_data):
+        """
+        Compra el carrito del usuario: descuenta el stock, crea la orden y
+        vacía el carrito. Devuelve la orden creada.
+        Lanza CheckoutError (sin tocar nada) si el carrito no es válido.
+        """
+        # El candado solo dura lo que tarda tocar el stock: la orden, el
+        # carrito y las reservas van después, sin frenar a los demás.
+        with self._repo.exclusive():
+            # Primero terminamos checkouts que hayan quedado cortados.
+            self._recover_pending(self.RECOVER_AFTER_SECONDS)
+
+            # 1. Validación (con el candado: nadie cambia el stock en el medio).
+            #    Lo reservado por OTROS clientes no se puede comprar.
+            cart = self._carts.get_cart(user_id)
+            if not cart.items:
+                raise CheckoutError("Tu carrito está vacío.")
+            pricing = self._pricer.price_cart(cart)
+            if pricing['missing']:
+                raise CheckoutError(f"El producto ID {pricing['missing'][0]} ya no existe.")
+            if pricing['out_of_stock']:
+                problem = pricing['out_of_stock'][0]
+                raise CheckoutError(
+                    f"¡Stock insuficiente para '{problem['title']}'! Disponible: {problem['available']}."
+                )
+
+            # 2. Commit: la intención queda guardada de forma atómica
+            intent = self._build_intent(user_id, cart, pricing, user_data)
+            self._intents.put(intent['id'], intent)
+
+            # 3. Stock
+            self._apply_stock(intent)
+
+        # 4 a 6. Orden, carrito y reservas
+        return self._finish(intent, recovering=False)
+
+    def recover(self, min_age_seconds=RECOVER_AFTER_SECONDS):
+        """
+        Completa los checkouts interrumpidos. Devuelve cuántos había.
+        Los que ya descontaron el stock solo si tienen más de
+        'min_age_seconds' (antes pueden estar terminándose en otro worker).
+        """
+        with self._repo.exclusive():
+            return self._recover_pending(min_age_seconds)
+
+    # --- Funciones internas ---
+
+    def _build_intent(self, user_id, cart, pricing, user_data):
+        checkout_id = uuid.uuid4().hex
+        # Las líneas ya tienen precio: la orden se arma sin buscar nada más
+        order = self._orders.prepare_order(user_id, user_data=user_data, lines=pricing['lines'])
+        order['checkout_id'] = checkout_id
+        return {
+            "id": checkout_id,
+            "user_id": user_id,
+            "created_at": datetime.now().isoformat(),
+            "cart": cart.to_dict(),
+            "stock": [{
+                "product_id": line['product_id'],
+                "quantity": line['quantity']
+            } for line in pricing['lines']],
+            "stock_applied": False,
+            "order": order
+        }
+
+    def _recover_pending(self, min_age_seconds):
+        """(Con el candado de productos tomado.)"""
+        limit = (datetime.now() - timedelta(seconds=min_age_seconds)).isoformat()
+        pending = [intent for intent in self._intents.all()
+                   # Sin 'stock_applied' seguro está cortado: el que lo
+                   # creó tendría el candado que ahora tenemos nosotros.
+                   if not intent.get('stock_applied') or intent['created_at'] <= limit]
+        for intent in pending:
+            print(f"Advertencia: completando checkout interrumpido {intent['id']} (usuario {intent['user_id']})")
+            try:
+                if not intent.get('stock_applied'):
+                    self._apply_stock(intent)
+                self._finish(intent, recovering=True)
+            except Exception as e:
+                print(f"Error al recuperar el checkout {intent['id']}: {e}")
+        return len(pending)
+
+    def _apply_stock(self, intent):
+        """
+        Descuenta el stock de todas las líneas en una sola escritura y
+        después marca la intención (se puede repetir sin problema).
+        """
+        changed = []
+        for line in intent['stock']:
+            product = self._repo.get_product(line['product_id'])
+            if product is None:
+                print(f"Advertencia: producto {line['product_id']} ya no existe, no se descuenta su stock.")
+                continue
+            if product.last_checkout == intent['id']:
+                continue # Ya estaba descontado (corte después de guardar el stock)
+            new_stock = product.stock - line['quantity']
+            if new_stock < 0:
+                # Solo al recuperar: entre el corte y ahora alguien bajó el
+                # stock a mano. La venta ya estaba confirmada: dejamos 0 y
+                # avisamos cuánto falta para esa orden.
+                print(f"Advertencia: faltan {-new_stock} unidades del producto {line['product_id']} "
+                      f"para el checkout {intent['id']}.")
+                new_stock = 0
+            with self._repo.updating(product):
+                product.stock = new_stock
+                product.last_checkout = intent['id']
+            changed.append(product)
+        self._repo.save_products(changed)
+
+        intent['stock_applied'] = True
+        self._intents.put(intent['id'], intent)
+
+    def _finish(self, intent, recovering):
+        """Orden, carrito y reservas de una intención con el stock ya descontado."""
+        # La orden (al recuperar, puede que ya se haya creado)
+        order = self._orders.get_order_by_checkout(intent['id']) if recovering else None
+        if order is None:
+            order = self._orders.save_order(intent['order'])
+
+        # El carrito. Al recuperar, solo si sigue siendo el que se compró
+        # (el cliente pudo haber armado uno nuevo desde el corte).
+        if not recovering or self._carts.get_cart(intent['user_id']).to_dict() == intent['cart']:
+            self._carts.remove_cart(intent['user_id'])
+        # Lo comprado ya salió del stock: sus reservas no hacen falta.
+        self._reservations.release(intent['user_id'], [line['product_id'] for line in intent['stock']])
+
+        # Listo: borramos la intención
+        self._intents.delete(intent['id'])
+        return order
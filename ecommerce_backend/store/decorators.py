@@ -1,8 +1,14 @@
 # store/decorators.py
+from django.conf import settings
 from django.shortcuts import redirect
 from django.http import HttpResponseForbidden, HttpResponse
 from functools import wraps
+import base64
+import hashlib
 import json
+import time
+
+from .idempotency_store import get_idempotency_store
 
 def admin_required(view_func):
     """
@@ -43,4 +49,101 @@ def admin_required(view_func):
             )
             
     # El decorador devuelve la función "envuelta" (el 'wrapper').
-    return wrapper
\ No newline at end of file
+    return wrapper
+
+# --- Claves de idempotencia ---
+#
+# Un doble clic o un reintento del navegador en "Pagar" o "Agregar al
+# carrito" repetía todo: descontar stock, crear la orden, vaciar el
+# carrito (órdenes duplicadas, cantidades al doble).
+#
+# Si el pedido trae una clave (cabecera 'Idempotency-Key' o campo oculto
+# 'idempotency_key'), la primera vez se ejecuta la vista y se guarda su
+# respuesta; las repeticiones con la MISMA clave reciben esa respuesta
+# guardada sin volver a ejecutar nada. Las respuestas se guardan en la
+# colección 'idempotency' del backend (ver idempotency_store.py), que
+# comparten todos los workers; cada una vence sola.
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+IDEMPOTENCY_FIELD = 'idempotency_key'
+# Marca de "la primera ejecución todavía no terminó"
+_IN_PROGRESS = 'in-progress'
+# Cuánto dura esa marca. Es mucho más corta que la respuesta guardada: si
+# el worker muere a mitad del pedido, pasado este tiempo un reintento con
+# la misma clave vuelve a ejecutar la vista (en vez de recibir 409 durante
+# una hora). Unas cuantas veces el timeout de gunicorn (30 s).
+DEFAULT_IDEMPOTENCY_LEASE_SECONDS = 2 * 60
+# Cuánto espera una repetición a que termine la primera ejecución
+IDEMPOTENCY_WAIT_SECONDS = 10
+
+
+def _idempotency_cache_key(request, key):
+    # La clave va por usuario y por URL (dos clientes no se pisan), y con
+    # hash para que cualquier texto sirva como clave de caché.
+    raw = f"{request.session.get('user_id')}|{request.path}|{key}"
+    return 'idempotency:' + hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def _lease_seconds():
+    return getattr(settings, 'STORE_IDEMPOTENCY_LEASE_SECONDS', DEFAULT_IDEMPOTENCY_LEASE_SECONDS)
+
+
+def _freeze(response):
+    """Lo necesario para repetir una respuesta (estado, cuerpo, cabeceras), como JSON."""
+    return {
+        'status': response.status_code,
+        # El cuerpo son bytes: lo guardamos en base64 (texto)
+        'content': base64.b64encode(response.content).decode('ascii'),
+        'headers': {name: response[name] for name in ('Content-Type', 'Location') if response.has_header(name)}
+    }
+
+
+def _thaw(saved):
+    response = HttpResponse(base64.b64decode(saved['content']), status=saved['status'])
+    for name, value in saved['headers'].items():
+        response[name] = value
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(view_func):
+    """
+    Decorador para el post() de una vista: con clave de idempotencia, la
+    vista se ejecuta UNA sola vez por clave. Sin clave, no cambia nada.
+    """
+    @wraps(view_func)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER) or request.POST.get(IDEMPOTENCY_FIELD)
+        if not key:
+            return view_func(self, request, *args, **kwargs)
+
+        store = get_idempotency_store()
+        cache_key = _idempotency_cache_key(request, key)
+        deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+        while True:
+            # add() solo guarda si la clave NO existe: el primero que llega
+            # se queda con la clave y ejecuta la vista.
+            if store.add(cache_key, _IN_PROGRESS, ttl=_lease_seconds()):
+                try:
+                    response = view_func(self, request, *args, **kwargs)
+                except Exception:
+                    store.delete(cache_key) # Falló: un reintento puede volver a probar
+                    raise
+                if getattr(response, 'streaming', False):
+                    store.delete(cache_key) # (Las respuestas en streaming no se guardan)
+                else:
+                    store.set(cache_key, _freeze(response))
+                return response
+
+            saved = store.get(cache_key)
+            if saved is not None and saved != _IN_PROGRESS:
+                return _thaw(saved)
+            if time.monotonic() >= deadline:
+                # La primera ejecución sigue en curso: que el cliente reintente.
+                return HttpResponse(
+                    json.dumps({"error": "Este pedido todavía se está procesando."}),
+                    status=409, content_type='application/json'
+                )
+            time.sleep(0.05)
+
+    return wrapper
@@ -0,0 +1,90 @@
+# store/exports.py
+
+# Exportación de órdenes y productos en CSV o NDJSON (un JSON por línea).
+#
+# Antes, para exportar había que bajar 'orders.json' entero o abrir el
+# panel de órdenes con todo adentro. Acá todo son GENERADORES: cada fila
+# se arma y se manda cuando el cliente la pide (StreamingHttpResponse, ver
+# views.py), así exportar un año entero usa la misma memoria que exportar
+# una sola orden.
+#
+# "Aplanar" (flatten) es opcional:
+#   - sin aplanar: una fila por orden; 'customer_info' e 'items' van como
+#     están (en CSV, como texto JSON dentro de la celda).
+#   - aplanando: una fila POR ITEM (los datos de la orden se repiten) y
+#     los datos del cliente en columnas propias (customer_email, ...).
+
+import csv
+import json
+
+# Columnas de la orden (en el orden en que salen en el CSV)
+ORDER_FIELDS = ['id', 'created_at', 'updated_at', 'status', 'user_id', 'branch_id',
+                'order_type', 'total_amount']
+# Datos del cliente que guarda el checkout (ver CheckoutView.post)
+CUSTOMER_FIELDS = ['username', 'email', 'full_name', 'delivery_type', 'address', 'payment_method']
+ITEM_FIELDS = ['product_id', 'product_title', 'quantity', 'unit_price', 'total_price']
+PRODUCT_FIELDS = ['id', 'title', 'description', 'price', 'stock', 'category_id',
+                  'branch_id', 'type', 'weight', 'image_url']
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+}
+
+
+def order_fields(flatten=False):
+    """Columnas del CSV de órdenes."""
+    if not flatten:
+        return ORDER_FIELDS + ['customer_info', 'items']
+    return (ORDER_FIELDS + [f'customer_{field}' for field in CUSTOMER_FIELDS]
+            + [f'item_{field}' for field in ITEM_FIELDS])
+
+
+def order_records(orders, flatten=False):
+    """Generador: las filas (dicts) de cada orden, ya listas para exportar."""
+    for order in orders:
+        if not flatten:
+            yield {field: order.get(field) for field in ORDER_FIELDS + ['customer_info', 'items']}
+            continue
+        row = {field: order.get(field) for field in ORDER_FIELDS}
+        customer = order.get('customer_info') or {}
+        row.update((f'customer_{field}', customer.get(field)) for field in CUSTOMER_FIELDS)
+        # Una orden sin items igual sale (con las columnas del item vacías)
+        for item in order.get('items') or [{}]:
+            line = dict(row)
+            line.update((f'item_{field}', item.get(field)) for field in ITEM_FIELDS)
+            yield line
+
+
+class _Echo:
+    """'Archivo' que devuelve lo que se le escribe (así csv.writer no guarda nada)."""
+    def write(self, value):
+        return value
+
+
+def _csv_cell(value):
+    # Listas y diccionarios (ej: items sin aplanar) van como texto JSON
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return '' if value is None else value
+
+
+def csv_lines(records, fields):
+    """Generador de líneas CSV (primero el encabezado)."""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(fields)
+    for record in records:
+        yield writer.writerow([_csv_cell(record.get(field)) for field in fields])
+
+
+def ndjson_lines(records):
+    """Generador de líneas NDJSON (un objeto JSON por línea)."""
+    for record in records:
+        yield json.dumps(record, ensure_ascii=False) + '\n'
+
+
+def stream_lines(records, fields, export_format):
+    """Las líneas del formato pedido ('csv' o 'ndjson', ver FORMATS)."""
+    if export_format == 'csv':
+        return csv_lines(records, fields)
+    return ndjson_lines(records)
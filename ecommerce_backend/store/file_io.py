@@ -0,0 +1,122 @@
+# store/file_io.py
+
+# Escritura segura de archivos cuando hay VARIOS procesos (gunicorn con
+# varios workers) trabajando sobre los mismos JSON:
+#
+#   with locked(path):          # candado entre procesos (fcntl) y entre hilos
+#       data = leer(path)
+#       ...modificar...
+#       atomic_write_json(path, data)   # temporal + os.replace
+#
+# - El candado se toma sobre un archivo aparte ('<path>.lock'), porque
+#   os.replace cambia el inodo del archivo de datos.
+# - Es reentrante dentro del mismo hilo: una función con el candado puede
+#   llamar a otra que también lo pida.
+# - En sistemas sin 'fcntl' (Windows) solo protege entre hilos.
+
+import gzip
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+_registry_lock = threading.Lock()
+_path_locks = {}         # path -> threading.RLock
+_held = threading.local()  # path -> (profundidad, archivo .lock abierto)
+
+
+def _thread_lock(path):
+    with _registry_lock:
+        lock = _path_locks.get(path)
+        if lock is None:
+            lock = _path_locks[path] = threading.RLock()
+        return lock
+
+
+@contextmanager
+def locked(path):
+    """Candado exclusivo sobre 'path' (entre hilos y entre procesos)."""
+    path = os.path.abspath(str(path))
+    thread_lock = _thread_lock(path)
+    with thread_lock:
+        held = getattr(_held, 'paths', None)
+        if held is None:
+            held = _held.paths = {}
+        depth, lock_file = held.get(path, (0, None))
+        if depth == 0:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            lock_file = open(path + '.lock', 'a')
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        held[path] = (depth + 1, lock_file)
+        try:
+            yield
+        finally:
+            depth, lock_file = held[path]
+            if depth == 1:
+                del held[path]
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+                lock_file.close()
+            else:
+                held[path] = (depth - 1, lock_file)
+
+
+def file_stamp(path):
+    """
+    Huella barata de un archivo (sin leerlo): inodo, tamaño y mtime.
+    Si cambia, alguien lo escribió (o lo reemplazó con os.replace).
+    """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+def fsync_enabled():
+    """settings.STORE_FSYNC: True = esperar a que cada escritura llegue al disco."""
+    return getattr(settings, 'STORE_FSYNC', True)
+
+
+def atomic_write_json(path, data, indent=4, compress=False):
+    """
+    Escribe 'data' como JSON sin dejar nunca un archivo a medias:
+    escribe en un temporal de la misma carpeta y lo renombra con
+    os.replace (atómico). Quien lea ve el archivo viejo o el nuevo.
+    Con compress=True el archivo se guarda comprimido con gzip.
+    """
+    path = str(path)
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            if compress:
+                with gzip.GzipFile(fileobj=f, mode='wb') as gz:
+                    gz.write(json.dumps(data, ensure_ascii=False).encode('utf-8'))
+            else:
+                f.write(json.dumps(data, indent=indent, ensure_ascii=False).encode('utf-8'))
+            f.flush()
+            if fsync_enabled():
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    if fsync_enabled() and hasattr(os, 'O_DIRECTORY'):
+        # Para que el renombre también sobreviva a un corte de luz.
+        dir_fd = os.open(directory, os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
@@ -0,0 +1,187 @@
+# store/idempotency_store.py
+
+# Dónde se guardan las respuestas de los pedidos con clave de idempotencia
+# (ver decorators.py).
+#
+# Antes iban a una caché en la memoria de cada proceso: con varios workers
+# de gunicorn, un reintento que caía en OTRO worker no encontraba la clave
+# y volvía a ejecutar el checkout. Ahora van a la colección 'idempotency'
+# del backend (JSON: un archivo por clave en data/idempotency/; SQLite:
+# una tabla), que ven todos los workers.
+#
+# Tiene los mismos métodos que usábamos de la caché (add, get, set,
+# delete). Los que escriben toman el candado de la colección (entre
+# procesos), así solo UN worker se queda con cada clave.
+#
+# Límites:
+#   - Cada registro vence a los STORE_IDEMPOTENCY_TTL_SECONDS segundos
+#     (o a los 'ttl' que se pidan en add(): ver la marca de "en curso" en
+#     decorators.py, que dura mucho menos).
+#   - Nunca hay más de STORE_IDEMPOTENCY_MAX_ENTRIES claves: si se llena,
+#     se borran las que vencen antes.
+#
+# Para no recorrer TODOS los archivos buscando vencidos, se lleva un
+# índice por vencimiento dentro de la misma colección, partido en
+# "baldes" de BUCKET_SECONDS segundos:
+#
+#   '_expiry'        -> {"buckets": {"<balde>": cantidad, ...}}  (chico)
+#   '_expiry:<balde>' -> {"keys": {clave: vence, ...}}  (las de ese balde)
+#
+# Un balde cuyo final ya pasó tiene todas sus claves vencidas: se borran
+# de una sin mirar nada más.
+
+import time
+
+from django.conf import settings
+
+from .storage import get_storage_backend
+
+DEFAULT_TTL_SECONDS = 60 * 60
+DEFAULT_MAX_ENTRIES = 10000
+
+EXPIRY_INDEX_KEY = '_expiry'
+
+
+class IdempotencyStore:
+    """Claves de idempotencia compartidas por todos los workers."""
+
+    # Ancho (en segundos) de cada balde del índice por vencimiento
+    BUCKET_SECONDS = 60
+
+    def _ttl(self):
+        return getattr(settings, 'STORE_IDEMPOTENCY_TTL_SECONDS', DEFAULT_TTL_SECONDS)
+
+    def _max_entries(self):
+        return getattr(settings, 'STORE_IDEMPOTENCY_MAX_ENTRIES', DEFAULT_MAX_ENTRIES)
+
+    def _collection(self):
+        # Siempre el backend actual (en los tests cambia)
+        return get_storage_backend().collection('idempotency')
+
+    def _record(self, key, value, ttl=None):
+        ttl = self._ttl() if ttl is None else ttl
+        return {"id": key, "value": value, "expires_at": time.time() + ttl}
+
+    # --- Métodos Públicos (los mismos que la caché de Django) ---
+
+    def get(self, key):
+        """El valor guardado para 'key' (None si no hay o ya venció)."""
+        record = self._collection().get(key)
+        if record is None or record['expires_at'] <= time.time():
+            return None
+        return record['value']
+
+    def add(self, key, value, ttl=None):
+        """
+        Guarda 'value' SOLO si 'key' no existe (o venció). Devuelve si lo guardó.
+        'ttl': segundos hasta que vence (por defecto, el de settings).
+        """
+        collection = self._collection()
+        with collection.lock():
+            index = self._read_index(collection)
+            now = time.time()
+            self._prune_expired(collection, index, now)
+            old = collection.get(key)
+            if old is not None and old['expires_at'] > now:
+                return False
+            if old is not None:
+                self._unindex(collection, index, old)
+            while index and self._count(index) >= self._max_entries():
+                self._evict_oldest(collection, index)
+            self._save(collection, index, self._record(key, value, ttl), old=None)
+            self._write_index(collection, index)
+            return True
+
+    def set(self, key, value):
+        collection = self._collection()
+        with collection.lock():
+            index = self._read_index(collection)
+            self._save(collection, index, self._record(key, value), old=collection.get(key))
+            self._write_index(collection, index)
+
+    def delete(self, key):
+        collection = self._collection()
+        with collection.lock():
+            old = collection.get(key)
+            if old is None:
+                return
+            index = self._read_index(collection)
+            collection.delete(key)
+            self._unindex(collection, index, old)
+            self._write_index(collection, index)
+
+    def __len__(self):
+        """Cuántas claves hay guardadas (vencidas o no)."""
+        return self._count(self._read_index(self._collection()))
+
+    # --- Índice por vencimiento (con el candado de la colección tomado) ---
+
+    def _bucket(self, expires_at):
+        return str(int(expires_at // self.BUCKET_SECONDS))
+
+    def _read_index(self, collection):
+        record = collection.get(EXPIRY_INDEX_KEY)
+        return record['buckets'] if record else {}
+
+    def _write_index(self, collection, index):
+        collection.put(EXPIRY_INDEX_KEY, {"id": EXPIRY_INDEX_KEY, "buckets": index})
+
+    def _count(self, index):
+        return sum(index.values())
+
+    def _bucket_keys(self, collection, bucket):
+        record = collection.get(f'{EXPIRY_INDEX_KEY}:{bucket}')
+        return record['keys'] if record else {}
+
+    def _write_bucket(self, collection, index, bucket, keys):
+        bucket_key = f'{EXPIRY_INDEX_KEY}:{bucket}'
+        if keys:
+            collection.put(bucket_key, {"id": bucket_key, "keys": keys})
+            index[bucket] = len(keys)
+        else:
+            collection.delete(bucket_key)
+            index.pop(bucket, None)
+
+    def _save(self, collection, index, record, old):
+        """Guarda 'record' y lo anota en su balde (sacándolo del anterior)."""
+        if old is not None:
+            self._unindex(collection, index, old)
+        collection.put(record['id'], record)
+        bucket = self._bucket(record['expires_at'])
+        keys = self._bucket_keys(collection, bucket)
+        keys[record['id']] = record['expires_at']
+        self._write_bucket(collection, index, bucket, keys)
+
+    def _unindex(self, collection, index, record):
+        bucket = self._bucket(record['expires_at'])
+        keys = self._bucket_keys(collection, bucket)
+        if keys.pop(record['id'], None) is not None:
+            self._write_bucket(collection, index, bucket, keys)
+
+    def _prune_expired(self, collection, index, now):
+        """Borra los baldes que ya terminaron (todas sus claves vencieron)."""
+        for bucket in sorted(index, key=int):
+            if (int(bucket) + 1) * self.BUCKET_SECONDS > now:
+                break
+            for key in self._bucket_keys(collection, bucket):
+                collection.delete(key)
+            self._write_bucket(collection, index, bucket, {})
+
+    def _evict_oldest(self, collection, index):
+        """Borra la clave que vence primero (para no pasarse del máximo)."""
+        bucket = min(index, key=int)
+        keys = self._bucket_keys(collection, bucket)
+        if keys:
+            oldest = min(keys, key=keys.get)
+            del keys[oldest]
+            collection.delete(oldest)
+        self._write_bucket(collection, index, bucket, keys)
+
+
+# --- Instancia compartida (una por proceso) ---
+
+_shared_store = IdempotencyStore()
+
+
+def get_idempotency_store():
+    return _shared_store
@@ -0,0 +1,28 @@
+# store/management/commands/archive_orders.py
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from store.order_service import OrderService
+
+
+class Command(BaseCommand):
+    """
+    Uso: python manage.py archive_orders
+
+    Muda las órdenes terminadas (completed/cancelled) de hace más de
+    STORE_ORDER_HOT_DAYS días a los segmentos comprimidos de
+    store/data/orders_archive/ (ver store/order_archive.py). Pensado para
+    correr seguido desde un cron: si no hay nada para mudar, no escribe.
+    """
+    help = "Archiva las órdenes viejas y terminadas en segmentos por período."
+
+    def handle(self, *args, **options):
+        service = OrderService()
+        moved = service.archive_orders()
+        if moved is None:
+            self.stdout.write("El backend actual no usa archivo de órdenes: nada para hacer.")
+            return
+        hot_days = getattr(settings, 'STORE_ORDER_HOT_DAYS', 90)
+        self.stdout.write(self.style.SUCCESS(
+            f"{moved} órdenes archivadas (terminadas hace más de {hot_days} días)."
+        ))
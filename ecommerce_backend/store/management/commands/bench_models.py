@@ -0,0 +1,109 @@
+# store/management/commands/bench_models.py
+import gc
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from store.models import CakeProduct
+
+
+class LegacyCakeProduct:
+    """
+    Copia del molde ANTERIOR (objeto con __dict__ y to_dict() armado de
+    cero en cada llamada). Solo existe para comparar en este benchmark.
+    """
+
+    def __init__(self, product_id, title, description, price, stock, category_id, branch_id, image_url=None, weight=None):
+        self._product_id = product_id
+        self._title = title
+        self._description = description
+        self._price = price
+        self._stock = stock
+        self._category_id = category_id
+        self._branch_id = branch_id
+        self._image_url = image_url
+        self._weight = weight
+        self.type = 'cake'
+
+    def to_dict(self):
+        data = {
+            "id": self._product_id,
+            "title": self._title,
+            "description": self._description,
+            "price": self._price,
+            "stock": self._stock,
+            "category_id": self._category_id,
+            "branch_id": self._branch_id,
+            "image_url": self._image_url,
+        }
+        data.update({"type": self.type, "weight": self._weight})
+        return data
+
+
+class Command(BaseCommand):
+    """
+    Uso: python manage.py bench_models [--products 100000] [--rounds 5]
+
+    Compara el molde de producto actual (__slots__ + to_dict() con caché)
+    contra el anterior (con __dict__): memoria de N productos y tiempo de
+    serializar el catálogo entero, como hace un listado.
+    """
+    help = "Benchmark de memoria y serialización de los modelos del catálogo."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100_000)
+        parser.add_argument('--rounds', type=int, default=5)
+
+    def handle(self, *args, **options):
+        count = options['products']
+        rounds = options['rounds']
+        self.stdout.write(f"{count} productos, {rounds} serializaciones del catálogo completo\n")
+
+        results = {}
+        for label, model in (('antes (__dict__)', LegacyCakeProduct), ('ahora (__slots__)', CakeProduct)):
+            products, memory = self._build(model, count)
+            first, warm = self._serialize(products, rounds)
+            results[label] = (memory, first, warm)
+            del products
+            gc.collect()
+            self.stdout.write(
+                f"{label:<20} memoria: {memory / 1024 / 1024:7.1f} MB   "
+                f"1ra serialización: {first * 1000:7.1f} ms   "
+                f"siguientes (promedio): {warm * 1000:7.1f} ms"
+            )
+
+        (old_mem, old_first, old_warm), (new_mem, new_first, new_warm) = results.values()
+        self.stdout.write(self.style.SUCCESS(
+            f"\nMemoria de los objetos: {100 * (1 - new_mem / old_mem):.0f}% menos. "
+            f"Serialización repetida: {old_warm / new_warm:.1f}x más rápida."
+        ))
+        self.stdout.write(
+            "(La caché de to_dict() ocupa memoria aparte, un diccionario por "
+            "producto, solo después de la primera serialización.)"
+        )
+
+    def _measure(self, build):
+        gc.collect()
+        tracemalloc.start()
+        try:
+            result = build()
+            size, _ = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        return result, size
+
+    def _build(self, model, count):
+        return self._measure(lambda: [
+            model(i, f"Torta {i}", "Bizcochuelo con dulce de leche", 1500.0 + i % 100,
+                  i % 50, 1 + i % 5, 1 + i % 3, None, weight=1.5)
+            for i in range(count)
+        ])
+
+    def _serialize(self, products, rounds):
+        timings = []
+        for _ in range(max(rounds, 2)):
+            start = time.perf_counter()
+            [p.to_dict() for p in products]
+            timings.append(time.perf_counter() - start)
+        return timings[0], sum(timings[1:]) / len(timings[1:])
@@ -0,0 +1,143 @@
+# store/management/commands/bench_stock_contention.py
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from store.product_service import ProductService
+from store.storage import DEFAULT_DATA_DIR, JsonStorageBackend, reset_storage_backend
+
+
+class Command(BaseCommand):
+    """
+    Uso: python manage.py bench_stock_contention [--backend json|sqlite]
+             [--stock 300] [--levels 1,2,4,8,16] [--product 102]
+
+    Muchos compradores (hilos, y después procesos) intentan comprar de a
+    una unidad el MISMO producto hasta que se agota. Verifica que nunca se
+    venda de más (ventas == stock inicial, stock final == 0) y mide las
+    compras por segundo para cada nivel de concurrencia.
+
+    Trabaja sobre una COPIA de store/data en una carpeta temporal.
+    """
+    help = "Benchmark de contención de stock (hilos y procesos) con descuento optimista."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backend', choices=['json', 'sqlite'], default='json')
+        parser.add_argument('--stock', type=int, default=300)
+        parser.add_argument('--levels', default='1,2,4,8,16')
+        parser.add_argument('--product', type=int, default=102)
+
+    def handle(self, *args, **options):
+        levels = [int(level) for level in options['levels'].split(',')]
+        self.product_id = options['product']
+        self.stock = options['stock']
+
+        work_dir = tempfile.mkdtemp(prefix='bench_stock_')
+        data_dir = os.path.join(work_dir, 'data')
+        shutil.copytree(getattr(settings, 'STORE_DATA_DIR', DEFAULT_DATA_DIR), data_dir,
+                        ignore=shutil.ignore_patterns('*.lock', '*.tmp', 'store.sqlite3*'))
+        overrides = {
+            'STORE_STORAGE_BACKEND': options['backend'],
+            'STORE_DATA_DIR': data_dir,
+            'STORE_SQLITE_PATH': os.path.join(data_dir, 'store.sqlite3'),
+        }
+        originals = {name: getattr(settings, name, None) for name in overrides}
+        try:
+            for name, value in overrides.items():
+                setattr(settings, name, value)
+            reset_storage_backend()
+            if options['backend'] == 'sqlite':
+                from store.storage import get_storage_backend
+                get_storage_backend().import_from(JsonStorageBackend(data_dir))
+
+            self.stdout.write(
+                f"Backend {options['backend']}, producto {self.product_id}, "
+                f"stock inicial {self.stock} (se compra de a 1 unidad)\n"
+            )
+            self.stdout.write(f"{'modo':<10}{'compradores':>12}{'ventas':>8}{'de más':>8}"
+                              f"{'conflictos':>12}{'compras/s':>12}")
+            oversold_total = 0
+            for mode in ('hilos', 'procesos'):
+                if mode == 'procesos' and not hasattr(os, 'fork'):
+                    self.stdout.write("(Sin os.fork en este sistema: se omite el modo procesos)")
+                    continue
+                for workers in levels:
+                    sold, conflicts, elapsed = self._run(mode, workers)
+                    final_stock = ProductService().get_product_by_id(self.product_id)['stock']
+                    oversold = sold - self.stock
+                    if oversold or final_stock != 0:
+                        oversold_total += max(oversold, 1)
+                    self.stdout.write(f"{mode:<10}{workers:>12}{sold:>8}{oversold:>8}"
+                                      f"{conflicts:>12}{sold / elapsed:>12.0f}")
+            if oversold_total:
+                self.stdout.write(self.style.ERROR("\n¡Se vendió de más!"))
+            else:
+                self.stdout.write(self.style.SUCCESS("\nCero ventas de más en todas las corridas."))
+        finally:
+            for name, value in originals.items():
+                setattr(settings, name, value)
+            reset_storage_backend()
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    # --- Una corrida ---
+
+    def _reset_stock(self):
+        service = ProductService()
+        service.update_product(self.product_id, {'stock': self.stock})
+
+    def _buy_until_sold_out(self):
+        """Compra de a 1 hasta que no queda stock. Devuelve (ventas, conflictos)."""
+        service = ProductService()
+        sold = conflicts = 0
+        while True:
+            result = service.decrement_stock({self.product_id: 1})
+            conflicts += result['attempts'] - 1
+            if result['success']:
+                sold += 1
+            elif result['reason'] == 'insufficient':
+                return sold, conflicts
+
+    def _run(self, mode, workers):
+        self._reset_stock()
+        start = time.perf_counter()
+        if mode == 'hilos':
+            results = []
+            threads = [threading.Thread(target=lambda: results.append(self._buy_until_sold_out()))
+                       for _ in range(workers)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        else:
+            results = self._run_processes(workers)
+        elapsed = time.perf_counter() - start
+        return sum(r[0] for r in results), sum(r[1] for r in results), elapsed
+
+    def _run_processes(self, workers):
+        read_end, write_end = os.pipe()
+        pids = []
+        for _ in range(workers):
+            pid = os.fork()
+            if pid == 0:
+                # Proceso hijo: su propio backend (y conexiones) desde cero
+                try:
+                    os.close(read_end)
+                    reset_storage_backend()
+                    sold, conflicts = self._buy_until_sold_out()
+                    os.write(write_end, f"{sold} {conflicts}\n".encode())
+                finally:
+                    os._exit(0)
+            pids.append(pid)
+        os.close(write_end)
+        for pid in pids:
+            os.waitpid(pid, 0)
+        with os.fdopen(read_end) as f:
+            results = [tuple(map(int, line.split())) for line in f if line.strip()]
+        # El proceso padre tiene que ver lo que escribieron los hijos
+        reset_storage_backend()
+        return results
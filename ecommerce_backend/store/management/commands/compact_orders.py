@@ -0,0 +1,23 @@
+# store/management/commands/compact_orders.py
+from django.core.management.base import BaseCommand
+
+from store.order_service import OrderService
+
+
+class Command(BaseCommand):
+    """
+    Uso: python manage.py compact_orders
+
+    Pliega 'orders.journal' dentro de un snapshot nuevo de 'orders.json'.
+    (OrderService ya lo hace solo cada STORE_ORDER_JOURNAL_COMPACT_EVERY
+    líneas; este comando sirve para forzarlo, por ejemplo desde un cron).
+    """
+    help = "Compacta el journal de órdenes en un snapshot nuevo."
+
+    def handle(self, *args, **options):
+        service = OrderService()
+        if service.compact():
+            total = len(service.get_all_orders())
+            self.stdout.write(self.style.SUCCESS(f"Journal compactado ({total} órdenes en el snapshot)."))
+        else:
+            self.stdout.write("El modo de guardado actual no usa journal: nada para compactar.")
@@ -0,0 +1,24 @@
+# store/management/commands/import_json_to_sqlite.py
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from store.storage import create_storage_backend
+
+
+class Command(BaseCommand):
+    """
+    Uso: python manage.py import_json_to_sqlite
+
+    Copia (de una sola vez) todos los datos de los JSON de STORE_DATA_DIR
+    a la base SQLite de STORE_SQLITE_PATH. Lo que hubiera en SQLite se
+    reemplaza. Después, poner STORE_STORAGE_BACKEND = 'sqlite'.
+    """
+    help = "Importa los archivos JSON de store/data a la base SQLite."
+
+    def handle(self, *args, **options):
+        source = create_storage_backend('json')
+        target = create_storage_backend('sqlite')
+        counts = target.import_from(source)
+        for name, total in counts.items():
+            self.stdout.write(f"  {name}: {total}")
+        self.stdout.write(self.style.SUCCESS(f"Importación completa en {settings.STORE_SQLITE_PATH}"))
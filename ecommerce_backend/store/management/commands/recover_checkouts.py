@@ -0,0 +1,31 @@
+# store/management/commands/recover_checkouts.py
+from django.core.management.base import BaseCommand
+
+from store.checkout_service import CheckoutService
+
+
+class Command(BaseCommand):
+    """
+    Uso: python manage.py recover_checkouts
+
+    Completa los checkouts que quedaron a mitad de camino (por ejemplo si
+    un worker murió después de descontar el stock y antes de crear la
+    orden). El próximo checkout también lo hace solo; este comando sirve
+    para no esperar (por ejemplo al arrancar el servidor o desde un cron).
+
+    Los checkouts que ya descontaron el stock se completan recién cuando
+    tienen más de --min-age segundos (antes pueden estar terminándose en
+    un worker). Al arrancar, sin workers andando: --min-age 0.
+    """
+    help = "Completa los checkouts interrumpidos (stock, orden y carrito)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-age', type=int, default=CheckoutService.RECOVER_AFTER_SECONDS,
+                            help="Segundos de antigüedad (si el stock ya se descontó).")
+
+    def handle(self, *args, **options):
+        pending = CheckoutService().recover(options['min_age'])
+        if pending:
+            self.stdout.write(self.style.SUCCESS(f"{pending} checkout(s) interrumpido(s) completado(s)."))
+        else:
+            self.stdout.write("No había checkouts pendientes.")
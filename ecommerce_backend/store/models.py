@@ -1,12 +1,73 @@
 from abc import ABC, abstractmethod # (ABC = Abstract Base Class)
 
+
+# --- MEMORIA Y SERIALIZACIÓN ---
+#
+# Todos los moldes usan "__slots__": en vez de un diccionario interno por
+# objeto (__dict__), Python reserva lugar fijo solo para los atributos
+# listados. Con 100.000 productos en memoria la diferencia es grande
+# (ver: python manage.py bench_models).
+#
+# Además, los moldes que se listan enteros (sucursales, categorías,
+# productos, usuarios) guardan el resultado de to_dict() la primera vez
+# y lo reutilizan. Cada setter borra esa copia guardada ("invalida la
+# caché"), así nunca devolvemos datos viejos.
+#
+# to_dict() devuelve SIEMPRE el mismo diccionario guardado (sin copiarlo)
+# y de SOLO LECTURA: quien quiera agregarle claves (ej: 'category_name')
+# se hace su propia copia con dict(obj.to_dict()).
+
+class ReadOnlyDict(dict):
+    """
+    Un dict que no se puede modificar (da TypeError). Sigue siendo un
+    dict: json.dumps, JsonResponse y las plantillas lo usan igual.
+    """
+    __slots__ = ()
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("Este diccionario es de solo lectura (para modificarlo, copiarlo con dict(...)).")
+
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __reduce__(self):
+        # copy/pickle arman el dict vacío y lo llenan con __setitem__
+        return (ReadOnlyDict, (dict(self),))
+
+
+class CachedDictMixin(ABC):
+    """
+    to_dict() con caché. La clase hija arma el diccionario en _build_dict()
+    y cada setter llama a self._invalidate().
+    """
+    __slots__ = ('_dict_cache',)
+
+    def to_dict(self):
+        cache = self._dict_cache
+        if cache is None:
+            cache = self._dict_cache = ReadOnlyDict(self._build_dict())
+        # Sin copiar: es de solo lectura, así nadie ensucia la caché.
+        return cache
+
+    def _invalidate(self):
+        self._dict_cache = None
+
+    @abstractmethod
+    def _build_dict(self):
+        pass
+
+
 # --- NUEVA CLASE BRANCH ---
-class Branch:
+class Branch(CachedDictMixin):
     """
     Representa el "molde" (modelo) para una Sucursal física.
     Define qué datos debe tener cada sucursal.
     """
+    __slots__ = ('_branch_id', '_name', '_address', '_latitude', '_longitude',
+                 '_is_open', '_opening_hours', '_phone')
+
     def __init__(self, branch_id, name, address, latitude, longitude, is_open , opening_hours, phone):
+        self._dict_cache = None
         # Usamos guion bajo (_) para marcar estos datos como "internos" o "protegidos".
         self._branch_id = branch_id
         self._name = name
@@ -37,7 +98,7 @@ class Branch:
     @property
     def phone(self): return self._phone
 
-    def to_dict(self):
+    def _build_dict(self):
         """
         Convierte el Objeto (Branch) en un diccionario simple.
         Esto es vital para poder convertirlo a JSON fácilmente.
@@ -58,8 +119,11 @@ class Branch:
         return self._name
 
 # --- CLASE CATEGORY (Molde para Categorías) ---
-class Category:
+class Category(CachedDictMixin):
+    __slots__ = ('_category_id', '_name')
+
     def __init__(self, category_id, name):
+        self._dict_cache = None
         self._category_id = category_id
         self._name = name
 
@@ -70,8 +134,12 @@ class Category:
     @property
     def name(self):
         return self._name
+    @name.setter
+    def name(self, value):
+        self._name = value
+        self._invalidate()
 
-    def to_dict(self):
+    def _build_dict(self):
         return {"id": self._category_id, "name": self._name}
 
     def __str__(self):
@@ -82,10 +150,14 @@ class Category:
 # "ABC" (Abstract Base Class) significa que esta clase "Product"
 # es un molde GENERAL. No se puede crear un "Producto" genérico,
 # solo se pueden crear sus hijos (ej: CakeProduct).
-class Product(ABC):
+class Product(CachedDictMixin, ABC):
+    __slots__ = ('_product_id', '_title', '_description', '_price', '_stock',
+                 '_category_id', '_branch_id', '_image_url', '_version', '_last_checkout')
     
     # El constructor (init) ahora incluye 'branch_id'
-    def __init__(self, product_id, title, description, price, stock, category_id, branch_id, image_url=None):
+    def __init__(self, product_id, title, description, price, stock, category_id, branch_id, image_url=None, version=0,
+                 last_checkout=None):
+        self._dict_cache = None
         self._product_id = product_id
         self._title = title
         self._description = description
@@ -94,6 +166,14 @@ class Product(ABC):
         self._category_id = category_id
         self._branch_id = branch_id # <-- NUEVO: ID de la sucursal a la que pertenece
         self._image_url = image_url
+        # Número de versión: sube con cada cambio guardado. Sirve para
+        # detectar si alguien modificó el producto desde que lo leímos
+        # (concurrencia optimista, ver CatalogRepository.compare_and_decrement).
+        self._version = version
+        # ID del último checkout que descontó este stock (se guarda en la
+        # MISMA escritura que el stock; ver checkout_service.py). No se
+        # muestra: no está en to_dict(), solo en to_record().
+        self._last_checkout = last_checkout
 
     # --- Properties (Getters/Setters) ---
 
@@ -105,27 +185,52 @@ class Product(ABC):
     @property
     def title(self): return self._title
     @title.setter
-    def title(self, value): self._title = value 
+    def title(self, value):
+        self._title = value
+        self._invalidate()
     
     @property
     def description(self): return self._description
     @description.setter
-    def description(self, value): self._description = value
+    def description(self, value):
+        self._description = value
+        self._invalidate()
     
     @property
     def category_id(self): return self._category_id
+    @category_id.setter # (Quien lo cambie debe validar que la categoría exista)
+    def category_id(self, value):
+        self._category_id = value
+        self._invalidate()
     
     # --- NUEVO PROPERTY ---
     @property
     def branch_id(self): return self._branch_id
     @branch_id.setter # (Permite cambiarlo después: product.branch_id = 5)
-    def branch_id(self, value): self._branch_id = value
+    def branch_id(self, value):
+        self._branch_id = value
+        self._invalidate()
     # --- FIN NUEVO PROPERTY ---
 
+    @property
+    def version(self): return self._version
+    @version.setter # (Solo lo sube el repositorio al guardar)
+    def version(self, value):
+        self._version = value
+        self._invalidate()
+
+    @property
+    def last_checkout(self): return self._last_checkout
+    @last_checkout.setter # (Solo lo cambia el checkout, junto con el stock)
+    def last_checkout(self, value):
+        self._last_checkout = value
+
     @property
     def image_url(self): return self._image_url
     @image_url.setter
-    def image_url(self, value): self._image_url = value
+    def image_url(self, value):
+        self._image_url = value
+        self._invalidate()
 
     # Properties con validación (Setters)
     # Estos 'setters' protegen nuestros datos.
@@ -137,6 +242,7 @@ class Product(ABC):
         if not isinstance(value, (int, float)) or value < 0:
             raise ValueError("El precio debe ser un número no negativo.")
         self._price = value
+        self._invalidate()
 
     @property
     def stock(self): return self._stock
@@ -146,6 +252,7 @@ class Product(ABC):
         if not isinstance(value, int) or value < 0:
             raise ValueError("El stock debe ser un número entero no negativo.")
         self._stock = value
+        self._invalidate()
 
     @abstractmethod
     def get_invoice_description(self):
@@ -153,7 +260,7 @@ class Product(ABC):
         # a implementar esta función.
         pass
 
-    def to_dict(self):
+    def _build_dict(self):
         # El diccionario base que tendrán todos los productos.
         # Añadido 'branch_id'
         return {
@@ -165,35 +272,51 @@ class Product(ABC):
             "category_id": self._category_id,
             "branch_id": self._branch_id, # <-- NUEVO
             "image_url": self._image_url,
+            "version": self._version,
         }
 
+    def to_record(self):
+        """
+        Lo que se GUARDA del producto: to_dict() más los datos internos
+        que no se muestran (ej: 'last_checkout').
+        """
+        record = dict(self.to_dict())
+        if self._last_checkout is not None:
+            record['last_checkout'] = self._last_checkout
+        return record
+
 # --- CLASE CAKEPRODUCT (Actualizada) ---
 
 # CakeProduct "hereda" todo de Product (es un "hijo").
 class CakeProduct(Product):
     """Representa un producto físico concreto (una torta) con un peso."""
+    __slots__ = ('_weight',)
+    type = 'cake' # Para identificarlo en el JSON (igual para todas las tortas)
     
     # Recibe 'branch_id' y se lo pasa al "padre" (super)
-    def __init__(self, product_id, title, description, price, stock, category_id, branch_id, image_url=None, weight=None):
+    def __init__(self, product_id, title, description, price, stock, category_id, branch_id, image_url=None, weight=None, version=0,
+                 last_checkout=None):
         # 1. Llama al constructor del "padre" (Product)
-        super().__init__(product_id, title, description, price, stock, category_id, branch_id, image_url)
+        super().__init__(product_id, title, description, price, stock, category_id, branch_id, image_url, version,
+                         last_checkout)
         # 2. Añade las propiedades específicas de "CakeProduct"
         self._weight = weight
-        self.type = 'cake' # Para identificarlo en el JSON
 
     @property
     def weight(self): return self._weight
     @weight.setter
-    def weight(self, value): self._weight = value
+    def weight(self, value):
+        self._weight = value
+        self._invalidate()
 
     def get_invoice_description(self):
         # Implementación obligatoria del método abstracto
         weight_info = f" (Peso: {self._weight}kg)" if self._weight else ""
         return f"Torta: {self._title}{weight_info}"
 
-    def to_dict(self):
-        # 1. Obtiene el diccionario del "padre" (Product.to_dict())
-        data = super().to_dict()
+    def _build_dict(self):
+        # 1. Obtiene el diccionario del "padre" (Product._build_dict())
+        data = super()._build_dict()
         # 2. Le añade los datos específicos de "CakeProduct"
         data.update({"type": self.type, "weight": self._weight})
         return data
@@ -203,12 +326,20 @@ class CakeProduct(Product):
 
 class CartItem:
     """Molde simple para un item DENTRO del carrito (solo ID y cantidad)"""
+    __slots__ = ('product_id', 'quantity')
+
     def __init__(self, product_id, quantity=1):
         self.product_id = product_id
         self.quantity = quantity
 
 class Cart:
-    """Molde para el Carrito de compras."""
+    """
+    Molde para el Carrito de compras.
+    (Sin caché de to_dict: los items se modifican directamente,
+    ej: item.quantity += 1, y el carrito se serializa solo al guardarlo.)
+    """
+    __slots__ = ('user_id', 'items')
+
     def __init__(self, user_id=None):
         self.user_id = user_id
         # El carrito es un diccionario de CartItems
@@ -239,16 +370,11 @@ class Cart:
             del self.items[product_id]
     
     def get_total(self):
-        # Calcula el total del carrito (usando el ProductService)
+        # Calcula el total del carrito (usando el CartPricer, que busca
+        # todos los productos de una sola vez en el catálogo compartido)
         # (Esto es una "dependencia" entre servicios)
-        from .product_service import ProductService
-        total = 0
-        service = ProductService()
-        for item in self.items.values():
-            product = service.get_product_by_id(item.product_id)
-            if product:
-                total += product['price'] * item.quantity
-        return total
+        from .cart_pricing import CartPricer
+        return CartPricer().price_cart(self)['total']
 
     @classmethod
     def from_dict(cls, data):
@@ -264,9 +390,12 @@ class Cart:
 
 # --- Clases de Usuario (Base, Cliente, Admin) ---
 
-class BaseUser(ABC):
+class BaseUser(CachedDictMixin, ABC):
     """Molde abstracto (base) para todos los tipos de usuario."""
+    __slots__ = ('_user_id', '_username', '_password', '_email', '_address')
+
     def __init__(self, user_id, username, password, email=None, address=None):
+        self._dict_cache = None
         self._user_id = user_id
         self._username = username
         self._password = password # (En un proyecto real, esto estaría hasheado)
@@ -291,7 +420,7 @@ class BaseUser(ABC):
         # Obliga a las clases hijas (Client, Admin) a definir un rol.
         pass
     
-    def to_dict(self):
+    def _build_dict(self):
         # Diccionario base para todos los usuarios.
         return {
             "id": self._user_id,
@@ -304,6 +433,7 @@ class BaseUser(ABC):
 
 class ClientUser(BaseUser):
     """Molde para un usuario Cliente."""
+    __slots__ = ()
     
     def __init__(self, user_id, username, password, email=None, address=None):
         # Llama al constructor del padre (BaseUser) con todos los datos
@@ -316,6 +446,7 @@ class ClientUser(BaseUser):
 
 class AdminUser(BaseUser):
     """Molde para un usuario Administrador."""
+    __slots__ = ()
     
     def __init__(self, user_id, username, password, email=None, address=None):
         # Llama al constructor del padre (BaseUser) con todos los datos
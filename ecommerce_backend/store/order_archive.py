@@ -0,0 +1,310 @@
+# store/order_archive.py
+
+# Archivo histórico de órdenes, partido por período ("segmentos").
+#
+# El store de órdenes (orders.json + journal) crecía para siempre y cada
+# proceso tenía TODO el historial en memoria. Ahora las órdenes viejas y
+# terminadas (completed/cancelled de hace más de STORE_ORDER_HOT_DAYS
+# días) se mudan al archivo con 'python manage.py archive_orders':
+#
+#   data/orders_archive/
+#       manifest.json       qué segmentos hay y qué tiene cada uno
+#       2024-03.json.gz     las órdenes de marzo 2024 (comprimidas)
+#       2024-04.json.gz
+#       ...
+#       moving.json         solo mientras se muda algo (ver más abajo)
+#
+# Niveles:
+#   - "caliente": el store de siempre, con las órdenes recientes o en curso.
+#   - "frío": los segmentos comprimidos de acá, que casi no cambian.
+#
+# El manifest guarda, por segmento, el rango de IDs y de fechas, los
+# usuarios y sucursales que aparecen y la cantidad por estado. Con eso
+# cada búsqueda abre SOLO los segmentos que pueden tener lo que busca
+# (el historial de un cliente abre los meses en los que compró; el
+# contador por estado no abre ninguno). Un segmento abierto se guarda en
+# memoria con su propio OrderIndex (ver order_index.py), y solo los
+# últimos usados (SEGMENT_CACHE_SIZE).
+#
+# Una mudanza escribe primero el archivo y después saca las órdenes del
+# store caliente. Si el proceso muere en el medio, las órdenes quedarían
+# en los dos lados (y los contadores y totales las sumarían dos veces).
+# Por eso, mientras dura, 'moving.json' guarda los IDs que se están
+# mudando: OrderService ve ese archivo antes de leer y termina la mudanza
+# cortada (ver OrderService._hot_index).
+
+import gzip
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from .file_io import locked, atomic_write_json, file_stamp
+from .order_index import OrderIndex
+from .sales_rollups import SalesRollups
+
+# Cuántos segmentos abiertos guardamos en memoria (los últimos usados)
+SEGMENT_CACHE_SIZE = 8
+# Ventanas posibles para partir el archivo
+WINDOWS = ('month', 'quarter', 'year')
+
+
+def segment_name(created_at, window='month'):
+    """Segmento de una orden según su fecha ISO: '2024-03', '2024-Q1' o '2024'."""
+    created_at = created_at or '0000-00-00'
+    year, month = created_at[:4], int(created_at[5:7] or 0)
+    if window == 'year':
+        return year
+    if window == 'quarter':
+        return f"{year}-Q{max(month - 1, 0) // 3 + 1}"
+    return f"{year}-{month:02d}"
+
+
+class OrderArchive:
+    """Segmentos comprimidos de órdenes viejas + su manifest."""
+
+    def __init__(self, directory, window='month'):
+        if window not in WINDOWS:
+            raise ValueError(f"Ventana de archivo no válida: {window} (usar {', '.join(WINDOWS)})")
+        self.directory = str(directory)
+        self.window = window
+        self._manifest_file = os.path.join(self.directory, 'manifest.json')
+        self._moving_file = os.path.join(self.directory, 'moving.json')
+        self._lock = threading.RLock()
+        self._manifest = {"segments": {}}
+        self._manifest_stamp = None
+        self._segments = OrderedDict()  # nombre -> (huella del archivo, OrderIndex)
+        self._rollups = None
+        self._rollups_stamp = None  # Huella del manifest cuando sumamos los totales
+
+    # --- Manifest y segmentos ---
+
+    def _segments_info(self):
+        """{nombre: resumen} del manifest, al día con el disco."""
+        with self._lock:
+            stamp = file_stamp(self._manifest_file)
+            if stamp != self._manifest_stamp:
+                try:
+                    with open(self._manifest_file, 'r', encoding='utf-8') as f:
+                        self._manifest = json.load(f)
+                except FileNotFoundError:
+                    self._manifest = {"segments": {}}
+                except json.JSONDecodeError as e:
+                    print(f"Error leyendo {self._manifest_file}: {e}")
+                    self._manifest = {"segments": {}}
+                self._manifest_stamp = stamp
+            return self._manifest['segments']
+
+    def _segment_path(self, info):
+        return os.path.join(self.directory, info['file'])
+
+    def _read_segment(self, info):
+        try:
+            with gzip.open(self._segment_path(info), 'rt', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            print(f"Advertencia: falta el segmento {info['file']} del archivo de órdenes.")
+            return []
+
+    def _open(self, name):
+        """El OrderIndex de un segmento (de la memoria si no cambió en disco)."""
+        with self._lock:
+            info = self._segments_info().get(name)
+            if info is None:
+                return OrderIndex(rollups=False)
+            stamp = file_stamp(self._segment_path(info))
+            cached = self._segments.get(name)
+            if cached is not None and cached[0] == stamp:
+                self._segments.move_to_end(name)
+                return cached[1]
+            # (Los totales de ventas del segmento ya están en su .rollup.json)
+            index = OrderIndex(self._read_segment(info), rollups=False)
+            self._segments[name] = (stamp, index)
+            self._segments.move_to_end(name)
+            while len(self._segments) > SEGMENT_CACHE_SIZE:
+                self._segments.popitem(last=False)
+            return index
+
+    def _names(self, matches=None):
+        """Nombres de segmentos (del más viejo al más nuevo) que cumplen 'matches(resumen)'."""
+        segments = self._segments_info()
+        return [name for name in sorted(segments) if matches is None or matches(segments[name])]
+
+    @staticmethod
+    def _summary(file_name, orders):
+        """Resumen de un segmento para el manifest (se calcula al escribirlo)."""
+        status_counts = {}
+        for order in orders:
+            status = order.get('status', 'pending')
+            status_counts[status] = status_counts.get(status, 0) + 1
+        dates = [order.get('created_at') or '' for order in orders]
+        return {
+            "file": file_name,
+            "count": len(orders),
+            "first_id": orders[0]['id'],
+            "last_id": orders[-1]['id'],
+            "min_created": min(dates),
+            "max_created": max(dates),
+            "users": sorted({order.get('user_id') for order in orders}, key=str),
+            "branches": sorted({order.get('branch_id') for order in orders}, key=str),
+            "status_counts": status_counts
+        }
+
+    def _write_segment(self, name, orders):
+        """Reescribe un segmento y su resumen. Hay que tener el candado tomado."""
+        orders = sorted(orders, key=lambda order: order['id'])
+        file_name = f"{name}.json.gz"
+        segments = dict(self._segments_info())
+        if orders:
+            atomic_write_json(os.path.join(self.directory, file_name), orders, compress=True)
+            segments[name] = self._summary(file_name, orders)
+            # Totales de ventas del segmento (ver sales_rollups.py)
+            segments[name]['rollup_file'] = f"{name}.rollup.json"
+            atomic_write_json(os.path.join(self.directory, segments[name]['rollup_file']),
+                              SalesRollups(orders).to_rows(), indent=None)
+        else:
+            segments.pop(name, None)
+        atomic_write_json(self._manifest_file, {"window": self.window, "segments": segments})
+
+    # --- Mudanzas en curso ---
+
+    def begin_move(self, order_ids):
+        """Anota los IDs que se van a mudar (antes de escribir nada)."""
+        atomic_write_json(self._moving_file, {"ids": sorted(order_ids)}, indent=None)
+
+    def end_move(self):
+        """La mudanza terminó (las órdenes ya no están en el store caliente)."""
+        try:
+            os.remove(self._moving_file)
+        except FileNotFoundError:
+            pass
+
+    def interrupted_move(self):
+        """
+        IDs de una mudanza que no terminó (o que está en curso en otro
+        proceso), o None si no hay ninguna. Sin mudanzas cuesta un stat().
+        """
+        if not os.path.exists(self._moving_file):
+            return None
+        try:
+            with open(self._moving_file, 'r', encoding='utf-8') as f:
+                return set(json.load(f)['ids'])
+        except FileNotFoundError:
+            return None  # Terminó justo ahora
+        except (ValueError, KeyError) as e:
+            print(f"Error leyendo {self._moving_file}: {e}")
+            return None
+
+    # --- Escritura ---
+
+    def add(self, orders):
+        """
+        Agrega órdenes al archivo (cada una a su segmento). Si una ya
+        estaba (se repitió una mudanza cortada), se reemplaza: repetir
+        add() con las mismas órdenes no duplica nada.
+        """
+        groups = {}
+        for order in orders:
+            groups.setdefault(segment_name(order.get('created_at'), self.window), []).append(order)
+        with self._lock, locked(self._manifest_file):
+            for name, new_orders in groups.items():
+                info = self._segments_info().get(name)
+                merged = {order['id']: order for order in (self._read_segment(info) if info else [])}
+                merged.update((order['id'], order) for order in new_orders)
+                self._write_segment(name, list(merged.values()))
+        return sum(len(group) for group in groups.values())
+
+    def update_order(self, order_id, changes):
+        """Cambia una orden archivada (ej: el admin la cancela). Reescribe su segmento."""
+        with self._lock, locked(self._manifest_file):
+            for name in self._names(lambda info: info['first_id'] <= order_id <= info['last_id']):
+                orders = self._read_segment(self._segments_info()[name])
+                for order in orders:
+                    if order['id'] == order_id:
+                        order.update(changes)
+                        self._write_segment(name, orders)
+                        return order
+        return None
+
+    # --- Consultas ---
+
+    def get_order(self, order_id):
+        for name in self._names(lambda info: info['first_id'] <= order_id <= info['last_id']):
+            order = self._open(name).get(order_id)
+            if order is not None:
+                return order
+        return None
+
+    def for_user(self, user_id):
+        return [order for name in self._names(lambda info: user_id in info['users'])
+                for order in self._open(name).for_user(user_id)]
+
+    def for_branch(self, branch_id):
+        return [order for name in self._names(lambda info: branch_id in info['branches'])
+                for order in self._open(name).for_branch(branch_id)]
+
+    def created_between(self, start=None, end=None):
+        def overlaps(info):
+            # (mismo criterio que OrderIndex.created_between para 'end')
+            return ((start is None or info['max_created'] >= start)
+                    and (end is None or info['min_created'] <= end + '\uffff'))
+        return [order for name in self._names(overlaps)
+                for order in self._open(name).created_between(start, end)]
+
+    def iter_newest_first(self):
+        """Órdenes de la más nueva a la más vieja, abriendo segmentos a medida que hacen falta."""
+        for name in reversed(self._names()):
+            yield from self._open(name).newest_first()
+
+    def newest_matching(self, before=None, start=None, end=None,
+                        status=None, branch_id=None, user_id=None):
+        """
+        Como OrderIndex.newest_matching, segmento por segmento (del más
+        nuevo al más viejo). Con el manifest se saltean, sin abrirlos, los
+        segmentos que no pueden tener ninguna orden que sirva.
+        """
+        def may_match(info):
+            return ((before is None or info['min_created'] <= before[0])
+                    and (start is None or info['max_created'] >= start)
+                    and (end is None or info['min_created'] <= end + '\uffff')
+                    and (status is None or info['status_counts'].get(status))
+                    and (branch_id is None or branch_id in info['branches'])
+                    and (user_id is None or user_id in info['users']))
+        for name in reversed(self._names(may_match)):
+            yield from self._open(name).newest_matching(before, start, end, status, branch_id, user_id)
+
+    def all(self):
+        return [order for name in self._names() for order in self._open(name).all()]
+
+    def rollups(self):
+        """
+        Totales de ventas de TODO el archivo (SalesRollups): la suma de los
+        .rollup.json de cada segmento. Se vuelve a sumar solo si cambió el
+        manifest (o sea, si se archivó o cambió algo).
+        """
+        with self._lock:
+            segments = self._segments_info()
+            if self._rollups is None or self._rollups_stamp != self._manifest_stamp:
+                rollups = SalesRollups()
+                for name in sorted(segments):
+                    info = segments[name]
+                    try:
+                        with open(os.path.join(self.directory, info['rollup_file']), 'r', encoding='utf-8') as f:
+                            rollups.add_rows(json.load(f))
+                    except (KeyError, FileNotFoundError):
+                        # Segmento sin totales guardados: se calculan desde sus órdenes
+                        rollups.add_rows(SalesRollups(self._read_segment(info)).to_rows())
+                self._rollups = rollups
+                self._rollups_stamp = self._manifest_stamp
+            return self._rollups
+
+    def count(self):
+        return sum(info['count'] for info in self._segments_info().values())
+
+    def status_counts(self):
+        """Cantidad por estado de TODO el archivo, solo con el manifest."""
+        counts = {}
+        for info in self._segments_info().values():
+            for status, count in info['status_counts'].items():
+                counts[status] = counts.get(status, 0) + count
+        return counts
@@ -0,0 +1,170 @@
+# store/order_index.py
+
+# Índice en memoria de las órdenes. Lo mantiene cada "store" de órdenes
+# (ver order_store.py y storage.py) para que el historial, el detalle y el
+# panel de admin NO tengan que recorrer ni ordenar todas las órdenes en
+# cada petición:
+#
+#   by_id         id -> orden
+#   by_user       user_id -> [ids]   (en orden de creación)
+#   by_branch     branch_id -> [ids]
+#   status_counts estado -> cantidad de órdenes
+#   by_created    [(created_at, id), ...] ordenada, para rangos de fechas
+#   by_status     estado -> [(created_at, id), ...] ordenada (filtro del admin)
+#   rollups       totales de ventas por día/sucursal/producto/estado
+#                 (ver sales_rollups.py; se puede apagar con rollups=False)
+
+from bisect import bisect_left, bisect_right, insort
+
+from .sales_rollups import SalesRollups
+
+
+class OrderIndex:
+    """Índices secundarios de las órdenes (se actualizan en cada alta/cambio)."""
+
+    def __init__(self, orders=(), rollups=True):
+        orders = list(orders)
+        self.by_id = {}
+        self.by_user = {}
+        self.by_branch = {}
+        self.status_counts = {}
+        self.by_created = []
+        self.by_status = {}
+        for order in orders:
+            self._add_keys(order)
+        # Al cargar de una vez es más barato ordenar al final.
+        self.by_created.sort()
+        for entries in self.by_status.values():
+            entries.sort()
+        # Los totales de ventas se arman de una sola pasada
+        self.rollups = SalesRollups(orders) if rollups else None
+
+    # --- Mantenimiento ---
+
+    def add(self, order):
+        """Agrega una orden nueva (los IDs son crecientes)."""
+        self._add_keys(order, sorted_insert=True)
+        if self.rollups is not None:
+            self.rollups.add(order)
+
+    def update(self, order, changes):
+        """
+        Aplica 'changes' a una orden que ya está en el índice (el mismo
+        diccionario, modificado en el lugar) y corrige sus claves.
+        """
+        self._remove_keys(order)
+        if self.rollups is not None:
+            self.rollups.remove(order)
+        order.update(changes)
+        self._add_keys(order, sorted_insert=True)
+        if self.rollups is not None:
+            self.rollups.add(order)
+
+    def _add_keys(self, order, sorted_insert=False):
+        order_id = order['id']
+        self.by_id[order_id] = order
+        for buckets, key in ((self.by_user, order.get('user_id')), (self.by_branch, order.get('branch_id'))):
+            ids = buckets.setdefault(key, [])
+            if ids and ids[-1] > order_id:
+                insort(ids, order_id)
+            else:
+                ids.append(order_id)
+        status = order.get('status', 'pending')
+        self.status_counts[status] = self.status_counts.get(status, 0) + 1
+        entry = (order.get('created_at') or '', order_id)
+        for entries in (self.by_created, self.by_status.setdefault(status, [])):
+            if sorted_insert:
+                insort(entries, entry)
+            else:
+                entries.append(entry)
+
+    def _remove_keys(self, order):
+        # (by_id no se toca: así la orden conserva su lugar en all())
+        order_id = order['id']
+        for buckets, key in ((self.by_user, order.get('user_id')), (self.by_branch, order.get('branch_id'))):
+            ids = buckets.get(key)
+            if ids:
+                position = bisect_left(ids, order_id)
+                if position < len(ids) and ids[position] == order_id:
+                    del ids[position]
+                if not ids:
+                    del buckets[key]
+        status = order.get('status', 'pending')
+        if self.status_counts.get(status):
+            self.status_counts[status] -= 1
+            if not self.status_counts[status]:
+                del self.status_counts[status]
+        entry = (order.get('created_at') or '', order_id)
+        for entries in (self.by_created, self.by_status.get(status, [])):
+            position = bisect_left(entries, entry)
+            if position < len(entries) and entries[position] == entry:
+                del entries[position]
+        if status in self.by_status and not self.by_status[status]:
+            del self.by_status[status]
+
+    # --- Consultas ---
+
+    def get(self, order_id):
+        return self.by_id.get(order_id)
+
+    def all(self):
+        """Todas las órdenes, en orden de creación."""
+        return list(self.by_id.values())
+
+    def for_user(self, user_id):
+        return [self.by_id[i] for i in self.by_user.get(user_id, [])]
+
+    def for_branch(self, branch_id):
+        return [self.by_id[i] for i in self.by_branch.get(branch_id, [])]
+
+    def newest_first(self, limit=None):
+        """Órdenes de la más reciente a la más vieja (sin ordenar nada)."""
+        entries = self.by_created[::-1] if limit is None else self.by_created[:-limit - 1:-1]
+        return [self.by_id[order_id] for _, order_id in entries]
+
+    def created_between(self, start=None, end=None):
+        """
+        Órdenes con start <= created_at <= end (fechas ISO, como las guarda
+        OrderService). Búsqueda binaria: cuesta lo que mide el resultado.
+        """
+        low = 0 if start is None else bisect_left(self.by_created, (start,))
+        # Con '\uffff' al final, end='2025-01-31' incluye todo ese día.
+        high = len(self.by_created) if end is None else bisect_right(self.by_created, (end + '\uffff',))
+        return [self.by_id[order_id] for _, order_id in self.by_created[low:high]]
+
+    def newest_matching(self, before=None, start=None, end=None,
+                        status=None, branch_id=None, user_id=None):
+        """
+        Recorre (generador) las órdenes de la más nueva a la más vieja que
+        cumplen los filtros. 'before' es una clave (created_at, id): solo
+        órdenes ANTERIORES a ella (paginación "keyset", ver
+        OrderService.get_orders_page). Quien pide una página corta el
+        recorrido cuando junta las que necesita: el costo depende del
+        tamaño de la página, no de cuántas órdenes hay.
+        """
+        if user_id is not None:
+            # Las órdenes de un cliente son pocas: las ordenamos por fecha.
+            entries = sorted((self.by_id[i].get('created_at') or '', i)
+                             for i in self.by_user.get(user_id, []))
+        elif status is not None:
+            entries = self.by_status.get(status, [])
+        else:
+            entries = self.by_created
+        low = 0 if start is None else bisect_left(entries, (start,))
+        high = len(entries) if end is None else bisect_right(entries, (end + '\uffff',))
+        if before is not None:
+            high = min(high, bisect_left(entries, tuple(before)))
+        # De a tramos (copiar un tramo de la lista es atómico): si otro
+        # hilo agrega una orden mientras recorremos, no se rompe nada.
+        while high > low:
+            chunk = entries[max(low, high - 64):high]
+            high -= len(chunk) or high
+            for _, order_id in reversed(chunk):
+                order = self.by_id.get(order_id)
+                if order is None:
+                    continue
+                if status is not None and order.get('status', 'pending') != status:
+                    continue
+                if branch_id is not None and order.get('branch_id') != branch_id:
+                    continue
+                yield order
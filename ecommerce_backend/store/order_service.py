@@ -1,186 +1,361 @@
-import json
-import os
-from datetime import datetime
+import heapq
+from datetime import datetime, timedelta
+from itertools import islice
 from typing import List, Dict, Optional
 
-# Ruta absoluta para asegurar que use la misma carpeta data
-# Nota: Usamos dirname(dirname(...)) para "subir un nivel"
-# desde /services/ a /store/ y luego entrar a /data/.
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-ORDERS_FILE = os.path.join(BASE_DIR, 'store', 'data', 'orders.json')
+from django.conf import settings
+
+# El backend de almacenamiento (JSON o SQLite) nos da el store de órdenes
+from .storage import get_storage_backend
+# Los datos de los productos salen del catálogo compartido del proceso
+from .product_service import ProductService
 
 
 class OrderService:
+    # Estados posibles de una orden (en el orden en que avanzan)
+    VALID_STATUSES = ['pending', 'confirmed', 'preparing', 'ready', 'completed', 'cancelled']
+    # Estados "terminados": solo estas órdenes se mudan al archivo
+    FINAL_STATUSES = ('completed', 'cancelled')
+
     def __init__(self):
-        # Al iniciar el servicio, asegura que 'orders.json' exista.
-        print(f"DEBUG OrderService - Inicializando, archivo: {ORDERS_FILE}")
-        self._ensure_data_file_exists()
-    
-    def _ensure_data_file_exists(self):
-        """Función interna: Crea el JSON si no existe."""
-        print(f"DEBUG OrderService - Asegurando que existe {ORDERS_FILE}")
-        os.makedirs(os.path.dirname(ORDERS_FILE), exist_ok=True)
-        if not os.path.exists(ORDERS_FILE):
-            print("DEBUG OrderService - Creando archivo orders.json nuevo")
-            # El archivo de órdenes necesita una estructura inicial:
-            # una lista vacía de 'orders' y un contador 'next_order_id'.
-            initial_data = {
-                "orders": [],
-                "next_order_id": 1001 # Empezamos las órdenes desde el ID 1001
-            }
-            with open(ORDERS_FILE, 'w', encoding='utf-8') as f:
-                json.dump(initial_data, f, indent=4, ensure_ascii=False)
-        else:
-            print("DEBUG OrderService - Archivo orders.json ya existe")
-    
-    # --- Funciones de Lectura/Escritura (Privadas) ---
-    
-    def _read_data(self):
-        """Función interna: Lee el archivo JSON completo."""
-        try:
-            with open(ORDERS_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                print(f"DEBUG OrderService - Datos leídos: {len(data.get('orders', []))} órdenes")
-                return data
-            
-        except (json.JSONDecodeError, FileNotFoundError) as e:
-            print(f"DEBUG OrderService - Error leyendo archivo: {e}")
-            # Si falla, devuelve la estructura por defecto.
-            return {"orders": [], "next_order_id": 1001}
-    
-    def _write_data(self, data):
-        """Función interna: Escribe el archivo JSON completo."""
-        try:
-            with open(ORDERS_FILE, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=4, ensure_ascii=False)
-            print(f"DEBUG OrderService - Datos escritos exitosamente")
-        except Exception as e:
-            print(f"DEBUG OrderService - Error escribiendo datos: {e}")
-            raise
+        # El store de órdenes es compartido por todo el proceso:
+        # crear un OrderService() no vuelve a leer 'orders.json'.
+        # (En JSON: settings.STORE_ORDER_STORAGE elige 'journal' o 'document')
+        backend = get_storage_backend()
+        self._store = backend.orders()
+        # Órdenes viejas en segmentos por mes (None en SQLite: ver order_archive.py)
+        self._archive = backend.order_archive()
+
+    def compact(self):
+        """Pliega el journal en un snapshot nuevo (solo en modo journal)."""
+        if hasattr(self._store, 'compact'):
+            self._store.compact()
+            return True
+        return False
+
+    def archive_orders(self, now: Optional[datetime] = None) -> int:
+        """
+        Muda al archivo las órdenes terminadas (completed/cancelled) de hace
+        más de STORE_ORDER_HOT_DAYS días. Devuelve cuántas se mudaron
+        (None si el backend no usa archivo, como SQLite).
+        """
+        if self._archive is None or not hasattr(self._store, 'archive_orders'):
+            return None
+        hot_days = getattr(settings, 'STORE_ORDER_HOT_DAYS', 90)
+        cutoff = ((now or datetime.now()) - timedelta(days=hot_days)).isoformat()
+        return self._store.archive_orders(
+            self._archive,
+            lambda order: order.get('status') in self.FINAL_STATUSES and (order.get('created_at') or '') < cutoff
+        )
     
+    def _hot_index(self):
+        """
+        El OrderIndex de las órdenes calientes. Si una mudanza al archivo
+        quedó cortada (ver order_archive.py), primero la termina: así una
+        orden nunca se cuenta en los dos lados.
+        """
+        if self._archive is not None:
+            pending = self._archive.interrupted_move()
+            if pending:
+                print(f"Advertencia: terminando una mudanza de {len(pending)} órdenes al archivo.")
+                # (Si otro proceso la está haciendo ahora, esperamos su candado
+                # y no queda nada para mudar.) La copia caliente es la más
+                # nueva: reemplaza a la archivada.
+                self._store.archive_orders(self._archive, lambda order: order['id'] in pending)
+        return self._store.index()
+
     # --- Métodos Públicos (APIs del Servicio) ---
     
-    def create_order(self, user_id: int, cart_data: Dict, user_data: Dict = None) -> Dict:
+    def create_order(self, user_id: int, cart_data: Dict = None, user_data: Dict = None,
+                     lines: List[Dict] = None) -> Dict:
         """
         Toma los datos de un carrito y los convierte en una Orden permanente.
+        Si ya tenemos las líneas con precio (CartPricer, como en el
+        checkout) se pasan en 'lines' y no se vuelve a buscar nada.
         """
-        print(f"DEBUG OrderService - Creando orden para user_id: {user_id}")
-        print(f"DEBUG OrderService - Cart data: {cart_data}")
-
-        # 1. Leemos la base de datos actual de órdenes.
-        data = self._read_data()
+        new_order = self.prepare_order(user_id, cart_data, user_data, lines)
+        # Guardamos la orden (en modo journal: UNA línea agregada al archivo)
+        return self.save_order(new_order)
 
-        # 2. "Enriquecemos" los items del carrito.
+    def prepare_order(self, user_id: int, cart_data: Dict = None, user_data: Dict = None,
+                      lines: List[Dict] = None) -> Dict:
+        """
+        Arma la orden (sin guardarla) a partir del carrito o de líneas ya
+        calculadas: [{"product_id", "product", "quantity", "unit_price",
+        "subtotal"}, ...] (el formato de CartPricer.price_cart()).
+        """
+        # 1. "Enriquecemos" los items del carrito.
         # El carrito solo guarda (product_id, quantity).
         # La orden debe guardar (product_title, unit_price, total_price).
-        enriched_items = []
-        total_amount = 0
-        print(f"DEBUG OrderService - Procesando {len(cart_data.get('items', {}))} items del carrito")
-
-        for item_id, item in cart_data.get('items', {}).items():
-            # ¡Importante! Usamos OTRO servicio (ProductService)
-            # para obtener los detalles (precio, título) del producto.
-            from .product_service import ProductService
-            product_service = ProductService()
-            product = product_service.get_product_by_id(item['product_id'])
-            
-            if product:
-                # Calculamos el total de esta línea
-                item_total = product['price'] * item['quantity']
-                # Creamos el diccionario "enriquecido"
-                enriched_item = {
-                    "product_id": item['product_id'],
-                    "product_title": product['title'],
-                    "quantity": item['quantity'],
-                    "unit_price": product['price'],
-                    "total_price": item_total
-                }
-                enriched_items.append(enriched_item)
-                # Sumamos al total general de la orden
-                total_amount += item_total
-                print(f"DEBUG OrderService - Producto {product['title']} x {item['quantity']} = {item_total}")
-            else:
-                print(f"DEBUG OrderService - Producto ID {item['product_id']} no encontrado")
-        
-         # 3. Creamos el objeto de la nueva orden
-        new_order = {
-            "id": data['next_order_id'], # Usamos el contador
+        if lines is None:
+            lines = self._price_lines(cart_data or {})
+        enriched_items = [{
+            "product_id": line['product_id'],
+            "product_title": line['product']['title'],
+            "quantity": line['quantity'],
+            "unit_price": line['unit_price'],
+            "total_price": line['subtotal']
+        } for line in lines]
+        total_amount = sum(item['total_price'] for item in enriched_items)
+
+        # 2. Creamos el objeto de la nueva orden
+        return self.build_order(
+            user_id, enriched_items, total_amount,
+            self._get_branch_from_lines(lines), # Asignamos la sucursal
+            user_data
+        )
+
+    def build_order(self, user_id: int, items: List[Dict], total_amount: float,
+                    branch_id: int, user_data: Dict = None) -> Dict:
+        """Arma el diccionario de una orden nueva (todavía sin ID ni guardar)."""
+        now = datetime.now().isoformat() # Fecha/Hora actual
+        return {
+            "id": None, # Lo asigna el store con su contador 'next_order_id'
             "user_id": user_id,
             "customer_info": user_data, # Datos del cliente (ej: dirección, email)
-            "items": enriched_items,    # La lista de items enriquecidos
+            "items": items,             # La lista de items enriquecidos
             "total_amount": total_amount,
             "status": "completed", # Estado inicial (simplificado)
-            "branch_id": self._get_branch_from_cart(cart_data), # Asignamos la sucursal
+            "branch_id": branch_id,
             "order_type": "pickup",
-            "created_at": datetime.now().isoformat(), # Fecha/Hora actual
-            "updated_at": datetime.now().isoformat()
+            "created_at": now,
+            "updated_at": now
         }
-        
-        print(f"DEBUG OrderService - Nueva orden: ID {new_order['id']}, Total: {total_amount}")
-        
-        # 4. Guardamos la orden en la base de datos
-        data['orders'].append(new_order)
-        data['next_order_id'] += 1 # Incrementamos el contador para la próxima orden
-        
-        self._write_data(data)
-        print(f"DEBUG OrderService - Orden guardada exitosamente")
-        
-        return new_order
+
+    def save_order(self, order: Dict) -> Dict:
+        """Guarda una orden armada con build_order() (el store le asigna el ID)."""
+        return self._store.insert_order(order)
         
 
     
-    def _get_branch_from_cart(self, cart_data: Dict) -> int:
+    def _price_lines(self, cart_data: Dict) -> List[Dict]:
+        """
+        Función interna: busca TODOS los productos del carrito en el
+        catálogo compartido de una sola vez y arma las líneas con precio.
+        """
+        items = list(cart_data.get('items', {}).values())
+        products = ProductService().get_products_by_ids(item['product_id'] for item in items)
+        lines = []
+        for item in items:
+            product = products.get(item['product_id'])
+            if not product:
+                print(f"Advertencia: producto ID {item['product_id']} no encontrado, no se incluye en la orden.")
+                continue
+            lines.append({
+                "product_id": item['product_id'],
+                "product": product,
+                "quantity": item['quantity'],
+                "unit_price": product['price'],
+                "subtotal": product['price'] * item['quantity']
+            })
+        return lines
+
+    def _get_branch_from_lines(self, lines: List[Dict]) -> int:
         """Función interna: Determina a qué sucursal pertenece la orden."""
         # Lógica simplificada: asumimos que todos los productos del carrito
-        # pertenecen a la misma sucursal.
-        from .product_service import ProductService
-        product_service = ProductService()
-        
-        # Buscamos el primer producto del carrito
-        for item_id, item in cart_data.get('items', {}).items():
-            product = product_service.get_product_by_id(item['product_id'])
-            if product:
-                # Devolvemos la sucursal de ese producto.
-                return product.get('branch_id', 1)
+        # pertenecen a la misma sucursal (la del primer producto).
+        if lines:
+            return lines[0]['product'].get('branch_id') or 1
         return 1 # Si el carrito está vacío, devolvemos '1' (default)
     
     # --- Métodos de Búsqueda ---
+    # (Todos usan el índice en memoria del store: ver order_index.py.
+    #  Las órdenes archivadas se buscan SOLO en los segmentos que el
+    #  manifest indica que pueden tenerlas: ver order_archive.py)
+
+    @staticmethod
+    def _merge_by_id(archived: List[Dict], hot: List[Dict]) -> List[Dict]:
+        """Junta órdenes archivadas y calientes, por ID (la caliente gana si está en los dos)."""
+        if not archived:
+            return hot
+        merged = {order['id']: order for order in archived}
+        merged.update((order['id'], order) for order in hot)
+        return [merged[order_id] for order_id in sorted(merged)]
+
+    @staticmethod
+    def _unique(orders):
+        # (Una mudanza cortada puede dejar una orden en los dos lados)
+        seen = set()
+        for order in orders:
+            if order['id'] not in seen:
+                seen.add(order['id'])
+                yield order
     
     def get_orders_by_user(self, user_id: int) -> List[Dict]:
         """Obtiene el historial de órdenes de un usuario."""
-        data = self._read_data()
-        # Filtra la lista de órdenes buscando el user_id
-        return [order for order in data['orders'] if order['user_id'] == user_id]
+        # Índice user_id -> órdenes (sin recorrer todo el historial)
+        hot = self._hot_index().for_user(user_id)
+        if self._archive is None:
+            return hot
+        return self._merge_by_id(self._archive.for_user(user_id), hot)
+    
+    def get_orders_by_branch(self, branch_id: int) -> List[Dict]:
+        """Obtiene las órdenes de una sucursal."""
+        hot = self._hot_index().for_branch(branch_id)
+        if self._archive is None:
+            return hot
+        return self._merge_by_id(self._archive.for_branch(branch_id), hot)
     
     def get_all_orders(self) -> List[Dict]:
-        """Obtiene TODAS las órdenes (para el admin)."""
-        data = self._read_data()
-        return data['orders']
+        """Obtiene TODAS las órdenes (para el admin). Abre todo el archivo."""
+        hot = self._hot_index().all()
+        if self._archive is None:
+            return hot
+        return self._merge_by_id(self._archive.all(), hot)
+    
+    def get_recent_orders(self, limit: Optional[int] = None) -> List[Dict]:
+        """
+        Órdenes de la más reciente a la más vieja (ya vienen ordenadas).
+        Con 'limit', solo se abren los segmentos archivados necesarios.
+        """
+        hot = self._hot_index().newest_first(limit)
+        if self._archive is None:
+            return hot
+        newest_first = heapq.merge(
+            hot, self._archive.iter_newest_first(),
+            key=lambda order: (order.get('created_at') or '', order['id']), reverse=True
+        )
+        return list(islice(self._unique(newest_first), limit))
+    
+    def get_orders_page(self, after: Optional[str] = None, limit: int = 25,
+                        status: Optional[str] = None, branch_id: Optional[int] = None,
+                        user_id: Optional[int] = None, start: Optional[str] = None,
+                        end: Optional[str] = None) -> Dict:
+        """
+        Una página de órdenes (de la más nueva a la más vieja) con filtros
+        por estado, sucursal, cliente y fechas ISO.
+
+        Paginación "keyset": 'after' es el cursor que devolvió la página
+        anterior ("<created_at>|<id>" de su última orden). No se cuentan ni
+        se saltean órdenes: se sigue desde ahí. Devuelve:
+            {"orders": [...], "next_cursor": "..." o None si no hay más}
+        """
+        matching = self._newest_matching(before=self._parse_cursor(after), start=start, end=end,
+                                         status=status, branch_id=branch_id, user_id=user_id)
+        # Pedimos UNA de más para saber si hay página siguiente
+        orders = list(islice(matching, limit + 1))
+        next_cursor = None
+        if len(orders) > limit:
+            orders = orders[:limit]
+            last = orders[-1]
+            next_cursor = f"{last.get('created_at') or ''}|{last['id']}"
+        return {"orders": orders, "next_cursor": next_cursor}
+
+    def iter_orders(self, status: Optional[str] = None, branch_id: Optional[int] = None,
+                    user_id: Optional[int] = None, start: Optional[str] = None,
+                    end: Optional[str] = None):
+        """
+        Recorre (generador) TODAS las órdenes que cumplen los filtros, de la
+        más nueva a la más vieja, sin armar ninguna lista: la usan las
+        exportaciones (ver exports.py), que pueden ser de años enteros.
+        """
+        return self._newest_matching(start=start, end=end, status=status,
+                                     branch_id=branch_id, user_id=user_id)
+
+    def _newest_matching(self, **filters):
+        """Órdenes calientes y archivadas que cumplen 'filters', de la más nueva a la más vieja."""
+        matching = self._hot_index().newest_matching(**filters)
+        if self._archive is not None:
+            matching = self._unique(heapq.merge(
+                matching, self._archive.newest_matching(**filters),
+                key=lambda order: (order.get('created_at') or '', order['id']), reverse=True
+            ))
+        return matching
+
+    @staticmethod
+    def _parse_cursor(cursor: Optional[str]):
+        """'<created_at>|<id>' -> (created_at, id). Un cursor inválido es la primera página."""
+        if not cursor:
+            return None
+        created_at, _, order_id = cursor.rpartition('|')
+        try:
+            return (created_at, int(order_id))
+        except ValueError:
+            return None
     
+    def get_orders_between(self, start: Optional[str] = None, end: Optional[str] = None) -> List[Dict]:
+        """Órdenes creadas entre dos fechas ISO (ej: '2025-01-01', '2025-01-31')."""
+        hot = self._hot_index().created_between(start, end)
+        if self._archive is None:
+            return hot
+        by_date = heapq.merge(
+            self._archive.created_between(start, end), hot,
+            key=lambda order: (order.get('created_at') or '', order['id'])
+        )
+        return list(self._unique(by_date))
+    
+    def get_status_counts(self) -> Dict[str, int]:
+        """
+        Cantidad de órdenes por estado (más el 'total'), sin recorrerlas:
+        el índice suma y resta en cada alta o cambio de estado.
+        """
+        index = self._hot_index()
+        counts = dict(index.status_counts)
+        if self._archive is not None:
+            # Los archivados salen del manifest (no se abre ningún segmento)
+            for status, count in self._archive.status_counts().items():
+                counts[status] = counts.get(status, 0) + count
+        status_counts = {'total': sum(counts.values())}
+        for status in self.VALID_STATUSES:
+            status_counts[status] = counts.get(status, 0)
+        return status_counts
+
+    def get_sales_report(self, start: Optional[str] = None, end: Optional[str] = None,
+                         branch_id: Optional[int] = None, product_id: Optional[int] = None,
+                         status: Optional[str] = None, group_by=('day',)) -> List[Dict]:
+        """
+        Ventas (recaudación, unidades y órdenes) agrupadas por 'group_by'
+        (campos de sales_rollups.GROUP_FIELDS), con filtros opcionales.
+        'start'/'end' son días 'YYYY-MM-DD' (inclusive).
+
+        No recorre órdenes: suma los totales que el índice mantiene en cada
+        alta o cambio de estado (ver sales_rollups.py), más los de los
+        segmentos archivados.
+        """
+        filters = dict(start=start, end=end, branch_id=branch_id, product_id=product_id,
+                       status=status, group_by=tuple(group_by))
+        result = self._hot_index().rollups.query(**filters)
+        if self._archive is not None:
+            self._archive.rollups().query(into=result, **filters)
+        report = []
+        for group in sorted(result, key=lambda values: tuple(str(value) for value in values)):
+            revenue, units, count = result[group]
+            row = dict(zip(filters['group_by'], group))
+            row.update(revenue=round(revenue, 2), units=units, orders=count)
+            report.append(row)
+        return report
+
     def get_order_by_id(self, order_id: int) -> Optional[Dict]:
         """Busca una orden específica por su ID."""
-        data = self._read_data()
-        for order in data['orders']:
-            if order['id'] == order_id:
-                return order
-        return None
+        order = self._hot_index().get(order_id)
+        if order is None and self._archive is not None:
+            order = self._archive.get_order(order_id)
+        return order
+    
+    def get_order_by_checkout(self, checkout_id: str) -> Optional[Dict]:
+        """
+        Busca la orden creada por un checkout (ver checkout_service.py).
+        Solo se usa al recuperar checkouts interrumpidos: recorre la
+        lista, empezando por las más nuevas (solo las calientes: una orden
+        recién creada nunca está archivada).
+        """
+        return next((o for o in reversed(self._hot_index().all())
+                     if o.get('checkout_id') == checkout_id), None)
     
     def update_order_status(self, order_id: int, status: str) -> Optional[Dict]:
         """Permite al admin cambiar el estado de una orden (ej: 'preparando')."""
-        valid_statuses = ['pending', 'confirmed', 'preparing', 'ready', 'completed', 'cancelled']
-        
-        if status not in valid_statuses:
+        if status not in self.VALID_STATUSES:
             return None # Estado no válido
         
-        data = self._read_data()
-        for order in data['orders']:
-            if order['id'] == order_id:
-                # 1. Actualiza el estado
-                order['status'] = status
-                # 2. Actualiza la fecha de modificación
-                order['updated_at'] = datetime.now().isoformat()
-                # 3. Guarda los cambios en el JSON
-                self._write_data(data)
-                return order
-        
-        return None # Orden no encontrada
\ No newline at end of file
+        # Actualiza el estado y la fecha de modificación.
+        # (Devuelve None si la orden no existe)
+        changes = {
+            "status": status,
+            "updated_at": datetime.now().isoformat()
+        }
+        self._hot_index()  # (Termina una mudanza cortada antes de elegir dónde cambiarla)
+        order = self._store.update_order(order_id, changes)
+        if order is None and self._archive is not None:
+            # No está entre las calientes: puede ser una orden archivada
+            order = self._archive.update_order(order_id, changes)
+        return order
\ No newline at end of file
@@ -0,0 +1,367 @@
+# store/order_store.py
+
+# Acá vive el "cómo se guardan" las órdenes. OrderService solo sabe
+# pedir/guardar órdenes; estas clases deciden el formato en disco:
+#
+#   - DocumentOrderStore: el modo clásico. Lee y reescribe 'orders.json'
+#     COMPLETO en cada cambio (cuesta más cuanto más historial hay).
+#   - JournalOrderStore: 'orders.json' pasa a ser una "foto" (snapshot) y
+#     cada orden nueva o cambio de estado se AGREGA como una línea en
+#     'orders.journal' (NDJSON). Escribir una orden cuesta siempre lo mismo.
+#
+# Los dos mantienen un OrderIndex (ver order_index.py) y lo exponen con
+# index(): quien lee (OrderService) ya no recorre todo el historial.
+
+import json
+import os
+import threading
+
+from .file_io import locked, atomic_write_json, file_stamp, fsync_enabled
+# Índices en memoria (id, usuario, sucursal, estado, fecha)
+from .order_index import OrderIndex
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ORDERS_FILE = os.path.join(BASE_DIR, 'data', 'orders.json')
+ORDERS_JOURNAL_FILE = os.path.join(BASE_DIR, 'data', 'orders.journal')
+
+# Empezamos las órdenes desde el ID 1001
+FIRST_ORDER_ID = 1001
+# Cada cuántas líneas de journal hacemos una compactación automática
+DEFAULT_COMPACT_EVERY = 500
+
+
+def _empty_document():
+    return {"orders": [], "next_order_id": FIRST_ORDER_ID}
+
+
+class DocumentOrderStore:
+    """
+    Modo clásico: todo 'orders.json' se lee y se reescribe en cada cambio.
+
+    El índice en memoria se rearma solo cuando el archivo cambia en disco
+    (otro proceso escribió); nuestras propias escrituras lo actualizan
+    en el lugar.
+    """
+
+    def __init__(self, orders_file=ORDERS_FILE):
+        self._orders_file = orders_file
+        self._lock = threading.RLock()
+        self._index = None
+        self._index_stamp = None  # Huella de 'orders.json' cuando armamos el índice
+        self._ensure_data_file_exists()
+
+    def _ensure_data_file_exists(self):
+        """Crea el JSON (con la estructura inicial) si no existe."""
+        os.makedirs(os.path.dirname(self._orders_file), exist_ok=True)
+        # Con el candado: si dos workers arrancan a la vez, solo uno lo crea
+        # (y nadie pisa órdenes que el otro ya haya guardado).
+        with locked(self._orders_file):
+            if not os.path.exists(self._orders_file):
+                self._write_data(_empty_document())
+
+    def _read_data(self):
+        """Lee el archivo JSON completo."""
+        try:
+            with open(self._orders_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (json.JSONDecodeError, FileNotFoundError) as e:
+            print(f"Error leyendo {self._orders_file}: {e}")
+            # Si falla, devuelve la estructura por defecto.
+            return _empty_document()
+
+    def _write_data(self, data):
+        """Escribe el archivo JSON completo (temporal + os.replace)."""
+        atomic_write_json(self._orders_file, data)
+
+    def _write_and_track(self, data, update_index):
+        """
+        Escribe 'data' y, si nadie más había escrito desde que armamos el
+        índice, lo actualiza con 'update_index(index)' en vez de rearmarlo.
+        """
+        before = file_stamp(self._orders_file)
+        self._write_data(data)
+        if self._index is not None and before == self._index_stamp:
+            update_index(self._index)
+            self._index_stamp = file_stamp(self._orders_file)
+        else:
+            self._index = None  # Se rearma en el próximo index()
+
+    # --- Interfaz común de los "stores" de órdenes ---
+
+    def index(self):
+        """El OrderIndex, al día con 'orders.json'."""
+        with self._lock:
+            stamp = file_stamp(self._orders_file)
+            if self._index is None or stamp != self._index_stamp:
+                self._index = OrderIndex(self._read_data()['orders'])
+                self._index_stamp = stamp
+            return self._index
+
+    def list_orders(self):
+        return self.index().all()
+
+    def get_order(self, order_id):
+        return self.index().get(order_id)
+
+    def insert_order(self, order):
+        """Asigna el próximo ID a 'order', la guarda y la devuelve."""
+        with self._lock, locked(self._orders_file):
+            data = self._read_data()
+            order['id'] = data['next_order_id']
+            data['orders'].append(order)
+            data['next_order_id'] += 1
+            self._write_and_track(data, lambda index: index.add(order))
+        return order
+
+    def update_order(self, order_id, changes):
+        """Aplica 'changes' (dict) a la orden y la guarda."""
+        with self._lock, locked(self._orders_file):
+            data = self._read_data()
+            for order in data['orders']:
+                if order['id'] == order_id:
+                    order.update(changes)
+                    self._write_and_track(
+                        data, lambda index: index.update(index.get(order_id), changes)
+                    )
+                    return self.index().get(order_id)
+        return None
+
+    def archive_orders(self, archive, should_archive):
+        """
+        Muda al 'archive' (ver order_archive.py) las órdenes que cumplen
+        'should_archive(orden)' y las saca de 'orders.json'. Devuelve cuántas.
+        """
+        with self._lock, locked(self._orders_file):
+            data = self._read_data()
+            moving = [order for order in data['orders'] if should_archive(order)]
+            if not moving:
+                archive.end_move()  # (Una mudanza anterior ya había terminado)
+                return 0
+            # Primero el archivo: si el proceso muere en el medio, la orden
+            # queda en los dos lados hasta que alguien termine la mudanza
+            # anotada en 'moving.json' (repetirla no duplica nada).
+            moved = {order['id'] for order in moving}
+            archive.begin_move(moved)
+            archive.add(moving)
+            data['orders'] = [order for order in data['orders'] if order['id'] not in moved]
+            self._write_data(data)
+            self._index = None  # Se rearma en el próximo index()
+            archive.end_move()
+            return len(moving)
+
+
+class JournalOrderStore:
+    """
+    Modo journal: snapshot ('orders.json') + registro de cambios
+    ('orders.journal', una línea JSON por evento, con fsync).
+
+    En memoria mantenemos la "vista materializada": snapshot + journal
+    aplicados. Al leer, solo procesamos las líneas NUEVAS del journal
+    (las que agregaron otros procesos), nunca el archivo entero.
+
+    Eventos del journal:
+        {"op": "create", "order": {...}}
+        {"op": "update", "id": 1001, "changes": {"status": "...", ...}}
+    """
+
+    def __init__(self, orders_file=ORDERS_FILE, journal_file=ORDERS_JOURNAL_FILE,
+                 compact_every=DEFAULT_COMPACT_EVERY):
+        self._orders_file = orders_file
+        self._journal_file = journal_file
+        self._compact_every = compact_every
+        self._lock = threading.RLock()
+        # Vista materializada: índice con {id: orden} (en orden de creación)
+        # y los índices secundarios (usuario, sucursal, estado, fecha).
+        self._index = OrderIndex()
+        self._next_order_id = FIRST_ORDER_ID
+        self._snapshot_stamp = None  # Si cambia, otro proceso compactó
+        self._journal_offset = 0     # Bytes del journal ya aplicados
+        self._journal_entries = 0    # Líneas desde la última compactación
+        self._loaded = False
+
+    # --- Reconstrucción de la vista materializada ---
+
+    def _load(self):
+        """
+        Reconstruye todo: lee el snapshot y aplica el journal entero.
+
+        Si otro proceso compacta MIENTRAS leemos (snapshot nuevo + journal
+        vacío), podríamos quedarnos con el snapshot viejo y el journal ya
+        vaciado: perderíamos órdenes y repetiríamos IDs. Por eso tomamos la
+        huella del snapshot ANTES de abrirlo y la volvemos a mirar después
+        de leer el journal; si cambió, empezamos de nuevo.
+        """
+        os.makedirs(os.path.dirname(self._orders_file), exist_ok=True)
+        while True:
+            stamp = file_stamp(self._orders_file)
+            try:
+                with open(self._orders_file, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except FileNotFoundError:
+                data = _empty_document()
+            except json.JSONDecodeError as e:
+                print(f"Error leyendo {self._orders_file}: {e}")
+                data = _empty_document()
+            self._index = OrderIndex(data.get('orders', []))
+            self._next_order_id = data.get('next_order_id', FIRST_ORDER_ID)
+            self._snapshot_stamp = stamp
+            self._journal_offset = 0
+            self._journal_entries = 0
+            self._loaded = True
+            self._read_journal_tail()
+            if file_stamp(self._orders_file) == stamp:
+                return
+
+    def _read_journal_tail(self):
+        """Aplica solo las líneas del journal que todavía no vimos."""
+        try:
+            with open(self._journal_file, 'rb') as f:
+                f.seek(self._journal_offset)
+                chunk = f.read()
+        except FileNotFoundError:
+            return
+        # Una línea sin '\n' final es una escritura a medias (todavía en
+        # curso o un crash): la dejamos para la próxima lectura.
+        complete = chunk[:chunk.rfind(b'\n') + 1]
+        for line in complete.splitlines():
+            if line.strip():
+                try:
+                    self._apply(json.loads(line))
+                except (ValueError, KeyError) as e:
+                    print(f"Advertencia: línea inválida en {self._journal_file}: {e}")
+                self._journal_entries += 1
+        self._journal_offset += len(complete)
+
+    def _apply(self, entry):
+        """Aplica UN evento del journal a la vista materializada."""
+        if entry['op'] == 'create':
+            order = entry['order']
+            if order['id'] in self._index.by_id:
+                # Repetido (journal re-aplicado sobre un snapshot nuevo)
+                self._index.update(self._index.get(order['id']), order)
+            else:
+                self._index.add(order)
+            self._next_order_id = max(self._next_order_id, order['id'] + 1)
+        elif entry['op'] == 'update':
+            order = self._index.get(entry['id'])
+            if order is not None:
+                self._index.update(order, entry['changes'])
+
+    def _sync(self):
+        """Se pone al día con el disco (sin releer lo que ya aplicamos)."""
+        if not self._loaded or file_stamp(self._orders_file) != self._snapshot_stamp:
+            self._load()
+            return
+        journal_stamp = file_stamp(self._journal_file)
+        journal_size = journal_stamp[1] if journal_stamp else 0
+        if journal_size < self._journal_offset:
+            # El journal se vació (otro proceso compactó): reconstruimos.
+            self._load()
+        elif journal_size > self._journal_offset:
+            self._read_journal_tail()
+            # Si en el medio otro proceso compactó, lo que leímos puede ser
+            # del journal NUEVO desde un offset del viejo: reconstruimos.
+            # (La compactación cambia el snapshot ANTES de vaciar el journal,
+            # así que mirarlo después de leer alcanza para darse cuenta.)
+            if file_stamp(self._orders_file) != self._snapshot_stamp:
+                self._load()
+
+    # --- Escritura ---
+
+    def _append(self, entry):
+        """Agrega UN evento al journal y espera a que llegue al disco."""
+        line = (json.dumps(entry, ensure_ascii=False) + '\n').encode('utf-8')
+        with open(self._journal_file, 'ab') as f:
+            if f.tell() > self._journal_offset:
+                # Quedó una línea cortada (un crash a mitad de escritura):
+                # la cerramos para que nuestra línea empiece limpia.
+                line = b'\n' + line
+                self._journal_offset = f.tell()
+            f.write(line)
+            f.flush()
+            if fsync_enabled():
+                os.fsync(f.fileno())
+        self._journal_offset += len(line)
+        self._journal_entries += 1
+        self._apply(entry)
+        if self._compact_every and self._journal_entries >= self._compact_every:
+            self.compact()
+
+    def compact(self):
+        """
+        Vuelca la vista materializada en un snapshot nuevo y vacía el journal.
+
+        Orden seguro ante un corte: primero el snapshot (archivo temporal +
+        os.replace, que es atómico) y recién después se trunca el journal.
+        Si el proceso muere entre los dos pasos, volver a aplicar el journal
+        sobre el snapshot nuevo da el mismo resultado (los eventos son
+        idempotentes).
+        """
+        with self._lock, locked(self._journal_file):
+            self._sync()
+            data = {
+                "orders": self._index.all(),
+                "next_order_id": self._next_order_id
+            }
+            atomic_write_json(self._orders_file, data)
+            with open(self._journal_file, 'w', encoding='utf-8'):
+                pass
+            self._snapshot_stamp = file_stamp(self._orders_file)
+            self._journal_offset = 0
+            self._journal_entries = 0
+
+    def archive_orders(self, archive, should_archive):
+        """
+        Muda al 'archive' (ver order_archive.py) las órdenes que cumplen
+        'should_archive(orden)' y compacta sin ellas. Devuelve cuántas.
+
+        Primero se escribe el archivo y después el snapshot nuevo: si el
+        proceso muere en el medio, la orden queda en los dos lados hasta
+        que alguien termine la mudanza anotada en 'moving.json' (repetirla
+        no duplica nada).
+        """
+        with self._lock, locked(self._journal_file):
+            self._sync()
+            moving = [order for order in self._index.all() if should_archive(order)]
+            if not moving:
+                archive.end_move()  # (Una mudanza anterior ya había terminado)
+                return 0
+            moved = {order['id'] for order in moving}
+            archive.begin_move(moved)
+            archive.add(moving)
+            self._index = OrderIndex(o for o in self._index.all() if o['id'] not in moved)
+            self.compact()
+            archive.end_move()
+            return len(moving)
+
+    # --- Interfaz común de los "stores" de órdenes ---
+
+    def index(self):
+        """El OrderIndex de la vista materializada (ya al día con el disco)."""
+        with self._lock:
+            self._sync()
+            return self._index
+
+    def list_orders(self):
+        return self.index().all()
+
+    def get_order(self, order_id):
+        return self.index().get(order_id)
+
+    def insert_order(self, order):
+        # Con el candado del journal tomado, ningún otro worker puede
+        # agregar líneas: después de _sync() el próximo ID es nuestro.
+        with self._lock, locked(self._journal_file):
+            self._sync()
+            order['id'] = self._next_order_id
+            self._append({"op": "create", "order": order})
+            return order
+
+    def update_order(self, order_id, changes):
+        with self._lock, locked(self._journal_file):
+            self._sync()
+            if order_id not in self._index.by_id:
+                return None
+            self._append({"op": "update", "id": order_id, "changes": changes})
+            return self._index.get(order_id)
+
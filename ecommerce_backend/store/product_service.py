@@ -1,93 +1,51 @@
+import base64
 import json
-import os
-# Importamos los "moldes" que este servicio necesita
-from .models import Category, CakeProduct 
+import random
+import time
 
-# Configuración de rutas
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-# Este servicio maneja DOS archivos JSON
-CATEGORIES_FILE = os.path.join(BASE_DIR, 'data', 'categories.json')
-PRODUCTS_FILE = os.path.join(BASE_DIR, 'data', 'products.json')
+# Importamos los "moldes" que este servicio necesita
+from .models import Category, CakeProduct
+# El catálogo compartido del proceso (categorías + productos ya cargados)
+from .catalog_repository import get_catalog_repository
+# Orden y paginación "keyset" del listado (ver ProductSortIndex)
+from .catalog_indexes import SORT_FIELDS, sort_key, keyset_slice
+# El backend también nos da los contadores de IDs (sequences)
+from .storage import get_storage_backend
 
 
 class ProductService:
-    def __init__(self):
-        # 1. Carga las categorías PRIMERO (son una dependencia)
-        self._categories = self._load_categories()
-        # 2. Carga los productos (y los valida contra las categorías cargadas)
-        self._products = self._load_products()
+    # Campos que se pueden pedir con 'fields' (los del dict de un producto)
+    FIELDS = ('id', 'title', 'description', 'price', 'stock', 'category_id',
+              'branch_id', 'image_url', 'version', 'type', 'weight')
 
-    # --- Carga de Datos (Privado) ---
+    def __init__(self, repository=None):
+        # Ya no leemos los JSON acá: todas las instancias comparten el mismo
+        # catálogo, que solo se recarga si los archivos cambian en disco.
+        # Crear un ProductService() es ahora gratis.
+        self._repo = repository or get_catalog_repository()
 
-    def _load_categories(self):
-        """Carga 'categories.json' en una lista de objetos Category."""
-        try:
-            with open(CATEGORIES_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                # Convierte la lista de dicts en lista de Objetos
-                return [Category(c['id'], c['name']) for c in data]
-        except (FileNotFoundError, json.JSONDecodeError):
-            # Si falla, crea la carpeta y devuelve lista vacía
-            os.makedirs(os.path.dirname(CATEGORIES_FILE), exist_ok=True)
-            return []
-
-    def _load_products(self):
-        """Carga 'products.json' en una lista de objetos CakeProduct."""
-        try:
-            with open(PRODUCTS_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                products_list = []
-                for item in data:
-                    category_id = item.get('category_id') 
-                    
-                    # --- Validación de Dependencia ---
-                    # Verificamos que la categoría del producto (category_id)
-                    # realmente exista en nuestra lista (self._categories).
-                    if not category_id or not any(c.category_id == category_id for c in self._categories):
-                        print(f"Advertencia: Producto {item['id']} omitido. Categoría {category_id} no válida.")
-                        continue # Ignoramos este producto y pasamos al siguiente
-
-                    # Preparamos los argumentos para el constructor de Product/CakeProduct
-                    common_args = (
-                        item['id'],
-                        item['title'],
-                        item['description'],
-                        item['price'],
-                        item['stock'],
-                        category_id,
-                        item.get('branch_id'), # Añadimos la sucursal
-                        item.get('image_url')
-                    )
-
-                    # Creamos el objeto (asumimos que todos son CakeProduct)
-                    product = CakeProduct(*common_args, weight=item.get('weight'))
-                    products_list.append(product)
-                        
-                return products_list
-        except (FileNotFoundError, json.JSONDecodeError):
-            os.makedirs(os.path.dirname(PRODUCTS_FILE), exist_ok=True)
-            return []
-
-    # --- Guardado de Datos (Privado) ---
-
-    def _save_products_to_file(self):
-        """Guarda la lista de objetos _products en 'products.json'"""
-        # Llama a .to_dict() en cada objeto antes de guardar
-        products_as_dicts = [p.to_dict() for p in self._products]
-        with open(PRODUCTS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(products_as_dicts, f, indent=4, ensure_ascii=False)
-
-    def _save_categories_to_file(self):
-        """Guarda la lista de objetos _categories en 'categories.json'"""
-        categories_as_dicts = [c.to_dict() for c in self._categories]
-        with open(CATEGORIES_FILE, 'w', encoding='utf-8') as f:
-            json.dump(categories_as_dicts, f, indent=4, ensure_ascii=False)
+    # --- Acceso a Datos (Privado) ---
+
+    def _next_id(self, name):
+        """Próximo ID de 'name' según el contador compartido del backend."""
+        backend = self._repo.backend or get_storage_backend()
+        return backend.sequences().next_id(name)
+
+    @property
+    def _categories(self):
+        """Lista de objetos Category (del catálogo compartido)."""
+        return self._repo.categories
+
+    @property
+    def _products(self):
+        """Lista de objetos CakeProduct (del catálogo compartido)."""
+        return self._repo.products
 
     # --- Métodos de Categorías (CRUD) ---
 
     def get_category_by_id(self, category_id):
         """Busca una categoría por ID (devuelve un dict)"""
-        category = next((c for c in self._categories if c.category_id == category_id), None)
+        category = self._repo.get_category(category_id)
         return category.to_dict() if category else None
 
     def get_all_categories(self):
@@ -99,14 +57,13 @@ class ProductService:
         try:
             name = data.get('name')
             if not name: return None # Nombre es obligatorio
-            # 1. Calcula el nuevo ID
-            new_id = max([c.category_id for c in self._categories], default=0) + 1
-            # 2. Crea el objeto
-            new_category = Category(category_id=new_id, name=name)
-            # 3. Añade a la lista en memoria
-            self._categories.append(new_category)
-            # 4. Guarda en el JSON
-            self._save_categories_to_file()
+            with self._repo.lock:
+                # 1. Pide el nuevo ID al contador compartido (sin recorrer la lista)
+                new_id = self._next_id('categories')
+                # 2. Crea el objeto
+                new_category = Category(category_id=new_id, name=name)
+                # 3. La añade al catálogo y la guarda
+                self._repo.add_category(new_category)
             return new_category.to_dict()
         except Exception as e:
             print(f"Error al crear categoría: {e}")
@@ -115,8 +72,8 @@ class ProductService:
     def update_category(self, category_id, data):
         """Actualiza el nombre de una categoría."""
         try:
-            # 1. Busca el OBJETO en la lista
-            category_in_list = next((c for c in self._categories if c.category_id == category_id), None)
+            # 1. Busca el OBJETO (por diccionario)
+            category_in_list = self._repo.get_category(category_id)
             if not category_in_list:
                 print(f"Error: Categoría {category_id} no encontrada")
                 return None
@@ -124,9 +81,10 @@ class ProductService:
             # 2. Actualiza el nombre (los objetos se modifican "por referencia")
             new_name = data.get('name')
             if new_name:
-                category_in_list._name = new_name 
-                # 3. Guarda la lista actualizada en el JSON
-                self._save_categories_to_file()
+                with self._repo.lock:
+                    category_in_list.name = new_name 
+                    # 3. Guarda la categoría actualizada
+                    self._repo.save_category(category_in_list)
                 return category_in_list.to_dict()
             return None
         except Exception as e:
@@ -135,44 +93,216 @@ class ProductService:
 
     # --- Métodos de Productos (CRUD) ---
 
-    def get_all_products(self, title_filter=None, category_id_filter=None):
+    def get_all_products(self, title_filter=None, category_id_filter=None, branch_id_filter=None,
+                         fields=None, **ranges):
         """
         Devuelve todos los productos (lista de dicts),
-        con filtros opcionales por título o categoría.
+        con filtros opcionales por título, categoría o sucursal (y los de
+        precio, stock y peso: ver _filtered()).
+        Con 'fields', cada dict trae solo esos campos (ver serialize()).
         """
-        products_to_return = self._products # Empezamos con todos
-        
-        # Aplicamos filtro de categoría
-        if category_id_filter is not None:
-            products_to_return = [p for p in products_to_return if p.category_id == category_id_filter]
-        
-        # Aplicamos filtro de título
-        if title_filter:
-            products_to_return = [p for p in products_to_return if title_filter.lower() in p.title.lower()]
-        
-        # Devolvemos la lista filtrada (convertida a dicts)
-        return [p.to_dict() for p in products_to_return]
+        return list(self.iter_products(title_filter, category_id_filter, branch_id_filter, fields, **ranges))
+
+    def iter_products(self, title_filter=None, category_id_filter=None, branch_id_filter=None,
+                      fields=None, **ranges):
+        """
+        Lo mismo que get_all_products(), pero como generador: arma el dict
+        de cada producto recién cuando se lo pide (ver exports.py).
+        """
+        for p in self._filtered(title_filter, category_id_filter, branch_id_filter, **ranges):
+            yield self.serialize(p, fields)
+
+    def get_branch_catalog(self, branch_id=None, product_ids=None):
+        """
+        Los productos de una sucursal (None: todas) como dicts, con su
+        'category_name' ya puesto. Sale de las páginas que el catálogo
+        mantiene armadas por sucursal: cuesta lo que mide la sucursal.
+        Con 'product_ids', solo esos (ej: el resultado de un filtro).
+        """
+        return self._repo.branch_catalog(branch_id, product_ids)
+
+    def get_branch_product(self, branch_id, product_id):
+        """Un producto de esa sucursal (con 'category_name'), o None si no es de ahí."""
+        rows = self._repo.branch_catalog(branch_id, [product_id])
+        return rows[0] if rows else None
+
+    def get_facets(self, title_filter=None, category_id_filter=None, branch_id_filter=None, **ranges):
+        """
+        Conteos por faceta (categoría, rango de precio, con/sin stock)
+        para esos filtros, sin recorrer el catálogo (ver ProductFacetIndex).
+        """
+        ranges = {name: value for name, value in ranges.items() if value is not None}
+        _, counts = self._repo.filter_products(
+            title_filter.strip() if title_filter else None, with_counts=True,
+            category_id=category_id_filter, branch_id=branch_id_filter, **ranges
+        )
+        return counts
+
+    def _filtered(self, title_filter=None, category_id_filter=None, branch_id_filter=None, **ranges):
+        """
+        Los objetos producto que cumplen los filtros (con la búsqueda: los
+        más relevantes primero). 'ranges' son los filtros extra de
+        FACET_FILTERS (min_price, max_price, price_bucket, in_stock, min_weight,
+        max_weight).
+        """
+        ranges = {name: value for name, value in ranges.items() if value is not None}
+        if ranges:
+            # Filtros combinados: AND de bitmaps (ver ProductFacetIndex)
+            products, _ = self._repo.filter_products(
+                title_filter.strip() if title_filter else None,
+                category_id=category_id_filter, branch_id=branch_id_filter, **ranges
+            )
+            return products
+        # Empezamos por el grupo más chico que nos den los índices
+        # (texto, categoría -> productos, sucursal -> productos) en vez de
+        # recorrer el catálogo entero.
+        if title_filter and title_filter.strip():
+            # Índice de búsqueda (título y descripción, sin importar tildes
+            # ni mayúsculas; los más relevantes primero)
+            products_to_return = self._repo.search_products(title_filter)
+            if category_id_filter is not None:
+                products_to_return = [p for p in products_to_return if p.category_id == category_id_filter]
+            if branch_id_filter is not None:
+                products_to_return = [p for p in products_to_return if p.branch_id == branch_id_filter]
+        elif category_id_filter is not None:
+            products_to_return = self._repo.products_in_category(category_id_filter)
+            if branch_id_filter is not None:
+                products_to_return = [p for p in products_to_return if p.branch_id == branch_id_filter]
+        elif branch_id_filter is not None:
+            products_to_return = self._repo.products_in_branch(branch_id_filter)
+        else:
+            products_to_return = self._products # Todos
+        return products_to_return
+
+    def get_products_page(self, title_filter=None, category_id_filter=None, branch_id_filter=None,
+                          sort=None, after=None, limit=25, fields=None, **ranges):
+        """
+        Una página del listado de productos, ordenada y con cursor:
+
+            sort   'price', 'title', 'stock' o 'id' ('-price': de mayor a
+                   menor). Sin 'sort': por relevancia si hay búsqueda, si
+                   no por ID.
+            after  el 'next_cursor' de la página anterior.
+            fields solo esos campos de cada producto (ej: ['id', 'price']).
+            ranges precio, stock y peso (ver _filtered()).
+
+        Devuelve {"results": [...], "next_cursor": "..." o None}.
+        Sin filtros, la página sale de las listas ya ordenadas del índice
+        (bisect + corte); con filtros se ordenan solo los filtrados.
+        """
+        descending = bool(sort) and sort.startswith('-')
+        field = (sort or '').lstrip('-') or None
+        if field is not None and field not in SORT_FIELDS:
+            raise ValueError(f"No se puede ordenar por '{field}' (usar {', '.join(SORT_FIELDS)}).")
+        unknown = [name for name in fields or () if name not in self.FIELDS]
+        if unknown:
+            raise ValueError(f"Campos desconocidos: {', '.join(unknown)}.")
+        searching = bool(title_filter and title_filter.strip())
+        ranges = {name: value for name, value in ranges.items() if value is not None}
+        after = self._decode_cursor(after)
+        if after is not None and isinstance(after[0], str) != (field == 'title'):
+            after = None  # Cursor de otro orden: empezamos de nuevo
+        if field is None and searching:
+            # Relevancia: clave (-puntaje, id), el más relevante primero
+            matched = {p.product_id for p in self._filtered(title_filter, category_id_filter,
+                                                            branch_id_filter, **ranges)}
+            keyed = [((-score, p.product_id), p) for p, score in self._repo.search_scored(title_filter)
+                     if p.product_id in matched]
+            page = self._keyset_page(keyed, after, limit, descending)
+        elif category_id_filter is None and branch_id_filter is None and not searching and not ranges:
+            page = [(key, p) for p, key in self._repo.sorted_page(field or 'id', after, limit + 1, descending)]
+        else:
+            keyed = [(sort_key(p, field or 'id'), p)
+                     for p in self._filtered(title_filter, category_id_filter, branch_id_filter, **ranges)]
+            page = self._keyset_page(keyed, after, limit, descending)
+        # Pedimos UNO de más para saber si hay página siguiente
+        next_cursor = None
+        if len(page) > limit:
+            page = page[:limit]
+            next_cursor = self._encode_cursor(page[-1][0])
+        return {
+            "results": [self.serialize(p, fields) for _, p in page],
+            "next_cursor": next_cursor
+        }
+
+    @staticmethod
+    def _keyset_page(keyed, after, limit, descending):
+        """'limit' + 1 pares (clave, producto) después de 'after' (ver keyset_slice)."""
+        by_key = dict(keyed)
+        keys = keyset_slice(sorted(by_key), after, limit + 1, descending)
+        return [(key, by_key[key]) for key in keys]
+
+    @staticmethod
+    def _encode_cursor(key):
+        return base64.urlsafe_b64encode(json.dumps(list(key)).encode('utf-8')).decode('ascii')
+
+    @staticmethod
+    def _decode_cursor(cursor):
+        """Cursor -> clave (valor, id). Un cursor inválido es la primera página."""
+        if not cursor:
+            return None
+        try:
+            value, product_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+            return (value, int(product_id))
+        except (ValueError, TypeError):
+            return None
+
+    @staticmethod
+    def serialize(product, fields=None):
+        """
+        El dict de un producto; con 'fields', SOLO esos campos (se leen
+        del objeto, sin armar el dict completo).
+        """
+        if not fields:
+            return product.to_dict()
+        return {field: product.product_id if field == 'id' else getattr(product, field, None)
+                for field in fields}
+
+    def suggest(self, text, branch_id=None, limit=8):
+        """
+        Sugerencias para el buscador mientras se escribe. Solo lo mínimo
+        para mostrar la lista (nada de descripciones ni imágenes):
+            {"products": [{"id", "title", "price"}], "categories": [{"id", "name"}]}
+        """
+        products, categories = self._repo.suggest(text, branch_id, limit)
+        return {
+            "products": [{"id": p.product_id, "title": p.title, "price": p.price} for p in products],
+            "categories": [{"id": c.category_id, "name": c.name} for c in categories]
+        }
 
     def get_product_by_id(self, product_id):
         """Busca un producto por ID (devuelve un dict)"""
-        product = next((p for p in self._products if p.product_id == product_id), None)
+        product = self._repo.get_product(product_id)
         return product.to_dict() if product else None
 
+    def get_products_by_ids(self, product_ids):
+        """
+        Busca varios productos en UNA sola consulta al catálogo.
+        Devuelve {id: dict del producto}; los IDs que no existen no aparecen.
+        """
+        products = self._repo.get_products(product_ids)
+        return {pid: product.to_dict() for pid, product in products.items()}
+
     def create_product(self, data):
         """Crea un nuevo producto (CakeProduct)."""
-        
-        new_id = max([p.product_id for p in self._products], default=0) + 1
+        with self._repo.exclusive():
+            return self._create_product(data)
+
+    def _create_product(self, data):
         category_id = data.get('category_id')
         branch_id = data.get('branch_id') # <-- NUEVO
         
         # Validación: La categoría debe existir
-        if not category_id or not any(c.category_id == category_id for c in self._categories):
+        if not category_id or not self._repo.has_category(category_id):
             print(f"Error: Intento de crear producto con categoría inválida {category_id}")
             return None 
         
         # (Opcional) Faltaría verificar si la sucursal (branch_id) existe
         # usando el BranchService.
         
+        # Pedimos el ID recién ahora (ya validado, para no gastar números)
+        new_id = self._next_id('products')
+        
         # Argumentos para el constructor
         common_args = (
             new_id,
@@ -187,10 +317,8 @@ class ProductService:
         try:
             # 1. Creamos el objeto
             product = CakeProduct(*common_args, weight=data.get('weight'))
-            # 2. Añadimos a la lista en memoria
-            self._products.append(product)
-            # 3. Guardamos en el JSON
-            self._save_products_to_file()
+            # 2. Lo añadimos al catálogo y lo guardamos
+            self._repo.add_product(product)
             return product.to_dict()
         except (KeyError, ValueError, TypeError) as e:
             # Captura errores si faltan datos (KeyError)
@@ -200,34 +328,33 @@ class ProductService:
 
     def update_product(self, product_id, data):
         """Actualiza los datos de un producto existente."""
-        
-        # 1. Buscamos el OBJETO en la lista
-        product_obj = next((p for p in self._products if p.product_id == product_id), None)
+        # Leemos, cambiamos y guardamos con el candado de productos tomado
+        # y lo último del disco: si otro worker acaba de descontar stock, lo
+        # vemos y no lo pisamos con nuestra copia vieja.
+        with self._repo.exclusive():
+            return self._update_product(product_id, data)
+
+    def _update_product(self, product_id, data):
+        # 1. Buscamos el OBJETO (por diccionario)
+        product_obj = self._repo.get_product(product_id)
         if not product_obj: 
             return None # No se encontró
         
-        # 2. Actualizamos campo por campo, usando los "setters" del modelo
         try:
-            if 'title' in data and data['title']: product_obj.title = data['title']
-            if 'description' in data: product_obj.description = data['description']
-            if 'price' in data and data['price'] is not None: product_obj.price = float(data['price'])
-            if 'stock' in data and data['stock'] is not None: product_obj.stock = int(data['stock'])
-            if 'image_url' in data: product_obj.image_url = data['image_url']
-            if 'weight' in data and data['weight'] is not None and hasattr(product_obj, 'weight'): product_obj.weight = float(data['weight'])
-            
-            # --- NUEVO: Actualizar Categoría y Sucursal ---
-            if 'category_id' in data and data['category_id'] is not None:
-                category_id = int(data['category_id'])
-                # Verificamos que la nueva categoría exista
-                if any(c.category_id == category_id for c in self._categories):
-                    product_obj._category_id = category_id
-            
-            if 'branch_id' in data and data['branch_id'] is not None:
-                product_obj.branch_id = int(data['branch_id'])
-            # --- FIN NUEVO ---
+            # 2. Primero convertimos y revisamos TODOS los datos nuevos, sin
+            #    tocar el producto (es el mismo objeto que ven todas las
+            #    peticiones: no puede quedar a medio cambiar).
+            changes = self._product_changes(product_obj, data)
+
+            # 3. Recién ahora los aplicamos, usando los "setters" del modelo
+            #    (dentro de 'updating': los índices se mantienen al día y, si
+            #    un setter rechaza un valor, el producto vuelve a como estaba)
+            with self._repo.updating(product_obj):
+                for name, value in changes.items():
+                    setattr(product_obj, name, value)
                 
-            # 3. Guardamos la lista actualizada en el JSON
-            self._save_products_to_file()
+            # 4. Guardamos el producto actualizado
+            self._repo.save_product(product_obj)
             return product_obj.to_dict()
             
         except ValueError as e:
@@ -238,32 +365,103 @@ class ProductService:
             print(f"Error inesperado en update_product: {e}")
             return None
 
+    def _product_changes(self, product_obj, data):
+        """
+        Los cambios de 'data' ya convertidos: {atributo: valor nuevo}.
+        Lanza ValueError si alguno no es válido (sin haber cambiado nada).
+        """
+        changes = {}
+        if 'title' in data and data['title']: changes['title'] = data['title']
+        if 'description' in data: changes['description'] = data['description']
+        if 'price' in data and data['price'] is not None: changes['price'] = float(data['price'])
+        if 'stock' in data and data['stock'] is not None: changes['stock'] = int(data['stock'])
+        if 'image_url' in data: changes['image_url'] = data['image_url']
+        if 'weight' in data and data['weight'] is not None and hasattr(product_obj, 'weight'): changes['weight'] = float(data['weight'])
+
+        # Las mismas reglas que los setters del modelo (así fallamos ANTES de cambiar nada)
+        if changes.get('price', 0) < 0:
+            raise ValueError("El precio debe ser un número no negativo.")
+        if changes.get('stock', 0) < 0:
+            raise ValueError("El stock debe ser un número entero no negativo.")
+        
+        # --- NUEVO: Actualizar Categoría y Sucursal ---
+        if 'category_id' in data and data['category_id'] is not None:
+            category_id = int(data['category_id'])
+            # Verificamos que la nueva categoría exista
+            if self._repo.has_category(category_id):
+                changes['category_id'] = category_id
+        
+        if 'branch_id' in data and data['branch_id'] is not None:
+            changes['branch_id'] = int(data['branch_id'])
+        # --- FIN NUEVO ---
+        return changes
+
+    def decrement_stock(self, quantities, retries=10):
+        """
+        Descuenta stock de uno o varios productos SIN vender de más, aunque
+        haya muchas compras a la vez (concurrencia optimista):
+
+          1. Lee stock y versión de cada producto (sin candado).
+          2. Si no alcanza, falla enseguida.
+          3. Pide al catálogo descontar SOLO si las versiones no cambiaron.
+             Si otro lo cambió en el medio, vuelve al paso 1 (hasta 'retries').
+
+        quantities: {product_id: cantidad}
+        Devuelve {"success": bool, "reason": None | 'missing' |
+                  'insufficient' | 'conflict', "product_id": ..., "attempts": n}
+        """
+        reason, product_id = 'conflict', None
+        for attempt in range(1, retries + 1):
+            products = self._repo.get_products(quantities)
+            changes = {}
+            for pid, quantity in quantities.items():
+                product = products.get(pid)
+                if product is None:
+                    return {"success": False, "reason": 'missing', "product_id": pid, "attempts": attempt}
+                if product.stock < quantity:
+                    return {"success": False, "reason": 'insufficient', "product_id": pid, "attempts": attempt}
+                changes[pid] = (product.version, quantity)
+
+            success, failure = self._repo.compare_and_decrement(changes)
+            if success:
+                return {"success": True, "reason": None, "product_id": None, "attempts": attempt}
+            reason, product_id = failure
+            if reason != 'conflict':
+                return {"success": False, "reason": reason, "product_id": product_id, "attempts": attempt}
+            # Conflicto: esperamos un poquito (al azar y cada vez más, para
+            # no volver a chocar con el mismo worker) y reintentamos.
+            time.sleep(random.uniform(0, min(0.0005 * 2 ** attempt, 0.05)))
+
+        print(f"Advertencia: decrement_stock sin éxito tras {retries} intentos (producto {product_id})")
+        return {"success": False, "reason": reason, "product_id": product_id, "attempts": retries}
+
     def delete_product(self, product_id):
         """Elimina un producto por ID."""
-        # 1. Busca el OBJETO
-        product_obj = next((p for p in self._products if p.product_id == product_id), None)
-        if product_obj:
-            # 2. Lo quita de la lista en memoria
-            self._products.remove(product_obj)
-            # 3. Guarda la lista actualizada en el JSON
-            self._save_products_to_file()
-            return True
+        with self._repo.exclusive():
+            # 1. Busca el OBJETO (por diccionario)
+            product_obj = self._repo.get_product(product_id)
+            if product_obj:
+                # 2. Lo quita del catálogo (y del almacenamiento)
+                self._repo.remove_product(product_obj)
+                return True
         return False
     
     def delete_category(self, category_id):
         """Elimina una categoría, SOLO si no está en uso."""
-        
+        with self._repo.lock:
+            return self._delete_category(category_id)
+
+    def _delete_category(self, category_id):
         # 1. Verificación de integridad: ¿Algún producto usa esta categoría?
-        is_in_use = any(p.category_id == category_id for p in self._products)
+        is_in_use = bool(self._repo.products_in_category(category_id))
         if is_in_use:
             print(f"Error: Categoría {category_id} está en uso por un producto.")
             return False # No se puede borrar
         
         # 2. Si no está en uso, la buscamos
-        category_obj = next((c for c in self._categories if c.category_id == category_id), None)
+        category_obj = self._repo.get_category(category_id)
         if category_obj:
-            # 3. La quitamos de la lista y guardamos
-            self._categories.remove(category_obj)
-            self._save_categories_to_file()
+            # 3. La quitamos del catálogo (y del almacenamiento)
+            self._repo.remove_category(category_obj)
             return True
         return False
\ No newline at end of file
@@ -0,0 +1,241 @@
+# store/reservation_service.py
+
+# Reservas de stock con vencimiento ("holds").
+#
+# Antes, agregar al carrito solo miraba product['stock'] y no apartaba
+# nada: una torta muy pedida se podía agotar entre el carrito y el pago.
+#
+# Ahora, al agregar al carrito (o al entrar al checkout) el cliente
+# RESERVA esas unidades por STORE_RESERVATION_TTL_SECONDS segundos:
+#
+#   disponible = stock - reservas vigentes de los DEMÁS clientes
+#
+# Cómo se guarda:
+#   - En disco, en la colección 'reservations' (una por cliente y
+#     producto; en JSON, un archivo por reserva en data/reservations/),
+#     así todos los workers ven las mismas reservas. Reservar o liberar
+#     escribe SOLO las reservas que cambiaron.
+#   - En memoria, tres estructuras que se releen SOLO si la colección
+#     cambió (misma "huella" que usan el catálogo y los usuarios):
+#         _holds  "user_id:product_id" -> reserva
+#         _held   product_id -> unidades reservadas en total
+#         _heap   montículo (heapq) de (vence, clave)
+#
+# Las reservas vencidas se liberan "de a poco": cada consulta saca del
+# montículo solo las que ya vencieron (lo más viejo está siempre arriba),
+# sin recorrer todas las reservas. Cuando una reserva se renueva, su
+# entrada vieja queda en el montículo y se descarta al salir (su
+# vencimiento ya no coincide). Las vencidas se borran del disco en la
+# próxima escritura, de a una (nunca se reescriben todas).
+
+import heapq
+import threading
+import time
+
+from django.conf import settings
+
+from .storage import get_storage_backend
+
+DEFAULT_TTL_SECONDS = 15 * 60
+
+
+def _key(user_id, product_id):
+    return f"{user_id}:{product_id}"
+
+
+class ReservationService:
+    """Reservas de stock por cliente y producto, con vencimiento."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._backend = None
+        self._store = None
+        self._stamp = None  # Huella de la colección en la última carga
+        self._holds = {}
+        self._held = {}
+        self._heap = []
+        # Claves de reservas vencidas que siguen en disco (se borran en la
+        # próxima escritura, sin un barrido periódico)
+        self._expired = set()
+
+    def _ttl(self):
+        return getattr(settings, 'STORE_RESERVATION_TTL_SECONDS', DEFAULT_TTL_SECONDS)
+
+    # --- Carga y vencimientos ---
+
+    def _bind(self):
+        backend = get_storage_backend()
+        if backend is not self._backend:
+            # Cambió el backend (ej: en los tests): empezamos de cero.
+            self._backend = backend
+            self._store = backend.collection('reservations')
+            self._stamp = None
+        return self._store
+
+    def _sync(self):
+        """Relee la colección si cambió y libera las reservas vencidas."""
+        self._bind()
+        stamp = self._store.stamp()
+        now = time.time()
+        if stamp != self._stamp:
+            self._load(now)
+            self._stamp = stamp
+        self._expire(now)
+
+    def _load(self, now):
+        holds = {}
+        held = {}
+        expired = set()
+        for record in self._store.iter():
+            if record['expires_at'] <= now:
+                expired.add(record['id'])
+                continue
+            holds[record['id']] = record
+            held[record['product_id']] = held.get(record['product_id'], 0) + record['quantity']
+        heap = [(record['expires_at'], key) for key, record in holds.items()]
+        heapq.heapify(heap)
+        self._holds, self._held, self._heap, self._expired = holds, held, heap, expired
+
+    def _expire(self, now):
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            expires_at, key = heapq.heappop(heap)
+            record = self._holds.get(key)
+            if record is None or record['expires_at'] != expires_at:
+                continue # Ya liberada o renovada: entrada vieja del montículo
+            self._forget(key)
+            self._expired.add(key)
+
+    def _forget(self, key):
+        record = self._holds.pop(key, None)
+        if record is None:
+            return
+        product_id = record['product_id']
+        remaining = self._held.get(product_id, 0) - record['quantity']
+        if remaining > 0:
+            self._held[product_id] = remaining
+        else:
+            self._held.pop(product_id, None)
+
+    def _remember(self, record):
+        self._forget(record['id'])
+        self._holds[record['id']] = record
+        self._held[record['product_id']] = self._held.get(record['product_id'], 0) + record['quantity']
+        heapq.heappush(self._heap, (record['expires_at'], record['id']))
+
+    def _held_by_others(self, user_id, product_id):
+        total = self._held.get(product_id, 0)
+        if user_id is not None:
+            own = self._holds.get(_key(user_id, product_id))
+            if own:
+                total -= own['quantity']
+        return total
+
+    def _save(self, changed=(), released=()):
+        """Guarda los cambios (ya aplicados en memoria) con el candado tomado."""
+        try:
+            if changed:
+                self._store.put_many(changed)
+            # (Una vencida que el cliente volvió a reservar ya no se borra)
+            for key in set(released) | (self._expired - self._holds.keys()):
+                self._store.delete(key)
+            self._expired = set()
+        except Exception:
+            self._stamp = None # La próxima consulta relee del disco
+            raise
+        self._stamp = self._store.stamp()
+
+    # --- Métodos Públicos (APIs del Servicio) ---
+
+    def held(self, product_id, exclude_user=None):
+        """Unidades reservadas de un producto (sin contar las de 'exclude_user')."""
+        with self._lock:
+            self._sync()
+            return self._held_by_others(exclude_user, product_id)
+
+    def available(self, product_id, stock, user_id=None):
+        """Stock que 'user_id' puede llevarse: stock - reservas de los demás."""
+        return max(stock - self.held(product_id, exclude_user=user_id), 0)
+
+    def available_for(self, stocks, user_id=None):
+        """
+        Lo mismo que available() para varios productos de una vez.
+        'stocks' es {product_id: stock}; devuelve {product_id: disponible}.
+        """
+        with self._lock:
+            self._sync()
+            return {product_id: max(stock - self._held_by_others(user_id, product_id), 0)
+                    for product_id, stock in stocks.items()}
+
+    def hold(self, user_id, product_id, quantity, stock):
+        """
+        Reserva 'quantity' unidades (la cantidad TOTAL del cliente para ese
+        producto: reemplaza y renueva su reserva anterior). Devuelve False,
+        sin reservar nada, si no alcanza lo disponible.
+        """
+        return not self.hold_many(user_id, {product_id: quantity}, {product_id: stock})
+
+    def hold_many(self, user_id, quantities, stocks):
+        """
+        Reserva (o renueva) varias líneas en UNA escritura, ej: todo el
+        carrito al entrar al checkout. 'quantities' y 'stocks' son
+        {product_id: cantidad/stock}. Devuelve la lista de product_id que
+        NO se pudieron reservar (las demás quedan reservadas).
+        """
+        with self._lock, self._bind().lock():
+            self._sync()
+            expires_at = time.time() + self._ttl()
+            changed = []
+            released = []
+            rejected = []
+            for product_id, quantity in quantities.items():
+                key = _key(user_id, product_id)
+                if quantity <= 0:
+                    if key in self._holds:
+                        self._forget(key)
+                        released.append(key)
+                    continue
+                if quantity > stocks.get(product_id, 0) - self._held_by_others(user_id, product_id):
+                    rejected.append(product_id)
+                    continue
+                record = {
+                    "id": key,
+                    "user_id": user_id,
+                    "product_id": product_id,
+                    "quantity": quantity,
+                    "expires_at": expires_at
+                }
+                self._remember(record)
+                changed.append(record)
+            if changed or released or self._expired:
+                self._save(changed, released)
+            return rejected
+
+    def release(self, user_id, product_ids):
+        """Libera las reservas del cliente para esos productos (ej: al comprar)."""
+        with self._lock, self._bind().lock():
+            self._sync()
+            released = []
+            for product_id in product_ids:
+                key = _key(user_id, product_id)
+                if key in self._holds:
+                    self._forget(key)
+                    released.append(key)
+            if released or self._expired:
+                self._save(released=released)
+
+
+# --- Instancia compartida (una por proceso) ---
+
+_shared_service = None
+_shared_lock = threading.Lock()
+
+
+def get_reservation_service():
+    """Devuelve el ReservationService compartido del proceso (lo crea la primera vez)."""
+    global _shared_service
+    if _shared_service is None:
+        with _shared_lock:
+            if _shared_service is None:
+                _shared_service = ReservationService()
+    return _shared_service
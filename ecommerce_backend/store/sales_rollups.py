@@ -0,0 +1,247 @@
+# store/sales_rollups.py
+
+# Totales de ventas ya calculados ("rollups"), para los reportes del
+# admin. Antes no había reportes: había que bajar orders.json y sumar a
+# mano.
+#
+# Por cada (día, sucursal, producto, estado) se guarda:
+#     [recaudación, unidades, órdenes]
+#
+# Además, con producto = None, los totales de la ORDEN completa (así
+# "órdenes por día" no cuenta dos veces una orden con dos productos).
+#
+# Los mantiene el OrderIndex (ver order_index.py): cada alta suma su
+# orden y cada cambio de estado la resta con el estado viejo y la vuelve
+# a sumar con el nuevo. Como el índice se mantiene al día con lo que
+# escriben TODOS los workers, los totales también.
+#
+# Armarlos de cero (al cargar el historial) con NumPy, si está instalado:
+# de cada orden solo se leen sus campos (eso sí es Python, porque las
+# órdenes son dicts); las claves de cada fila, la agrupación y las sumas
+# son operaciones sobre arreglos. Sin NumPy, un bucle común (mismo
+# resultado, mismas filas en el mismo orden).
+
+from bisect import bisect_left, bisect_right, insort
+
+try:
+    import numpy
+except ImportError:  # NumPy es opcional
+    numpy = None
+
+# Campos por los que se puede agrupar una consulta
+GROUP_FIELDS = ('day', 'branch_id', 'product_id', 'status')
+
+
+def _order_rows(order):
+    """Las filas que aporta UNA orden: [(clave, recaudación, unidades), ...]."""
+    day = (order.get('created_at') or '')[:10]
+    branch_id = order.get('branch_id')
+    status = order.get('status', 'pending')
+    items = order.get('items') or []
+    rows = [((day, branch_id, None, status), order.get('total_amount') or 0,
+             sum(item.get('quantity', 0) for item in items))]
+    for item in items:
+        rows.append(((day, branch_id, item.get('product_id'), status),
+                     item.get('total_price') or 0, item.get('quantity', 0)))
+    return rows
+
+
+def _factorize(values):
+    """
+    (valores distintos, código de cada valor) con numpy.unique. None no se
+    puede ordenar junto a números: va aparte, como el ÚLTIMO valor.
+    """
+    if len(set(map(type, values))) == 1 and values[0] is not None:
+        # Todos del mismo tipo (números o textos): el caso rápido. (Con
+        # tipos mezclados NumPy convertiría, ej: 1 y '1' serían lo mismo.)
+        uniques, codes = numpy.unique(numpy.array(values), return_inverse=True)
+        return uniques.tolist() + [None], codes.reshape(-1)
+    array = numpy.array(values, dtype=object)
+    missing = numpy.equal(array, None)
+    uniques, codes = numpy.unique(array[~missing], return_inverse=True)
+    all_codes = numpy.full(len(array), len(uniques), dtype=numpy.int64)
+    all_codes[~missing] = codes.reshape(-1)
+    return list(uniques) + [None], all_codes
+
+
+def _vectorized_totals(orders):
+    """
+    Lo mismo que sumar _order_rows() de cada orden, con NumPy:
+    {(día, sucursal, producto, estado): (recaudación, unidades, órdenes)},
+    con las claves en el orden en que aparecen (como el bucle común).
+    """
+    # 1. Columnas: una posición por orden y una por línea de producto
+    days = [(order.get('created_at') or '')[:10] for order in orders]
+    branches = [order.get('branch_id') for order in orders]
+    statuses = [order.get('status', 'pending') for order in orders]
+    order_amounts = numpy.array([order.get('total_amount') or 0 for order in orders], dtype=float)
+    items = [order.get('items') or [] for order in orders]
+    item_counts = numpy.array([len(order_items) for order_items in items], dtype=numpy.int64)
+    lines = [item for order_items in items for item in order_items]
+    products = [item.get('product_id') for item in lines]
+    line_amounts = numpy.array([item.get('total_price') or 0 for item in lines], dtype=float)
+    line_units = numpy.array([item.get('quantity', 0) for item in lines], dtype=float)
+
+    # 2. Códigos numéricos de cada columna y de qué orden es cada línea
+    day_values, day_codes = _factorize(days)
+    branch_values, branch_codes = _factorize(branches)
+    status_values, status_codes = _factorize(statuses)
+    product_values, product_codes = _factorize(products)
+    order_of_line = numpy.repeat(numpy.arange(len(orders)), item_counts)
+    order_units = numpy.bincount(order_of_line, weights=line_units, minlength=len(orders))
+
+    # 3. Todas las filas en el orden de _order_rows(): cada orden y detrás
+    #    sus líneas (así las claves salen en el mismo orden que el bucle)
+    first_line = numpy.cumsum(item_counts) - item_counts
+    order_pos = numpy.arange(len(orders)) + first_line
+    line_pos = order_pos[order_of_line] + 1 + (numpy.arange(len(lines)) - first_line[order_of_line])
+    size = len(orders) + len(lines)
+
+    def rows(order_column, line_column, dtype):
+        column = numpy.empty(size, dtype=dtype)
+        column[order_pos] = order_column
+        column[line_pos] = line_column
+        return column
+
+    dims = (len(day_values), len(branch_values), len(product_values), len(status_values))
+    keys = numpy.ravel_multi_index((
+        rows(day_codes, day_codes[order_of_line], numpy.int64),
+        rows(branch_codes, branch_codes[order_of_line], numpy.int64),
+        rows(len(product_values) - 1, product_codes, numpy.int64),  # (None: fila de la orden)
+        rows(status_codes, status_codes[order_of_line], numpy.int64),
+    ), dims)
+    amounts = rows(order_amounts, line_amounts, float)
+    units = rows(order_units, line_units, float)
+
+    # 4. Agrupar: cada clave distinta recibe un número y bincount suma
+    #    todas sus filas de una vez
+    groups, first_row, group_of_row = numpy.unique(keys, return_index=True, return_inverse=True)
+    group_of_row = group_of_row.reshape(-1)
+    sums = list(zip(numpy.bincount(group_of_row, weights=amounts).tolist(),
+                    numpy.bincount(group_of_row, weights=units).round().astype(numpy.int64).tolist(),
+                    numpy.bincount(group_of_row).tolist()))
+    decoded = list(zip(*(codes.tolist() for codes in numpy.unravel_index(groups, dims))))
+
+    # 5. Volver a las claves de verdad (una vez por GRUPO, no por fila), en
+    #    el orden en que aparece cada clave por primera vez
+    totals = {}
+    for group in numpy.argsort(first_row, kind='stable').tolist():
+        d, b, p, s = decoded[group]
+        totals[(day_values[d], branch_values[b], product_values[p], status_values[s])] = sums[group]
+    return totals
+
+
+class SalesRollups:
+    """
+    Totales por (día, sucursal, producto, estado), en dos niveles:
+        by_day  día -> {(sucursal, producto, estado): [recaudación, unidades, órdenes]}
+        totals  (sucursal, producto, estado) -> [...] de TODO el historial
+    Con 'days' (lista ordenada) un rango de fechas se busca con bisect.
+    """
+
+    def __init__(self, orders=()):
+        self.by_day = {}
+        self.days = []
+        self.totals = {}
+        orders = list(orders)
+        if orders:
+            self._build(orders)
+
+    # --- Armado de cero ---
+
+    def _build(self, orders):
+        if numpy is not None:
+            totals = _vectorized_totals(orders)
+        else:
+            totals = {}
+            for order in orders:
+                for key, amount, quantity in _order_rows(order):
+                    row = totals.get(key)
+                    if row is None:
+                        totals[key] = (amount, quantity, 1)
+                    else:
+                        totals[key] = (row[0] + amount, row[1] + quantity, row[2] + 1)
+        for (day, *rest), (amount, quantity, count) in totals.items():
+            self._add_row(day, tuple(rest), amount, quantity, count)
+        self.days = sorted(self.by_day)
+
+    # --- Guardar y juntar (archivo de órdenes, ver order_archive.py) ---
+
+    def to_rows(self):
+        """Lista de filas [día, sucursal, producto, estado, recaudación, unidades, órdenes]."""
+        return [[day, *key, *values] for day in self.days for key, values in self.by_day[day].items()]
+
+    def add_rows(self, rows):
+        """Suma filas de to_rows() (ej: los totales de un segmento archivado)."""
+        for day, branch_id, product_id, status, amount, quantity, count in rows:
+            if day not in self.by_day:
+                insort(self.days, day)
+            self._add_row(day, (branch_id, product_id, status), amount, quantity, count)
+
+    # --- Mantenimiento (lo llama OrderIndex) ---
+
+    def add(self, order):
+        for (day, *rest), amount, quantity in _order_rows(order):
+            if day not in self.by_day:
+                insort(self.days, day)
+            self._add_row(day, tuple(rest), amount, quantity, 1)
+
+    def remove(self, order):
+        for (day, *rest), amount, quantity in _order_rows(order):
+            self._add_row(day, tuple(rest), -amount, -quantity, -1)
+            if day in self.by_day and not self.by_day[day]:
+                del self.by_day[day]
+                position = bisect_left(self.days, day)
+                if position < len(self.days) and self.days[position] == day:
+                    del self.days[position]
+
+    def _add_row(self, day, key, amount, quantity, count):
+        for rows in (self.by_day.setdefault(day, {}), self.totals):
+            row = rows.get(key)
+            if row is None:
+                row = rows[key] = [0, 0, 0]
+            row[0] += amount
+            row[1] += quantity
+            row[2] += count
+            if row[2] <= 0:
+                del rows[key]
+
+    # --- Consultas ---
+
+    def query(self, start=None, end=None, branch_id=None, product_id=None,
+              status=None, group_by=('day',), into=None):
+        """
+        Suma las filas que cumplen los filtros, agrupadas por 'group_by'
+        (campos de GROUP_FIELDS). Devuelve {grupo: [recaudación, unidades,
+        órdenes]}; con 'into' suma sobre un resultado anterior (así se
+        juntan las órdenes calientes y las archivadas).
+
+        Sin producto (ni filtro ni agrupado) se usan las filas de la
+        orden completa. Solo se recorren los días del rango pedido (o
+        'totals' si no hace falta el día).
+        """
+        by_product = product_id is not None or 'product_id' in group_by
+        if start is None and end is None and 'day' not in group_by:
+            sources = [(None, self.totals)]
+        else:
+            low = 0 if start is None else bisect_left(self.days, start)
+            high = len(self.days) if end is None else bisect_right(self.days, end)
+            sources = [(day, self.by_day[day]) for day in self.days[low:high]]
+        result = {} if into is None else into
+        for day, rows in sources:
+            for (row_branch, row_product, row_status), (amount, quantity, count) in rows.items():
+                if (row_product is None) == by_product:
+                    continue
+                if ((branch_id is not None and row_branch != branch_id)
+                        or (product_id is not None and row_product != product_id)
+                        or (status is not None and row_status != status)):
+                    continue
+                values = {'day': day, 'branch_id': row_branch, 'product_id': row_product, 'status': row_status}
+                group = tuple(values[field] for field in group_by)
+                total = result.get(group)
+                if total is None:
+                    total = result[group] = [0, 0, 0]
+                total[0] += amount
+                total[1] += quantity
+                total[2] += count
+        return result
@@ -0,0 +1,795 @@
+# store/storage.py
+
+# Capa de "almacenamiento": los servicios (ProductService, CartService,
+# OrderService, UserService, BranchService) ya no abren archivos ellos
+# mismos. Le piden a un "backend" una colección y trabajan con ella:
+#
+#   coleccion = get_storage_backend().collection('products')
+#   coleccion.all()               -> lista de dicts
+#   coleccion.iter()              -> los mismos dicts, de a uno (sin lista)
+#   coleccion.get(101)            -> dict o None
+#   coleccion.put(101, {...})     -> crea o reemplaza ESE registro
+#   coleccion.put_many([...])     -> varios registros en UNA escritura
+#   coleccion.delete(101)         -> True/False
+#   coleccion.replace_all([...])  -> reemplaza todo
+#   coleccion.stamp()             -> "huella" que cambia con cada escritura
+#   with coleccion.lock(): ...    -> candado entre procesos (ver file_io.py)
+#
+# Y un contador de IDs por entidad (ver JsonSequences/SqliteSequences):
+#
+#   get_storage_backend().sequences().next_id('products')  -> 206
+#
+# Y el archivo de órdenes viejas (solo JSON; en SQLite devuelve None):
+#
+#   get_storage_backend().order_archive()  -> OrderArchive (order_archive.py)
+#
+# Hay dos backends (se elige con settings.STORE_STORAGE_BACKEND):
+#   - 'json'   : los mismos archivos de siempre en store/data/.
+#   - 'sqlite' : una base SQLite (modo WAL) con tablas indexadas.
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from .file_io import locked, atomic_write_json, file_stamp
+from .order_store import DocumentOrderStore, JournalOrderStore, FIRST_ORDER_ID, DEFAULT_COMPACT_EVERY
+from .order_index import OrderIndex
+from .order_archive import OrderArchive
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DATA_DIR = os.path.join(BASE_DIR, 'data')
+
+# Nombre de cada colección -> (archivo JSON, campo que hace de clave)
+JSON_COLLECTIONS = {
+    'categories': ('categories.json', 'id'),
+    'products': ('products.json', 'id'),
+    'users': ('users.json', 'id'),
+    'branches': ('sucursales.json', 'id'),
+    'carts': ('carts.json', 'user_id'),
+    # Checkouts en curso (ver checkout_service.py): un archivo por checkout
+    'checkouts': ('checkouts', 'id'),
+    # Reservas de stock vigentes (ver reservation_service.py): un archivo
+    # por reserva en data/reservations/ (migra reservations.json si existe)
+    'reservations': ('reservations.json', 'id'),
+    # Respuestas guardadas por clave de idempotencia (ver idempotency_store.py):
+    # un archivo por clave
+    'idempotency': ('idempotency', 'id'),
+}
+
+
+# =====================================================================
+# Backend JSON (los archivos de siempre)
+# =====================================================================
+
+class JsonListCollection:
+    """Colección guardada como una LISTA de dicts (products.json, users.json...)."""
+
+    def __init__(self, path, key):
+        self.path = path
+        self.key = key
+
+    def _read(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return []
+        except json.JSONDecodeError as e:
+            print(f"Error leyendo {self.path}: {e}")
+            return []
+
+    def _write(self, records):
+        # Temporal + os.replace: nunca queda un archivo cortado a la mitad.
+        atomic_write_json(self.path, records)
+
+    def lock(self):
+        return locked(self.path)
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def stamp(self):
+        return file_stamp(self.path)
+
+    def all(self):
+        return self._read()
+
+    def iter(self):
+        """Recorre los registros uno por uno."""
+        return iter(self.all())
+
+    def get(self, key):
+        return next((r for r in self._read() if r.get(self.key) == key), None)
+
+    def put(self, key, record):
+        # En JSON no hay "actualizar una fila": leemos, cambiamos ESE
+        # registro y reescribimos el archivo (con el candado tomado, para
+        # no perder lo que otro worker haya escrito en el medio).
+        with self.lock():
+            records = self._read()
+            for i, existing in enumerate(records):
+                if existing.get(self.key) == key:
+                    records[i] = record
+                    break
+            else:
+                records.append(record)
+            self._write(records)
+
+    def put_many(self, records):
+        """Crea o reemplaza varios registros reescribiendo el archivo UNA vez."""
+        changes = {r[self.key]: r for r in records}
+        with self.lock():
+            current = self._read()
+            merged = [changes.pop(r.get(self.key), r) for r in current]
+            merged.extend(changes.values())
+            self._write(merged)
+
+    def delete(self, key):
+        with self.lock():
+            records = self._read()
+            remaining = [r for r in records if r.get(self.key) != key]
+            if len(remaining) == len(records):
+                return False
+            self._write(remaining)
+            return True
+
+    def replace_all(self, records):
+        with self.lock():
+            self._write(list(records))
+
+
+class JsonDictCollection(JsonListCollection):
+    """Colección guardada como un DICT {clave: registro} (carts.json)."""
+
+    def _read(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except json.JSONDecodeError as e:
+            print(f"Error leyendo {self.path}: {e}")
+            return {}
+
+    def all(self):
+        return list(self._read().values())
+
+    def get(self, key):
+        return self._read().get(str(key))
+
+    def put(self, key, record):
+        with self.lock():
+            records = self._read()
+            records[str(key)] = record
+            self._write(records)
+
+    def put_many(self, records):
+        with self.lock():
+            current = self._read()
+            current.update({str(r[self.key]): r for r in records})
+            self._write(current)
+
+    def delete(self, key):
+        with self.lock():
+            records = self._read()
+            if str(key) not in records:
+                return False
+            del records[str(key)]
+            self._write(records)
+            return True
+
+    def replace_all(self, records):
+        with self.lock():
+            self._write({str(r[self.key]): r for r in records})
+
+
+class JsonShardedCollection:
+    """
+    Colección con UN archivo por registro: data/carts/<user_id>.json
+    (también las reservas, los checkouts en curso y las claves de
+    idempotencia).
+
+    Leer o guardar el carrito de un usuario abre solo SU archivo, así que
+    el costo no depende de cuántos carritos haya y dos clientes distintos
+    nunca se pisan. Recorrer todos (panel de admin) es un iterador que va
+    abriendo los archivos de a uno.
+
+    Con versioned=True cada escritura sube además un contador guardado en
+    '<carpeta>/_version', y stamp() lo devuelve. Es para quien necesita
+    enterarse SIEMPRE de lo que escribió otro worker (las reservas): el
+    mtime de la carpeta solo tiene la precisión del reloj del kernel y dos
+    escrituras muy seguidas pueden dejarlo igual.
+    """
+
+    def __init__(self, directory, key, legacy_path=None, versioned=False):
+        self.directory = directory
+        self.key = key
+        self.versioned = versioned
+        os.makedirs(directory, exist_ok=True)
+        if legacy_path and os.path.exists(legacy_path):
+            with self.lock():
+                # Volvemos a mirar: otro worker pudo migrarlo mientras esperábamos.
+                if os.path.exists(legacy_path):
+                    self._migrate_from(legacy_path)
+
+    def _migrate_from(self, legacy_path):
+        """Reparte (una sola vez) el viejo archivo único (ej: carts.json) en un archivo por registro."""
+        legacy = JsonDictCollection(legacy_path, self.key)
+        for record in legacy.all():
+            if not os.path.exists(self._path(record[self.key])):
+                self.put(record[self.key], record)
+        os.replace(legacy_path, legacy_path + '.migrated')
+        print(f"Registros migrados de {legacy_path} a {self.directory}")
+
+    def _path(self, key):
+        key = str(key)
+        if not key.isdigit():
+            # Nombres de archivo seguros aunque la clave no sea un número
+            key = 'k_' + hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, key + '.json')
+
+    def _read_file(self, path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except json.JSONDecodeError as e:
+            print(f"Error leyendo {path}: {e}")
+            return None
+
+    def lock(self):
+        return locked(self.directory)
+
+    def exists(self):
+        return os.path.isdir(self.directory)
+
+    def stamp(self):
+        if self.versioned:
+            return self._read_version()
+        # El mtime del directorio cambia al crear/borrar archivos.
+        return file_stamp(self.directory)
+
+    def _version_path(self):
+        return os.path.join(self.directory, '_version')
+
+    def _read_version(self):
+        try:
+            with open(self._version_path(), 'r', encoding='utf-8') as f:
+                return int(f.read() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    @contextmanager
+    def _writing(self):
+        """Envuelve una escritura: con versioned=True, sube el contador."""
+        if not self.versioned:
+            yield
+            return
+        with self.lock():
+            try:
+                yield
+            finally:
+                atomic_write_json(self._version_path(), self._read_version() + 1)
+
+    def iter(self):
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.name.endswith('.json'):
+                    record = self._read_file(entry.path)
+                    if record is not None:
+                        yield record
+
+    def all(self):
+        return list(self.iter())
+
+    def get(self, key):
+        return self._read_file(self._path(key))
+
+    def put(self, key, record):
+        # Cada archivo tiene un solo registro: con reemplazarlo de forma
+        # atómica alcanza (no hace falta leer nada antes).
+        with self._writing():
+            atomic_write_json(self._path(key), record)
+
+    def put_many(self, records):
+        with self._writing():
+            for record in records:
+                atomic_write_json(self._path(record[self.key]), record)
+
+    def delete(self, key):
+        with self._writing():
+            try:
+                os.remove(self._path(key))
+                return True
+            except FileNotFoundError:
+                return False
+
+    def replace_all(self, records):
+        for record in self.all():
+            self.delete(record[self.key])
+        for record in records:
+            self.put(record[self.key], record)
+
+
+class JsonStorageBackend:
+    """Backend por defecto: un archivo JSON por colección en 'data_dir'."""
+
+    name = 'json'
+
+    def __init__(self, data_dir=DEFAULT_DATA_DIR, order_storage='journal',
+                 compact_every=DEFAULT_COMPACT_EVERY, cart_storage='sharded',
+                 archive_window='month'):
+        self.data_dir = str(data_dir)
+        self._collections = {}
+        for name, (filename, key) in JSON_COLLECTIONS.items():
+            path = os.path.join(self.data_dir, filename)
+            if name == 'carts' and cart_storage == 'sharded':
+                # Un archivo por usuario en data/carts/ (migra carts.json si existe)
+                collection = JsonShardedCollection(
+                    os.path.join(self.data_dir, 'carts'), key, legacy_path=path
+                )
+            elif name == 'reservations':
+                # Un archivo por reserva en data/reservations/: reservar o
+                # liberar escribe solo esa reserva, no todas.
+                collection = JsonShardedCollection(
+                    os.path.join(self.data_dir, 'reservations'), key, legacy_path=path, versioned=True
+                )
+            elif name == 'carts':
+                collection = JsonDictCollection(path, key)
+            elif name in ('checkouts', 'idempotency'):
+                collection = JsonShardedCollection(path, key)
+            else:
+                collection = JsonListCollection(path, key)
+            self._collections[name] = collection
+
+        orders_file = os.path.join(self.data_dir, 'orders.json')
+        if order_storage == 'document':
+            self._orders = DocumentOrderStore(orders_file)
+        else:
+            self._orders = JournalOrderStore(
+                orders_file, os.path.join(self.data_dir, 'orders.journal'), compact_every
+            )
+
+        self._sequences = JsonSequences(os.path.join(self.data_dir, 'sequences.json'), self)
+        # Órdenes viejas, en segmentos comprimidos (ver order_archive.py)
+        self._order_archive = OrderArchive(os.path.join(self.data_dir, 'orders_archive'), archive_window)
+
+    def collection(self, name):
+        return self._collections[name]
+
+    def orders(self):
+        return self._orders
+
+    def order_archive(self):
+        return self._order_archive
+
+    def sequences(self):
+        return self._sequences
+
+
+class JsonSequences:
+    """
+    Contadores de IDs, uno por entidad, guardados en 'sequences.json':
+        {"categories": 6, "products": 206, "users": 8}
+
+    next_id() toma el candado del archivo, así dos workers nunca reciben
+    el mismo ID (antes cada servicio calculaba max(ids) + 1 sobre toda la
+    colección, y dos workers a la vez podían repetir el número).
+
+    La primera vez que un proceso pide un ID de una entidad, el contador
+    se "siembra" con el ID más alto que ya existe en su colección (por si
+    el archivo no existía o quedó atrasado respecto de los datos).
+    """
+
+    def __init__(self, path, backend):
+        self.path = path
+        self._backend = backend
+        self._seeded = set()  # Entidades ya sembradas en este proceso
+
+    def _read(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except json.JSONDecodeError as e:
+            # Se vuelve a sembrar desde las colecciones: no se pierde nada.
+            print(f"Advertencia: {self.path} inválido ({e}), se vuelve a sembrar.")
+            self._seeded.clear()
+            return {}
+
+    def _max_key(self, name):
+        collection = self._backend.collection(name)
+        return max((r[collection.key] for r in collection.iter()), default=0)
+
+    def next_id(self, name):
+        """Devuelve el próximo ID de 'name' (y lo deja reservado)."""
+        with locked(self.path):
+            counters = self._read()
+            next_id = counters.get(name, 1)
+            if name not in self._seeded:
+                next_id = max(next_id, self._max_key(name) + 1)
+                self._seeded.add(name)
+            counters[name] = next_id + 1
+            atomic_write_json(self.path, counters)
+            return next_id
+
+
+# =====================================================================
+# Backend SQLite
+# =====================================================================
+
+# Cada tabla guarda el registro completo en 'data' (JSON) y, aparte,
+# las columnas por las que buscamos (con índice).
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS categories (id INTEGER PRIMARY KEY, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS products (
+    id INTEGER PRIMARY KEY, category_id INTEGER, branch_id INTEGER, data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS products_category_idx ON products (category_id);
+CREATE INDEX IF NOT EXISTS products_branch_idx ON products (branch_id);
+CREATE TABLE IF NOT EXISTS users (id INTEGER PRIMARY KEY, username TEXT, data TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS users_username_idx ON users (username COLLATE NOCASE);
+CREATE TABLE IF NOT EXISTS branches (id INTEGER PRIMARY KEY, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS carts (user_id TEXT PRIMARY KEY, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS checkouts (id TEXT PRIMARY KEY, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS reservations (id TEXT PRIMARY KEY, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS idempotency (id TEXT PRIMARY KEY, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS orders (
+    id INTEGER PRIMARY KEY, user_id INTEGER, branch_id INTEGER, status TEXT,
+    created_at TEXT, data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS orders_user_idx ON orders (user_id);
+CREATE INDEX IF NOT EXISTS orders_branch_idx ON orders (branch_id);
+CREATE INDEX IF NOT EXISTS orders_status_idx ON orders (status);
+CREATE INDEX IF NOT EXISTS orders_created_idx ON orders (created_at);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+"""
+
+# Tabla -> (columna clave, {columna indexada: campo del registro})
+SQLITE_TABLES = {
+    'categories': ('id', {}),
+    'products': ('id', {'category_id': 'category_id', 'branch_id': 'branch_id'}),
+    'users': ('id', {'username': 'username'}),
+    'branches': ('id', {}),
+    'carts': ('user_id', {}),
+    'checkouts': ('id', {}),
+    'reservations': ('id', {}),
+    'idempotency': ('id', {}),
+    'orders': ('id', {'user_id': 'user_id', 'branch_id': 'branch_id',
+                      'status': 'status', 'created_at': 'created_at'}),
+}
+
+
+class SqliteStorageBackend:
+    """
+    Backend SQLite (stdlib 'sqlite3').
+
+    - Modo WAL: los lectores no bloquean al que escribe (y viceversa), y
+      varios workers de gunicorn pueden escribir sin pisarse.
+    - Una conexión por hilo (y por proceso, por si gunicorn hace fork).
+    - Cada escritura sube la "versión" de su colección en la tabla 'meta'
+      dentro de la misma transacción: es la huella que usan los servicios
+      para saber si lo que tienen en memoria quedó viejo.
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        conn = self._connection()
+        conn.executescript(SQLITE_SCHEMA)
+        self._collections = {
+            name: SqliteCollection(self, name, key, columns)
+            for name, (key, columns) in SQLITE_TABLES.items() if name != 'orders'
+        }
+        self._orders = SqliteOrderStore(self)
+        self._sequences = SqliteSequences(self)
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            # isolation_level=None: nosotros manejamos BEGIN/COMMIT.
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """BEGIN IMMEDIATE ... COMMIT (o ROLLBACK si algo falla)."""
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def execute(self, sql, params=()):
+        return self._connection().execute(sql, params)
+
+    def bump_version(self, conn, name):
+        conn.execute(
+            "INSERT INTO meta (key, value) VALUES (?, 1) "
+            "ON CONFLICT(key) DO UPDATE SET value = value + 1",
+            (f'version:{name}',)
+        )
+
+    def version(self, name):
+        row = self.execute("SELECT value FROM meta WHERE key = ?", (f'version:{name}',)).fetchone()
+        return row[0] if row else 0
+
+    def collection(self, name):
+        return self._collections[name]
+
+    def orders(self):
+        return self._orders
+
+    def order_archive(self):
+        # La tabla 'orders' ya tiene índices: no hace falta partirla.
+        return None
+
+    def sequences(self):
+        return self._sequences
+
+    def import_from(self, source):
+        """
+        Importación de una sola vez: copia TODO lo que tenga otro backend
+        (normalmente el JSON) a esta base. Reemplaza lo que hubiera.
+        """
+        counts = {}
+        for name in self._collections:
+            records = source.collection(name).all()
+            self._collections[name].replace_all(records)
+            counts[name] = len(records)
+        # Las órdenes calientes y las archivadas (si el origen tiene archivo)
+        orders = {order['id']: order for order in source.orders().list_orders()}
+        archive = source.order_archive()
+        if archive is not None:
+            for order in archive.all():
+                orders.setdefault(order['id'], order)
+        orders = [orders[order_id] for order_id in sorted(orders)]
+        self._orders.replace_all(orders)
+        counts['orders'] = len(orders)
+        return counts
+
+
+class SqliteSequences:
+    """
+    Los mismos contadores que JsonSequences, en la tabla 'meta'
+    ('sequence:products' -> próximo ID). Leer y subir el contador van en
+    la misma transacción (BEGIN IMMEDIATE), así que no hay repetidos.
+    """
+
+    def __init__(self, backend):
+        self._backend = backend
+        self._seeded = set()
+
+    def next_id(self, name):
+        """Devuelve el próximo ID de 'name' (y lo deja reservado)."""
+        key = f'sequence:{name}'
+        with self._backend.transaction() as conn:
+            row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+            next_id = row[0] if row else 1
+            if name not in self._seeded:
+                column = SQLITE_TABLES[name][0]
+                (max_id,) = conn.execute(f"SELECT MAX({column}) FROM {name}").fetchone()
+                next_id = max(next_id, (max_id or 0) + 1)
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, next_id + 1))
+        self._seeded.add(name)
+        return next_id
+
+
+class SqliteCollection:
+    """Una tabla de SQLite con la misma interfaz que las colecciones JSON."""
+
+    def __init__(self, backend, table, key, columns):
+        self._backend = backend
+        self.table = table
+        self.key = key
+        self._columns = columns  # {columna: campo del registro}
+        names = [key] + list(columns) + ['data']
+        self._upsert_sql = (
+            f"INSERT OR REPLACE INTO {table} ({', '.join(names)}) "
+            f"VALUES ({', '.join('?' for _ in names)})"
+        )
+
+    def _row(self, key, record):
+        return ([key] + [record.get(field) for field in self._columns.values()]
+                + [json.dumps(record, ensure_ascii=False)])
+
+    def _key(self, key):
+        # Los carritos usan el user_id como texto (igual que en carts.json)
+        return str(key) if self.key == 'user_id' else key
+
+    def lock(self):
+        # Las escrituras ya son transacciones; este candado sirve para
+        # agrupar "leer versión + escribir" (ver catalog_repository.py).
+        return locked(f"{self._backend.path}.{self.table}")
+
+    def exists(self):
+        return self._backend.execute(f"SELECT 1 FROM {self.table} LIMIT 1").fetchone() is not None
+
+    def stamp(self):
+        return self._backend.version(self.table)
+
+    def all(self):
+        return list(self.iter())
+
+    def iter(self):
+        # El cursor de sqlite3 trae las filas a medida que las pedimos.
+        rows = self._backend.execute(f"SELECT data FROM {self.table} ORDER BY rowid")
+        return (json.loads(data) for (data,) in rows)
+
+    def get(self, key):
+        row = self._backend.execute(
+            f"SELECT data FROM {self.table} WHERE {self.key} = ?", (self._key(key),)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, key, record):
+        with self._backend.transaction() as conn:
+            conn.execute(self._upsert_sql, self._row(self._key(key), record))
+            self._backend.bump_version(conn, self.table)
+
+    def put_many(self, records):
+        # Todos los registros en UNA transacción (o ninguno).
+        with self._backend.transaction() as conn:
+            conn.executemany(self._upsert_sql, [self._row(self._key(r[self.key]), r) for r in records])
+            self._backend.bump_version(conn, self.table)
+
+    def delete(self, key):
+        with self._backend.transaction() as conn:
+            cursor = conn.execute(f"DELETE FROM {self.table} WHERE {self.key} = ?", (self._key(key),))
+            self._backend.bump_version(conn, self.table)
+        return cursor.rowcount > 0
+
+    def replace_all(self, records):
+        with self._backend.transaction() as conn:
+            conn.execute(f"DELETE FROM {self.table}")
+            conn.executemany(self._upsert_sql, [self._row(self._key(r[self.key]), r) for r in records])
+            self._backend.bump_version(conn, self.table)
+
+
+class SqliteOrderStore(SqliteCollection):
+    """
+    Órdenes en SQLite, con la misma interfaz que los stores de order_store.py.
+
+    Igual que ellos mantiene un OrderIndex en memoria; se rearma solo
+    cuando la versión de la tabla 'orders' cambia por una escritura de
+    otro proceso.
+    """
+
+    def __init__(self, backend):
+        key, columns = SQLITE_TABLES['orders']
+        super().__init__(backend, 'orders', key, columns)
+        self._lock = threading.RLock()
+        self._index = None
+        self._index_version = None  # Versión de la tabla cuando armamos el índice
+
+    def index(self):
+        """El OrderIndex, al día con la tabla 'orders'."""
+        with self._lock:
+            version = self.stamp()
+            if self._index is None or version != self._index_version:
+                self._index = OrderIndex(self.iter())
+                self._index_version = version
+            return self._index
+
+    def _track(self, conn, update_index):
+        """
+        Sube la versión de la tabla y, si nadie más había escrito desde que
+        armamos el índice, devuelve la función que lo actualiza (se aplica
+        recién después del COMMIT).
+        """
+        row = conn.execute("SELECT value FROM meta WHERE key = ?", (f'version:{self.table}',)).fetchone()
+        before = row[0] if row else 0
+        self._backend.bump_version(conn, self.table)
+        if self._index is None or before != self._index_version:
+            return None
+        def apply():
+            update_index(self._index)
+            self._index_version = before + 1
+        return apply
+
+    def list_orders(self):
+        return self.index().all()
+
+    def get_order(self, order_id):
+        return self.index().get(order_id)
+
+    def insert_order(self, order):
+        with self._lock:
+            with self._backend.transaction() as conn:
+                row = conn.execute("SELECT value FROM meta WHERE key = 'next_order_id'").fetchone()
+                order['id'] = row[0] if row else FIRST_ORDER_ID
+                conn.execute(self._upsert_sql, self._row(order['id'], order))
+                conn.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('next_order_id', ?)", (order['id'] + 1,)
+                )
+                apply = self._track(conn, lambda index: index.add(order))
+            self._apply_or_invalidate(apply)
+        return order
+
+    def update_order(self, order_id, changes):
+        # Actualización de UNA fila (sin tocar el resto del historial).
+        with self._lock:
+            with self._backend.transaction() as conn:
+                row = conn.execute("SELECT data FROM orders WHERE id = ?", (order_id,)).fetchone()
+                if not row:
+                    return None
+                order = json.loads(row[0])
+                order.update(changes)
+                conn.execute(self._upsert_sql, self._row(order_id, order))
+                apply = self._track(conn, lambda index: index.update(index.get(order_id), changes))
+            self._apply_or_invalidate(apply)
+        return order
+
+    def _apply_or_invalidate(self, apply):
+        if apply is not None:
+            apply()
+        else:
+            self._index = None  # Se rearma en el próximo index()
+
+    def replace_all(self, records):
+        super().replace_all(records)
+        next_id = max((o['id'] for o in records), default=FIRST_ORDER_ID - 1) + 1
+        with self._backend.transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('next_order_id', ?)", (next_id,)
+            )
+
+
+# =====================================================================
+# Backend compartido (uno por proceso)
+# =====================================================================
+
+_shared_backend = None
+_shared_lock = threading.Lock()
+
+
+def create_storage_backend(name=None):
+    """Crea un backend según settings (o según 'name', si se indica)."""
+    name = name or getattr(settings, 'STORE_STORAGE_BACKEND', 'json')
+    data_dir = getattr(settings, 'STORE_DATA_DIR', DEFAULT_DATA_DIR)
+    if name == 'sqlite':
+        path = getattr(settings, 'STORE_SQLITE_PATH', None) or os.path.join(str(data_dir), 'store.sqlite3')
+        return SqliteStorageBackend(path)
+    if name == 'json':
+        return JsonStorageBackend(
+            data_dir,
+            order_storage=getattr(settings, 'STORE_ORDER_STORAGE', 'journal'),
+            compact_every=getattr(settings, 'STORE_ORDER_JOURNAL_COMPACT_EVERY', DEFAULT_COMPACT_EVERY),
+            cart_storage=getattr(settings, 'STORE_CART_STORAGE', 'sharded'),
+            archive_window=getattr(settings, 'STORE_ORDER_ARCHIVE_WINDOW', 'month'),
+        )
+    raise ValueError(f"STORE_STORAGE_BACKEND desconocido: {name!r} (usar 'json' o 'sqlite')")
+
+
+def get_storage_backend():
+    """Devuelve el backend del proceso (lo crea la primera vez)."""
+    global _shared_backend
+    if _shared_backend is None:
+        with _shared_lock:
+            if _shared_backend is None:
+                _shared_backend = create_storage_backend()
+    return _shared_backend
+
+
+def reset_storage_backend():
+    """Olvida el backend actual (por ej. en tests, después de cambiar settings)."""
+    global _shared_backend
+    with _shared_lock:
+        _shared_backend = None
@@ -1,3 +1,917 @@
-from django.test import TestCase
+import multiprocessing
+import os
+import shutil
+import csv
+import io
+import json
+import tempfile
+import threading
+import time
+from datetime import datetime
+from unittest import mock, skipUnless
+
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.contrib.sessions.backends.signed_cookies import SessionStore
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from . import decorators, exports, sales_rollups, views
+from .catalog_indexes import price_bucket, sort_key
+
+from .branch_service import BranchService
+from .cart_service import CartService
+from .catalog_repository import get_catalog_repository
+from .checkout_service import CheckoutError, CheckoutService
+from .idempotency_store import IdempotencyStore
+from .models import Cart
+from .order_service import OrderService
+from .order_store import JournalOrderStore
+from .product_service import ProductService
+from .reservation_service import ReservationService
+from .storage import get_storage_backend, reset_storage_backend
 
 # Create your tests here.
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+
+WORKERS = 6
+ITERATIONS = 30
+
+
+def _hammer(worker):
+    """Lo que corre cada proceso: crea órdenes y guarda carritos sin parar."""
+    reset_storage_backend()  # Cada proceso abre su propio backend
+    orders = OrderService()
+    carts = CartService()
+    for i in range(ITERATIONS):
+        user_id = worker * 1000 + i
+        orders.create_order(user_id=user_id, cart_data={'items': {}}, user_data={})
+        cart = Cart(user_id=user_id)
+        cart.add_item(101, i + 1)
+        carts.save_cart(cart)
+
+
+STOCK = WORKERS * ITERATIONS
+
+
+def _hammer_product(worker):
+    """
+    Los workers pares venden (descuentan stock) y los impares editan el
+    mismo producto desde el panel: ninguna edición puede pisar una venta.
+    """
+    reset_storage_backend()
+    products = ProductService()
+    for i in range(ITERATIONS):
+        if worker % 2 == 0:
+            result = products.decrement_stock({101: 1}, retries=1000)
+            assert result['success'], result
+        else:
+            assert products.update_product(101, {'title': f'Torta {worker}-{i}'}) is not None
+
+
+def _seed_catalog():
+    """Una categoría y un producto con stock de sobra, en el backend configurado."""
+    backend = get_storage_backend()
+    backend.collection('categories').put(1, {'id': 1, 'name': 'Tortas'})
+    backend.collection('products').put(101, {
+        'id': 101, 'title': 'Torta', 'description': '', 'price': 100.0, 'stock': STOCK,
+        'category_id': 1, 'branch_id': 1, 'image_url': None, 'type': 'cake', 'weight': 1.0
+    })
+
+
+@skipUnless(hasattr(os, 'fork'), "Necesita fork() para lanzar varios procesos")
+class ConcurrentWritersTests(SimpleTestCase):
+    """
+    Varios procesos (como los workers de gunicorn) escribiendo a la vez
+    sobre los mismos archivos: no se tiene que perder ninguna escritura.
+    """
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.data_dir, ignore_errors=True)
+        self.addCleanup(reset_storage_backend)
+
+    def _run_workers(self, target=_hammer):
+        context = multiprocessing.get_context('fork')
+        processes = [context.Process(target=target, args=(n,)) for n in range(WORKERS)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+            self.assertEqual(process.exitcode, 0)
+        reset_storage_backend()
+
+    def _assert_nothing_lost(self):
+        orders = OrderService().get_all_orders()
+        ids = [o['id'] for o in orders]
+        self.assertEqual(len(orders), WORKERS * ITERATIONS)
+        self.assertEqual(len(set(ids)), len(ids), "Se repitieron IDs de orden")
+
+        carts = CartService().get_all_carts()
+        self.assertEqual(len(carts), WORKERS * ITERATIONS)
+        for user_id, cart in carts.items():
+            quantity = int(user_id) % 1000 + 1
+            self.assertEqual(cart['items']['101']['quantity'], quantity)
+
+    def _assert_no_sale_lost(self):
+        sold = (WORKERS + 1) // 2 * ITERATIONS  # Lo que vendieron los workers pares
+        product = ProductService().get_product_by_id(101)
+        self.assertEqual(product['stock'], STOCK - sold)
+        self.assertTrue(product['title'].startswith('Torta '))
+
+    def test_json_products_edited_while_selling(self):
+        with override_settings(STORE_DATA_DIR=self.data_dir, STORE_STORAGE_BACKEND='json',
+                               STORE_FSYNC=False):
+            reset_storage_backend()
+            _seed_catalog()
+            self._run_workers(_hammer_product)
+            self._assert_no_sale_lost()
+
+    def test_sqlite_products_edited_while_selling(self):
+        with override_settings(STORE_STORAGE_BACKEND='sqlite',
+                               STORE_SQLITE_PATH=os.path.join(self.data_dir, 'store.sqlite3')):
+            reset_storage_backend()
+            _seed_catalog()
+            self._run_workers(_hammer_product)
+            self._assert_no_sale_lost()
+
+    def test_journal_orders_and_single_carts_file(self):
+        with override_settings(STORE_DATA_DIR=self.data_dir, STORE_STORAGE_BACKEND='json',
+                               STORE_ORDER_STORAGE='journal', STORE_ORDER_JOURNAL_COMPACT_EVERY=25,
+                               STORE_CART_STORAGE='single', STORE_FSYNC=False):
+            self._run_workers()
+            self._assert_nothing_lost()
+
+    def test_document_orders_and_sharded_carts(self):
+        with override_settings(STORE_DATA_DIR=self.data_dir, STORE_STORAGE_BACKEND='json',
+                               STORE_ORDER_STORAGE='document', STORE_CART_STORAGE='sharded',
+                               STORE_FSYNC=False):
+            self._run_workers()
+            self._assert_nothing_lost()
+
+    def test_sqlite_backend(self):
+        with override_settings(STORE_STORAGE_BACKEND='sqlite',
+                               STORE_SQLITE_PATH=os.path.join(self.data_dir, 'store.sqlite3')):
+            reset_storage_backend()
+            self._run_workers()
+            self._assert_nothing_lost()
+
+
+@skipUnless(hasattr(os, 'fork'), "Necesita fork() para lanzar otro proceso")
+class JournalCompactionTests(SimpleTestCase):
+    """Un worker lee el journal justo cuando otro compacta."""
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.data_dir, ignore_errors=True)
+        self.enterContext(override_settings(STORE_FSYNC=False))
+
+    def _store(self):
+        return JournalOrderStore(os.path.join(self.data_dir, 'orders.json'),
+                                 os.path.join(self.data_dir, 'orders.journal'), compact_every=0)
+
+    def test_compaction_while_another_worker_reads(self):
+        # Snapshot con una orden y otras dos que solo están en el journal
+        writer = self._store()
+        writer.insert_order({'user_id': 0, 'items': []})
+        writer.compact()
+        for user_id in (1, 2):
+            writer.insert_order({'user_id': user_id, 'items': []})
+
+        context = multiprocessing.get_context('fork')
+        snapshot_read, compacted = context.Event(), context.Event()
+        results = context.Queue()
+        real_load = json.load
+
+        def paused_load(f):
+            # El lector se frena la PRIMERA vez, con el snapshot viejo ya leído
+            data = real_load(f)
+            if not snapshot_read.is_set():
+                snapshot_read.set()
+                compacted.wait(10)
+            return data
+
+        def reader():
+            store = self._store()
+            with mock.patch.object(json, 'load', paused_load):
+                seen = len(store.index().all())
+            order = store.insert_order({'user_id': 99, 'items': []})
+            results.put((seen, order['id']))
+
+        process = context.Process(target=reader)
+        process.start()
+        self.assertTrue(snapshot_read.wait(10))
+        writer.compact()
+        compacted.set()
+        seen, new_id = results.get(timeout=10)
+        process.join()
+
+        self.assertEqual(seen, 3)
+        self.assertEqual(new_id, 1004)
+        ids = [order['id'] for order in self._store().list_orders()]
+        self.assertEqual(ids, [1001, 1002, 1003, 1004])
+
+
+class StoreDataTestCase(SimpleTestCase):
+    """
+    Cada test trabaja sobre una COPIA de store/data (en una carpeta
+    temporal), así puede escribir sin tocar los datos de verdad.
+    """
+
+    def setUp(self):
+        self.data_dir = os.path.join(tempfile.mkdtemp(), 'data')
+        self.addCleanup(shutil.rmtree, os.path.dirname(self.data_dir), ignore_errors=True)
+        shutil.copytree(DATA_DIR, self.data_dir, ignore=shutil.ignore_patterns('*.lock', '*.sqlite3*'))
+        settings = override_settings(STORE_DATA_DIR=self.data_dir, STORE_STORAGE_BACKEND='json',
+                                     STORE_FSYNC=False)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        reset_storage_backend()
+        self.addCleanup(reset_storage_backend)
+
+
+class BranchServiceTests(StoreDataTestCase):
+    """Las sucursales se releen solo si la colección cambió."""
+
+    def test_new_branch_is_seen_without_restarting(self):
+        service = BranchService()
+        self.assertIsNone(service.get_branch_by_id(99))
+        store = get_storage_backend().collection('branches')
+        with mock.patch.object(store, 'all', wraps=store.all) as read_all:
+            service.get_all_branches()
+            read_all.assert_not_called()  # Nada cambió: no se relee
+        branch = dict(service.get_branch_by_id(1), id=99, name='Sucursal Nueva')
+        store.put(99, branch)
+        self.assertEqual(service.get_branch_by_id(99)['name'], 'Sucursal Nueva')
+        self.assertIn(99, [b['id'] for b in service.get_all_branches()])
+
+
+class ProductUpdateTests(StoreDataTestCase):
+    """Una modificación que falla no puede dejar el producto a medio cambiar."""
+
+    def test_invalid_update_changes_nothing(self):
+        products = ProductService()
+        before = products.get_product_by_id(101)
+
+        self.assertIsNone(products.update_product(101, {'title': 'HACKED', 'price': -5}))
+
+        self.assertEqual(products.get_product_by_id(101), before)
+        repo = get_catalog_repository()
+        self.assertEqual(repo.search_products('hacked'), [])
+        self.assertEqual(repo.suggest('hack')[0], [])
+        self.assertEqual(repo.branch_catalog(before['branch_id'], [101])[0]['title'], before['title'])
+
+    def test_updating_restores_the_product_if_the_block_fails(self):
+        repo = get_catalog_repository()
+        product = repo.get_product(101)
+        title = product.title
+        with self.assertRaises(ValueError):
+            with repo.updating(product):
+                product.title = 'A medias'
+                product.stock = -1
+        self.assertEqual(product.title, title)
+        self.assertEqual(repo.search_products('medias'), [])
+
+    def test_index_reads_wait_for_a_write_in_progress(self):
+        repo = get_catalog_repository()
+        product = repo.get_product(101)
+        branch_id = product.branch_id
+        results = []
+        readers = [
+            lambda: repo.products_in_branch(branch_id),
+            lambda: repo.branch_catalog(branch_id),
+            lambda: repo.get_products([101]),
+            lambda: repo.sorted_page('price'),
+        ]
+        with repo.updating(product):
+            # Un índice a mitad de cambio: ningún lector puede entrar
+            threads = [threading.Thread(target=lambda read=read: results.append(read()))
+                       for read in readers]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(0.05)
+            self.assertEqual(results, [])
+            product.title = 'Torta en cambio'
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(results), len(readers))
+
+    def test_failed_save_reloads_from_disk(self):
+        repo = get_catalog_repository()
+        version = repo.get_product(101).version
+        with mock.patch.object(repo._products_store, 'put', side_effect=OSError("disco lleno")):
+            self.assertIsNone(ProductService().update_product(101, {'title': 'Sin guardar'}))
+        self.assertEqual(repo.get_product(101).version, version)
+        self.assertNotEqual(repo.get_product(101).title, 'Sin guardar')
+
+    def test_to_dict_is_cached_and_read_only(self):
+        product = get_catalog_repository().get_product(101)
+        data = product.to_dict()
+        title = data['title']
+        self.assertIs(product.to_dict(), data)
+        with self.assertRaises(TypeError):
+            data['category_name'] = 'Tortas'
+        self.assertEqual(json.loads(json.dumps(data))['id'], 101)
+        # Un setter invalida la caché: la próxima llamada arma otro dict
+        with get_catalog_repository().updating(product):
+            product.title = 'Torta renombrada'
+        self.assertEqual(product.to_dict()['title'], 'Torta renombrada')
+        self.assertEqual(data['title'], title) # (El dict viejo no cambia)
+
+    def test_valid_update_is_saved(self):
+        updated = ProductService().update_product(101, {'title': 'Torta nueva', 'price': '10.5'})
+        self.assertEqual(updated['title'], 'Torta nueva')
+        self.assertEqual(updated['price'], 10.5)
+        reset_storage_backend()  # Releemos del disco
+        self.assertEqual(ProductService().get_product_by_id(101)['title'], 'Torta nueva')
+
+
+class ReservationTests(StoreDataTestCase):
+    """Reservas de stock guardadas de a una (ver reservation_service.py)."""
+
+    def _files(self):
+        directory = os.path.join(self.data_dir, 'reservations')
+        return {name: os.stat(os.path.join(directory, name)).st_ino
+                for name in os.listdir(directory) if name.endswith('.json')}
+
+    def test_each_hold_writes_only_its_own_file(self):
+        service = ReservationService()
+        service.hold(1, 101, 2, stock=5)
+        before = self._files()
+        service.hold(2, 102, 1, stock=5)
+        after = self._files()
+        self.assertEqual(len(after), 2)
+        self.assertEqual({name: after[name] for name in before}, before)
+
+    def test_other_worker_sees_the_hold_right_away(self):
+        first, second = ReservationService(), ReservationService()
+        self.assertEqual(second.available(101, 5, user_id=2), 5)
+        for quantity in range(1, 4):
+            first.hold(1, 101, quantity, stock=5)
+            self.assertEqual(second.available(101, 5, user_id=2), 5 - quantity)
+        self.assertFalse(second.hold(2, 101, 3, stock=5))
+
+    def test_expired_holds_are_deleted_one_by_one(self):
+        service = ReservationService()
+        service.hold(1, 101, 2, stock=5)
+        collection = get_storage_backend().collection('reservations')
+        later = time.time() + 60 * 60
+        with mock.patch('time.time', return_value=later), \
+                mock.patch.object(type(collection), 'replace_all', side_effect=AssertionError):
+            self.assertEqual(service.available(101, 5, user_id=2), 5)
+            service.hold(2, 102, 1, stock=5)
+        self.assertIsNone(collection.get('1:101'))
+        self.assertEqual(len(self._files()), 1)
+
+    def test_single_file_is_migrated(self):
+        with open(os.path.join(self.data_dir, 'reservations.json'), 'w', encoding='utf-8') as f:
+            json.dump({'7:101': {'id': '7:101', 'user_id': 7, 'product_id': 101, 'quantity': 2,
+                                 'expires_at': time.time() + 60}}, f)
+        reset_storage_backend()
+        self.assertEqual(ReservationService().held(101), 2)
+        self.assertFalse(os.path.exists(os.path.join(self.data_dir, 'reservations.json')))
+
+
+class Crash(Exception):
+    """Simula que el proceso se cortó en ese punto."""
+
+
+class CheckoutTestCase(StoreDataTestCase):
+    """Un cliente con un carrito listo para comprar."""
+
+    USER_ID = 9001
+    USER_DATA = {'username': 'test', 'email': 'a@b.c', 'full_name': 'Test',
+                 'delivery_type': 'pickup', 'address': 'Retiro en local', 'payment_method': 'cash'}
+
+    def setUp(self):
+        super().setUp()
+        cart = Cart(user_id=self.USER_ID)
+        cart.add_item(102, 2)
+        cart.add_item(103, 1)
+        CartService().save_cart(cart)
+
+    def _stock(self, product_id):
+        return ProductService().get_product_by_id(product_id)['stock']
+
+    def _orders(self):
+        return [o for o in OrderService().get_all_orders() if o['user_id'] == self.USER_ID]
+
+    def _cart_items(self):
+        return CartService().get_cart(self.USER_ID).items
+
+
+class CheckoutTests(CheckoutTestCase):
+    """El checkout es todo o nada y se recupera si se corta en el medio."""
+
+    def test_checkout_applies_everything(self):
+        order = CheckoutService().checkout(self.USER_ID, self.USER_DATA)
+        self.assertEqual([o['id'] for o in self._orders()], [order['id']])
+        self.assertEqual((self._stock(102), self._stock(103)), (3, 2))
+        self.assertFalse(self._cart_items())
+
+    def test_invalid_cart_changes_nothing(self):
+        cart = CartService().get_cart(self.USER_ID)
+        cart.add_item(101, 1)  # Sin stock
+        CartService().save_cart(cart)
+        with self.assertRaises(CheckoutError):
+            CheckoutService().checkout(self.USER_ID, self.USER_DATA)
+        self.assertEqual((self._stock(101), self._stock(102), self._stock(103)), (0, 5, 3))
+        self.assertEqual(self._orders(), [])
+        self.assertEqual(len(self._cart_items()), 3)
+
+    def _assert_recovered_once(self):
+        self.assertEqual((self._stock(102), self._stock(103)), (3, 2))
+        self.assertEqual(len(self._orders()), 1)
+        self.assertFalse(self._cart_items())
+        self.assertEqual(CheckoutService().recover(0), 0)  # Ya no queda nada pendiente
+
+    def test_crash_after_intent_write(self):
+        with mock.patch.object(CheckoutService, '_apply_stock', side_effect=Crash):
+            with self.assertRaises(Crash):
+                CheckoutService().checkout(self.USER_ID, self.USER_DATA)
+        self.assertEqual((self._stock(102), self._stock(103)), (5, 3))
+        self.assertEqual(self._orders(), [])
+
+        # Sin stock descontado el checkout no puede estar vivo: se recupera ya
+        self.assertEqual(CheckoutService().recover(), 1)
+        self._assert_recovered_once()
+
+    def test_crash_after_stock_write_then_restock(self):
+        repo = get_catalog_repository()
+        save_products = repo.save_products
+
+        def save_then_crash(products):
+            save_products(products)
+            raise Crash
+
+        with mock.patch.object(repo, 'save_products', side_effect=save_then_crash):
+            with self.assertRaises(Crash):
+                CheckoutService().checkout(self.USER_ID, self.USER_DATA)
+        self.assertEqual((self._stock(102), self._stock(103)), (3, 2))
+
+        # Alguien repone justo lo que se vendió antes de la recuperación:
+        # el stock vuelve a los valores de antes del checkout, pero NO se
+        # tiene que descontar de nuevo.
+        ProductService().update_product(102, {'stock': 5})
+        ProductService().update_product(103, {'stock': 3})
+        self.assertEqual(CheckoutService().recover(), 1)
+        self.assertEqual((self._stock(102), self._stock(103)), (5, 3))
+        self.assertEqual(len(self._orders()), 1)
+        self.assertFalse(self._cart_items())
+
+    def test_crash_after_stock_marked(self):
+        with mock.patch.object(CheckoutService, '_finish', side_effect=Crash):
+            with self.assertRaises(Crash):
+                CheckoutService().checkout(self.USER_ID, self.USER_DATA)
+        self.assertEqual(self._orders(), [])
+
+        # Recién creado: podría estar terminándose en otro worker
+        self.assertEqual(CheckoutService().recover(), 0)
+        self.assertEqual(self._orders(), [])
+
+        self.assertEqual(CheckoutService().recover(0), 1)
+        self._assert_recovered_once()
+
+
+class IdempotentCheckoutTests(CheckoutTestCase):
+    """
+    Un reintento del checkout con la misma clave recibe la respuesta
+    guardada, aunque caiga en OTRO worker (otro proceso).
+    """
+
+    def _post_checkout(self, key):
+        request = RequestFactory().post('/checkout/', {
+            'nombre': 'Test', 'email': 'a@b.c', 'delivery_type': 'pickup',
+            'payment_method': 'cash', 'idempotency_key': key
+        })
+        request.session = SessionStore()
+        request.session['user_id'] = self.USER_ID
+        request._messages = FallbackStorage(request)
+        # (La vista usa el CartService del módulo: lo apuntamos a estos datos)
+        with mock.patch.object(views, 'cart_service', CartService()):
+            return views.CheckoutView().post(request)
+
+    def _refill_cart(self):
+        # Si la vista se volviera a ejecutar, esto alcanzaría para otra orden
+        cart = Cart(user_id=self.USER_ID)
+        cart.add_item(104, 1)
+        CartService().save_cart(cart)
+
+    def test_replay_in_same_process(self):
+        first = self._post_checkout('clave-1')
+        self._refill_cart()
+        replay = self._post_checkout('clave-1')
+        self.assertEqual(replay['Idempotent-Replayed'], 'true')
+        self.assertEqual(replay['Location'], first['Location'])
+        self.assertEqual(len(self._orders()), 1)
+        self.assertEqual(self._stock(104), 5)
+
+    @skipUnless(hasattr(os, 'fork'), "Necesita fork() para lanzar otro proceso")
+    def test_replay_in_another_worker(self):
+        def first_worker():
+            reset_storage_backend()
+            response = self._post_checkout('clave-2')
+            assert response.status_code == 302, response.status_code
+
+        process = multiprocessing.get_context('fork').Process(target=first_worker)
+        process.start()
+        process.join()
+        self.assertEqual(process.exitcode, 0)
+
+        reset_storage_backend()
+        self._refill_cart()
+        replay = self._post_checkout('clave-2')
+        self.assertEqual(replay['Idempotent-Replayed'], 'true')
+        self.assertEqual(len(self._orders()), 1)
+        self.assertEqual(self._stock(104), 5)
+
+    def test_retry_after_a_killed_worker(self):
+        # El worker muere a mitad del pedido: la marca "en curso" queda guardada
+        with mock.patch.object(CheckoutService, 'checkout', side_effect=SystemExit):
+            with self.assertRaises(SystemExit):
+                self._post_checkout('clave-3')
+        with mock.patch.object(decorators, 'IDEMPOTENCY_WAIT_SECONDS', 0):
+            self.assertEqual(self._post_checkout('clave-3').status_code, 409)
+
+        # Pasado el plazo de la marca, el reintento ejecuta el checkout
+        later = time.time() + 3 * 60
+        with mock.patch('time.time', return_value=later):
+            response = self._post_checkout('clave-3')
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(len(self._orders()), 1)
+
+
+class IdempotencyStoreTests(StoreDataTestCase):
+    """Las claves vencen y nunca pasan del máximo (ver idempotency_store.py)."""
+
+    def setUp(self):
+        super().setUp()
+        self.store = IdempotencyStore()
+
+    @override_settings(STORE_IDEMPOTENCY_MAX_ENTRIES=3)
+    def test_full_store_evicts_the_oldest(self):
+        for n in range(5):
+            self.assertTrue(self.store.add(f'k{n}', n))
+        self.assertEqual(len(self.store), 3)
+        self.assertEqual([self.store.get(f'k{n}') for n in range(5)], [None, None, 2, 3, 4])
+
+    def test_expired_keys_are_pruned_without_scanning(self):
+        self.store.add('vieja', 1)
+        collection = get_storage_backend().collection('idempotency')
+        later = time.time() + 2 * 60 * 60
+        with mock.patch('time.time', return_value=later), \
+                mock.patch.object(type(collection), 'all', side_effect=AssertionError("recorrió todo")):
+            self.assertIsNone(self.store.get('vieja'))
+            self.assertTrue(self.store.add('nueva', 2))
+        self.assertIsNone(collection.get('vieja'))
+        self.assertEqual(len(self.store), 1)
+
+    def test_set_and_delete_keep_the_index(self):
+        self.store.add('k', 1)
+        self.store.set('k', 2)
+        self.assertEqual((self.store.get('k'), len(self.store)), (2, 1))
+        self.store.delete('k')
+        self.assertEqual((self.store.get('k'), len(self.store)), (None, 0))
+
+
+class OrderArchiveTests(StoreDataTestCase):
+    """Mudanza de órdenes viejas al archivo por segmentos (ver order_archive.py)."""
+
+    NOW = datetime(2026, 6, 1)  # Todas las órdenes de prueba (2025) son viejas
+    ARCHIVED = [1002, 1003, 1005, 1006, 1008, 1009, 1011, 1012, 1013, 1014, 1015]
+
+    def setUp(self):
+        super().setUp()
+        # Tres segmentos: 2025-09 (cliente 4), 2025-10 (cliente 6) y 2025-11
+        store = get_storage_backend().orders()
+        store.update_order(1011, {'created_at': '2025-09-10T10:00:00'})
+        store.update_order(1012, {'created_at': '2025-10-10T10:00:00'})
+        service = OrderService()
+        self.counts = service.get_status_counts()
+        self.report = service.get_sales_report(group_by=('branch_id', 'status'))
+
+    def _assert_totals_unchanged(self, service):
+        self.assertEqual(service.get_status_counts(), self.counts)
+        self.assertEqual(service.get_sales_report(group_by=('branch_id', 'status')), self.report)
+
+    def test_move_to_archive(self):
+        service = OrderService()
+        self.assertEqual(service.archive_orders(now=self.NOW), len(self.ARCHIVED))
+
+        hot = get_storage_backend().orders().index()
+        self.assertEqual(sorted(hot.by_id), [1001, 1004, 1007, 1010])
+        archive = get_storage_backend().order_archive()
+        self.assertEqual(archive.count(), len(self.ARCHIVED))
+        self.assertEqual(archive._names(), ['2025-09', '2025-10', '2025-11'])
+        self.assertEqual(service.get_order_by_id(1012)['user_id'], 6)
+        self.assertEqual(sorted(o['id'] for o in service.get_all_orders()), list(range(1001, 1016)))
+        self._assert_totals_unchanged(service)
+
+        # Repetir no muda (ni duplica) nada
+        self.assertEqual(service.archive_orders(now=self.NOW), 0)
+        self.assertEqual(archive.count(), len(self.ARCHIVED))
+
+    def test_manifest_prunes_segments(self):
+        service = OrderService()
+        service.archive_orders(now=self.NOW)
+        archive = get_storage_backend().order_archive()
+        with mock.patch.object(archive, '_open', wraps=archive._open) as opened:
+            self.assertEqual([o['id'] for o in service.get_orders_by_user(6)], [1012])
+            self.assertEqual([call.args[0] for call in opened.call_args_list], ['2025-10'])
+
+            opened.reset_mock()
+            self._assert_totals_unchanged(service)  # Solo manifest y .rollup.json
+            opened.assert_not_called()
+
+    def test_update_archived_order_rewrites_its_segment(self):
+        service = OrderService()
+        service.archive_orders(now=self.NOW)
+        self.assertEqual(service.update_order_status(1012, 'cancelled')['status'], 'cancelled')
+
+        reset_storage_backend()  # Releemos todo del disco
+        service = OrderService()
+        self.assertEqual(service.get_order_by_id(1012)['status'], 'cancelled')
+        archive = get_storage_backend().order_archive()
+        self.assertEqual(archive._segments_info()['2025-10']['status_counts'], {'cancelled': 1})
+        counts = service.get_status_counts()
+        self.assertEqual(counts['completed'], self.counts['completed'] - 1)
+        self.assertEqual(counts['cancelled'], self.counts['cancelled'] + 1)
+        self.assertEqual(counts['total'], self.counts['total'])
+
+    def test_interrupted_move_is_finished_before_reading(self):
+        # El proceso "muere" después de escribir el archivo y antes de
+        # sacar las órdenes del store caliente: quedan en los dos lados.
+        with mock.patch.object(JournalOrderStore, 'compact', side_effect=Crash):
+            with self.assertRaises(Crash):
+                OrderService().archive_orders(now=self.NOW)
+
+        reset_storage_backend()  # Otro proceso, con lo que quedó en disco
+        service = OrderService()
+        self._assert_totals_unchanged(service)  # Ninguna orden contada dos veces
+        hot = get_storage_backend().orders().index()
+        self.assertEqual(sorted(hot.by_id), [1001, 1004, 1007, 1010])
+        self.assertIsNone(get_storage_backend().order_archive().interrupted_move())
+
+
+class SalesRollupsTests(SimpleTestCase):
+    """El armado con NumPy y el bucle común dan exactamente las mismas filas."""
+
+    def _orders(self):
+        orders = []
+        for n in range(300):
+            items = [{'product_id': 101 + (n + k) % 7, 'quantity': 1 + (n * k) % 4,
+                      'total_price': round(1000.5 * (1 + (n + k) % 5), 2)} for k in range(1 + n % 3)]
+            orders.append({
+                'id': 1001 + n,
+                'created_at': f"2025-{1 + n % 12:02d}-{1 + n % 28:02d}T10:00:00",
+                'branch_id': 1 + n % 3,
+                'status': OrderService.VALID_STATUSES[n % 6],
+                'items': items,
+                'total_amount': sum(item['total_price'] for item in items)
+            })
+        # Casos raros: sin líneas, sin sucursal y una línea sin producto
+        orders.append({'id': 2001, 'created_at': '2025-03-03T10:00:00', 'branch_id': None,
+                       'status': 'pending', 'items': [], 'total_amount': 0})
+        orders.append({'id': 2002, 'created_at': '2025-03-03T11:00:00', 'branch_id': 2,
+                       'status': 'ready', 'items': [{'quantity': 2, 'total_price': 500.0}],
+                       'total_amount': 500.0})
+        return orders
+
+    @skipUnless(sales_rollups.numpy is not None, "NumPy no está instalado")
+    def test_numpy_and_loop_builds_match(self):
+        orders = self._orders()
+        vectorized = sales_rollups.SalesRollups(orders).to_rows()
+        with mock.patch.object(sales_rollups, 'numpy', None):
+            looped = sales_rollups.SalesRollups(orders).to_rows()
+        self.assertEqual(len(vectorized), len(looped))
+        for row, expected in zip(vectorized, looped):
+            self.assertEqual(row[:4], expected[:4])              # Clave
+            self.assertAlmostEqual(row[4], expected[4], places=6)  # Recaudación
+            self.assertEqual(row[5:], expected[5:])               # Unidades y órdenes
+            self.assertIsInstance(row[5], int)
+
+    def test_incremental_matches_rebuild(self):
+        orders = self._orders()
+        rollups = sales_rollups.SalesRollups()
+        for order in orders:
+            rollups.add(order)
+        rebuilt = sales_rollups.SalesRollups(orders).to_rows()
+        self.assertEqual([row[:4] + row[5:] for row in rollups.to_rows()],
+                         [row[:4] + row[5:] for row in rebuilt])
+
+
+class ProductExportTests(StoreDataTestCase):
+    """CSV y NDJSON exportan las mismas columnas del catálogo."""
+
+    def _export(self, export_format):
+        request = RequestFactory().get('/api/admin/products/export/', {'format': export_format})
+        request.session = SessionStore()
+        request.session['user_role'] = 'admin'
+        response = views.AdminProductsExportView().get(request)
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_csv_and_ndjson_have_the_same_columns(self):
+        rows = [json.loads(line) for line in self._export('ndjson').splitlines()]
+        header = next(csv.reader(io.StringIO(self._export('csv'))))
+        self.assertEqual(header, exports.PRODUCT_FIELDS)
+        self.assertTrue(rows)
+        for row in rows:
+            self.assertEqual(list(row), exports.PRODUCT_FIELDS)
+
+
+class ProductPaginationTests(StoreDataTestCase):
+    """
+    Recorrer TODAS las páginas de /api/products/ (cursor keyset) trae cada
+    producto una sola vez y en el orden pedido.
+    """
+
+    PAGE = 4
+
+    def _walk(self, **options):
+        service = ProductService()
+        ids, cursor = [], None
+        for _ in range(100):
+            page = service.get_products_page(after=cursor, limit=self.PAGE, fields=['id'], **options)
+            self.assertLessEqual(len(page['results']), self.PAGE)
+            ids += [product['id'] for product in page['results']]
+            cursor = page['next_cursor']
+            if cursor is None:
+                return ids
+        self.fail("La paginación no termina")
+
+    def _expected(self, field, descending=False, search=None):
+        repo = get_catalog_repository()
+        products = repo.search_products(search) if search else repo.products
+        ordered = sorted(products, key=lambda product: sort_key(product, field), reverse=descending)
+        return [product.product_id for product in ordered]
+
+    def test_walk_every_sort(self):
+        for sort in ('price', '-price', 'title', '-title', 'stock', 'id'):
+            for search in (None, 'torta'):
+                with self.subTest(sort=sort, search=search):
+                    ids = self._walk(sort=sort, title_filter=search)
+                    self.assertEqual(len(ids), len(set(ids)), "Producto repetido")
+                    self.assertEqual(ids, self._expected(sort.lstrip('-'), sort.startswith('-'), search))
+
+    def test_walk_by_relevance(self):
+        ids = self._walk(title_filter='torta')
+        self.assertGreater(len(ids), self.PAGE)  # (Más de una página)
+        expected = [product.product_id for product in get_catalog_repository().search_products('torta')]
+        self.assertEqual(ids, expected)
+
+    def test_walk_with_filters(self):
+        repo = get_catalog_repository()
+        ids = self._walk(sort='-price', branch_id_filter=1)
+        expected = sorted(repo.products_in_branch(1), key=lambda product: sort_key(product, 'price'), reverse=True)
+        self.assertEqual(ids, [product.product_id for product in expected])
+
+    def test_cursor_of_another_sort_starts_over(self):
+        service = ProductService()
+        title_cursor = service.get_products_page(sort='title', limit=2)['next_cursor']
+        first = service.get_products_page(sort='price', limit=2)
+        self.assertEqual(service.get_products_page(sort='price', limit=2, after=title_cursor), first)
+        self.assertEqual(service.get_products_page(sort='price', limit=2, after='basura'), first)
+
+
+class ProductFilterAPITests(StoreDataTestCase):
+    """Filtros de /api/products/ con valor 0 y facetas solo si se piden."""
+
+    def _get(self, **params):
+        request = RequestFactory().get('/api/products/', params)
+        # (La vista usa el ProductService del módulo: lo apuntamos a estos datos)
+        with mock.patch.object(views, 'product_service', ProductService()):
+            response = views.ProductListCreateAPIView.as_view()(request)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_first_price_bucket_can_be_selected(self):
+        products = get_catalog_repository().products
+        expected = sorted(p.product_id for p in products if price_bucket(p.price) == 0)
+        ids = sorted(product['id'] for product in self._get(price_bucket='0'))
+        self.assertEqual(ids, expected)
+        self.assertLess(len(ids), len(products))
+
+    def test_zero_bounds_are_filters(self):
+        total = len(get_catalog_repository().products)
+        cheap = self._get(max_price='0')
+        self.assertLess(len(cheap), total)
+        self.assertTrue(all(product['price'] <= 0 for product in cheap))
+        self.assertLess(len(self._get(min_weight='0', max_weight='0')), total)
+
+    def test_facets_only_when_asked(self):
+        self.assertNotIn('facets', self._get(limit='5'))
+        page = self._get(limit='5', facets='1')
+        self.assertEqual(page['facets']['total'], len(get_catalog_repository().products))
+        self.assertIsInstance(self._get(), list)  # Sin paginar ni facetas: la lista de siempre
+
+
+class ProductSearchTests(StoreDataTestCase):
+    """La búsqueda no distingue mayúsculas ni acentos (ver ProductSearchIndex)."""
+
+    def test_accents_and_case_find_the_same_products(self):
+        repo = get_catalog_repository()
+        expected = sorted(p.product_id for p in repo.products if 'torta' in p.title.lower())
+        self.assertIn(101, expected)
+        for query in ('Torta', 'tórta', 'TORTA', 'TÓRTA'):
+            with self.subTest(query=query):
+                ids = sorted(product.product_id for product in repo.search_products(query))
+                self.assertEqual(ids, expected)
+
+
+class ProductSuggestTests(StoreDataTestCase):
+    """Autocompletado: solo la sucursal pedida y nunca más de 'limit'."""
+
+    def _get(self, selected_branch=None, **params):
+        request = RequestFactory().get('/api/products/suggest/', params)
+        request.session = SessionStore()
+        if selected_branch is not None:
+            request.session['selected_branch_id'] = selected_branch
+        with mock.patch.object(views, 'product_service', ProductService()):
+            response = views.ProductSuggestView.as_view()(request)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)
+
+    def _expected(self, branch_id, prefix='tor'):
+        return sorted(p.product_id for p in get_catalog_repository().products
+                      if p.branch_id == branch_id
+                      and any(word.startswith(prefix) for word in p.title.lower().split()))
+
+    def test_only_products_of_the_branch(self):
+        repo = get_catalog_repository()
+        for branch_id in (1, 2, 5):
+            with self.subTest(branch=branch_id):
+                data = self._get(q='tor', branch=str(branch_id), limit='20')
+                self.assertEqual(sorted(p['id'] for p in data['products']), self._expected(branch_id))
+                in_branch = {p.category_id for p in repo.products if p.branch_id == branch_id}
+                self.assertTrue(all(c['id'] in in_branch for c in data['categories']))
+        # Sin 'branch', la sucursal elegida en la sesión
+        data = self._get(selected_branch=2, q='tor', limit='20')
+        self.assertEqual(sorted(p['id'] for p in data['products']), self._expected(2))
+
+    def test_limit_is_respected(self):
+        self.assertGreater(len(self._expected(5)), 2)
+        for limit in (1, 2):
+            with self.subTest(limit=limit):
+                data = self._get(q='tor', branch='5', limit=str(limit))
+                self.assertEqual(len(data['products']), limit)
+                self.assertTrue(set(p['id'] for p in data['products']) <= set(self._expected(5)))
+        self.assertEqual(len(self._get(q='tor', limit='3')['products']), 3)
+
+
+class OrderPaginationTests(StoreDataTestCase):
+    """
+    Recorrer las páginas de órdenes (cursor keyset) con cada filtro trae
+    cada orden una sola vez, aunque haya órdenes con la misma fecha o
+    entren órdenes nuevas en el medio.
+    """
+
+    PAGE = 2
+    TIE = '2025-11-16T01:45:26.575738'
+
+    def setUp(self):
+        super().setUp()
+        # Tres órdenes con la MISMA fecha: el cursor desempata por id
+        store = get_storage_backend().orders()
+        for order_id in (1013, 1014, 1015):
+            store.update_order(order_id, {'created_at': self.TIE})
+
+    def _walk(self, service, during=None, **filters):
+        ids, cursor = [], None
+        for _ in range(100):
+            page = service.get_orders_page(after=cursor, limit=self.PAGE, **filters)
+            self.assertLessEqual(len(page['orders']), self.PAGE)
+            ids += [order['id'] for order in page['orders']]
+            cursor = page['next_cursor']
+            if cursor is None:
+                return ids
+            if during:
+                during()
+                during = None
+        self.fail("La paginación no termina")
+
+    def _expected(self, service, status=None, user_id=None, branch_id=None):
+        orders = [o for o in service.get_all_orders()
+                  if (status is None or o['status'] == status)
+                  and (user_id is None or o['user_id'] == user_id)
+                  and (branch_id is None or o['branch_id'] == branch_id)]
+        orders.sort(key=lambda order: (order['created_at'], order['id']), reverse=True)
+        return [order['id'] for order in orders]
+
+    def test_walk_with_each_filter(self):
+        service = OrderService()
+        for filters in ({}, {'status': 'completed'}, {'user_id': 3}, {'branch_id': 1},
+                        {'status': 'completed', 'user_id': 3}, {'branch_id': 2}):
+            with self.subTest(**filters):
+                expected = self._expected(service, **filters)
+                self.assertEqual(self._walk(service, **filters), expected)
+        self.assertEqual(self._walk(service, branch_id=2), [])
+
+    def test_new_orders_do_not_shift_the_pages(self):
+        service = OrderService()
+        for filters in ({}, {'status': 'pending'}, {'user_id': 3}, {'branch_id': 1}):
+            with self.subTest(**filters):
+                expected = self._expected(service, **filters)
+                # Entra una orden nueva (la más reciente) después de la 1ª página
+                ids = self._walk(service, during=lambda: service.create_order(user_id=3, cart_data={'items': {}}),
+                                 **filters)
+                self.assertEqual(ids, expected)
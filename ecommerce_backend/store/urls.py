@@ -17,6 +17,7 @@ urlpatterns = [
     
     # API de Productos (referenciadas en el decorador)
     path('products/', views.ProductListCreateAPIView.as_view(), name='product-list'),
+    path('products/suggest/', views.ProductSuggestView.as_view(), name='product-suggest'),
     path('products/<int:pk>/', views.ProductDetailAPIView.as_view(), name='product-detail'),
     
     # Administración de Productos (HTML)
@@ -32,6 +33,11 @@ urlpatterns = [
     # Vistas de Carritos y Órdenes para Admin
     path('admin/carts/', views.AdminCartsView.as_view(), name='admin-carts-view'),
     path('admin/orders/', views.AdminOrdersView.as_view(), name='admin-orders-view'), 
+    path('admin/orders/api/', views.AdminOrdersAPIView.as_view(), name='admin-orders-api'),
+    path('admin/orders/export/', views.AdminOrdersExportView.as_view(), name='admin-orders-export'),
+    path('admin/products/export/', views.AdminProductsExportView.as_view(), name='admin-products-export'),
+    path('admin/analytics/', views.AdminAnalyticsView.as_view(), name='admin-analytics-view'),
+    path('admin/analytics/api/', views.AdminAnalyticsAPIView.as_view(), name='admin-analytics-api'),
      # URLs de administración para órdenes
     path('admin/orders/<int:order_id>/', views.AdminOrderDetailView.as_view(), name='admin-order-detail'),
 
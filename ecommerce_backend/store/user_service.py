@@ -1,111 +1,138 @@
 # store/user_service.py
-import json
-import os
 # Importamos los "moldes" de usuario de models.py
-from .models import AdminUser, ClientUser
+import threading
 
-# Definimos la ruta de la "base de datos" de usuarios
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-USERS_FILE = os.path.join(BASE_DIR, 'data', 'users.json')
+from .models import AdminUser, ClientUser
+# Los usuarios se guardan en la colección 'users' del backend
+# (JSON: store/data/users.json, SQLite: tabla 'users').
+from .storage import get_storage_backend
 
 class UserService:
+    """
+    Usuarios en memoria, con dos diccionarios para buscar sin recorrer
+    la lista:
+        username (en minúsculas, casefold) -> usuario
+        id -> usuario
+
+    Vuelve a leer la colección SOLO si cambió (su huella: mtime del
+    archivo o versión de la tabla), así un usuario registrado en otro
+    worker aparece sin releer el archivo en cada login.
+    """
     
     def __init__(self):
-        # self._users contendrá una lista de OBJETOS
-        # (algunos AdminUser, otros ClientUser)
-        self._users = self._load_users()
+        self._lock = threading.RLock()
+        self._backend = None
+        self._stamp = None  # Huella de la colección en la última carga
+        self._users = []
+        self._users_by_name = {}
+        self._users_by_id = {}
+        self._refresh()
+
+    def _refresh(self):
+        """Recarga los usuarios SOLO si cambiaron desde la última vez."""
+        backend = get_storage_backend()
+        if backend is not self._backend:
+            # Cambió el backend (ej: en los tests): empezamos de cero.
+            with self._lock:
+                self._backend = backend
+                self._store = backend.collection('users')
+                self._stamp = None
+        if self._store.stamp() == self._stamp:
+            return
+        with self._lock:
+            # Otro hilo pudo haber recargado mientras esperábamos.
+            stamp = self._store.stamp()
+            if stamp != self._stamp:
+                self._set_users(self._load_users())
+                # Si no existía, _load_users() acaba de crear al admin.
+                self._stamp = self._store.stamp() if stamp is None else stamp
+
+    def _set_users(self, users):
+        # Armamos los diccionarios primero y recién después los publicamos
+        # (quien esté leyendo en otro hilo sigue viendo los viejos).
+        users_by_name = {u.username.casefold(): u for u in users}
+        users_by_id = {u.user_id: u for u in users}
+        self._users = users
+        self._users_by_name = users_by_name
+        self._users_by_id = users_by_id
 
     def _load_users(self):
         """
-        Carga el JSON y decide qué "molde" (AdminUser o ClientUser) usar
+        Carga los usuarios y decide qué "molde" (AdminUser o ClientUser) usar
         para cada item.
         """
-        try:
-            with open(USERS_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                user_objects = []
-                for item in data:
-                    # Preparamos los argumentos comunes (email/address pueden ser None)
-                    args = (item['id'], item['username'], item['password'], item.get('email'), item.get('address'))
-                    
-                    # --- Polimorfismo ---
-                    # Decidimos qué objeto crear basado en el 'role' del JSON
-                    if item['role'] == 'admin':
-                        # Creamos un objeto AdminUser
-                        user_objects.append(AdminUser(*args))
-                    else:
-                        # Creamos un objeto ClientUser
-                        user_objects.append(ClientUser(*args))
-                
-                return user_objects
-                
-        except (FileNotFoundError, json.JSONDecodeError):
-            # Si el archivo no existe o está vacío, lo creamos.
-            os.makedirs(os.path.dirname(USERS_FILE), exist_ok=True)
-            with open(USERS_FILE, 'w', encoding='utf-8') as f:
-                # Creamos el usuario 'admin' por defecto.
-                admin_data = {
-                    "id": 1, "username": "admin", 
-                    "password": "adminpassword123", "role": "admin",
-                    "email": "admin@test.com", "address": "N/A"
-                }
-                json.dump([admin_data], f, indent=4)
-                # Devolvemos una lista con el objeto AdminUser
-                return [AdminUser(admin_data['id'], admin_data['username'], admin_data['password'],
-                                  admin_data['email'], admin_data['address'])] 
+        data = self._store.all()
+        if not data and not self._store.exists():
+            # Si todavía no hay usuarios, creamos el usuario 'admin' por defecto.
+            admin_data = {
+                "id": 1, "username": "admin", 
+                "password": "adminpassword123", "role": "admin",
+                "email": "admin@test.com", "address": "N/A"
+            }
+            self._store.put(admin_data['id'], admin_data)
+            data = [admin_data]
+
+        user_objects = []
+        for item in data:
+            # Preparamos los argumentos comunes (email/address pueden ser None)
+            args = (item['id'], item['username'], item['password'], item.get('email'), item.get('address'))
             
-    def _save_users(self):
-        """
-        Guarda la lista de OBJETOS de usuario de nuevo en el JSON.
-        """
-        # Llama al método .to_dict() de CADA objeto (sea Admin o Client)
-        users_as_dicts = [u.to_dict() for u in self._users]
+            # --- Polimorfismo ---
+            # Decidimos qué objeto crear basado en el 'role' guardado
+            if item['role'] == 'admin':
+                # Creamos un objeto AdminUser
+                user_objects.append(AdminUser(*args))
+            else:
+                # Creamos un objeto ClientUser
+                user_objects.append(ClientUser(*args))
         
-        with open(USERS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(users_as_dicts, f, indent=4, ensure_ascii=False)
+        return user_objects
 
     # --- Métodos Públicos (APIs del Servicio) ---
 
+    def get_all_users(self):
+        """Devuelve la lista de OBJETOS de usuario (al día con el disco)."""
+        self._refresh()
+        return self._users
+
     def get_user_by_username(self, username):
         """
-        Busca un usuario por 'username'.
+        Busca un usuario por 'username' (sin distinguir mayúsculas).
         Devuelve el OBJETO de usuario completo (o None).
         """
         if not username:
             return None
-        # Comparamos usando la propiedad .username del objeto
-        return next((u for u in self._users if u.username.lower() == username.lower()), None)
+        self._refresh()
+        # Búsqueda en el diccionario (O(1), no depende de cuántos usuarios hay)
+        return self._users_by_name.get(username.casefold())
     
     def get_user_by_id(self, user_id):
         """
         Busca un usuario por 'ID'.
         Devuelve el OBJETO de usuario completo (o None).
         """
-        print(f"DEBUG UserService - Buscando usuario con ID: {user_id}")
         if not user_id:
             return None
-        
-        # Comparamos usando la propiedad .user_id del objeto
-        user = next((u for u in self._users if u.user_id == user_id), None)
-        
-        if user:
-            print(f"DEBUG UserService - Usuario encontrado: {user.username}")
-        else:
-            print(f"DEBUG UserService - Usuario con ID {user_id} no encontrado")
-        
-        return user
+        self._refresh()
+        return self._users_by_id.get(user_id)
 
     def create_user(self, username, password, email= None, address=None):
         """
         Crea un nuevo Cliente (ClientUser).
         """
-        # 1. Verificamos que el nombre no esté en uso.
+        # Con el candado de la colección: dos workers no pueden registrar
+        # el mismo nombre (o el mismo ID) a la vez.
+        with self._lock, self._store.lock():
+            return self._create_user(username, password, email, address)
+
+    def _create_user(self, username, password, email, address):
+        # 1. Verificamos que el nombre no esté en uso (diccionario, O(1)).
         if self.get_user_by_username(username):
             return None # El usuario ya existe
 
         try:
-            # 2. Calculamos el nuevo ID (el máximo + 1)
-            new_id = max([u.user_id for u in self._users], default=0) + 1
+            # 2. Pedimos el nuevo ID al contador compartido (sin recorrer la lista)
+            new_id = self._backend.sequences().next_id('users')
             
             # 3. Creamos el objeto (siempre de tipo ClientUser)
             new_user = ClientUser(
@@ -116,10 +143,9 @@ class UserService:
                 address=address
             )
             
-            # 4. Añadimos el objeto a la lista en memoria
-            self._users.append(new_user)
-            # 5. Guardamos la lista completa en el JSON
-            self._save_users()
+            # 4. Guardamos SOLO el usuario nuevo
+            self._save(lambda: self._store.put(new_id, new_user.to_dict()),
+                       self._users + [new_user])
             
             # Devolvemos el diccionario del nuevo usuario
             return new_user.to_dict()
@@ -132,18 +158,41 @@ class UserService:
         """
         Elimina un usuario por su ID.
         """
-        initial_count = len(self._users)
-        
-        # 1. Re-creamos la lista de usuarios, excluyendo al ID a borrar.
-        #    Convertimos el user_id (que puede venir como str de la URL) a int.
-        self._users = [u for u in self._users if u.user_id != int(user_id)]
-        
-        final_count = len(self._users)
-        
-        # 2. Si el contador bajó, es que SÍ se eliminó.
-        if final_count < initial_count:
-            # 3. Guardamos la lista actualizada en el JSON
-            self._save_users()
+        # Convertimos el user_id (que puede venir como str de la URL) a int.
+        user_id = int(user_id)
+        with self._lock, self._store.lock():
+            # 1. Buscamos el usuario (diccionario, O(1)).
+            if self.get_user_by_id(user_id) is None:
+                return False # No se encontró el ID
+            
+            # 2. Lo borramos del almacenamiento y de la memoria
+            self._save(lambda: self._store.delete(user_id),
+                       [u for u in self._users if u.user_id != user_id])
             return True
-        else:
-            return False # No se encontró el ID
\ No newline at end of file
+
+    def _save(self, write, users):
+        """
+        Hace la escritura 'write()' y publica la nueva lista 'users'.
+        Si la huella cambió por NUESTRA escritura, la adoptamos (no hace
+        falta releer lo que acabamos de guardar). Se llama con el candado
+        de la colección tomado, así nadie más escribe en el medio.
+        """
+        write()
+        self._set_users(users)
+        self._stamp = self._store.stamp()
+
+
+# --- Instancia compartida (una por proceso) ---
+
+_shared_service = None
+_shared_lock = threading.Lock()
+
+
+def get_user_service():
+    """Devuelve el UserService compartido del proceso (lo crea la primera vez)."""
+    global _shared_service
+    if _shared_service is None:
+        with _shared_lock:
+            if _shared_service is None:
+                _shared_service = UserService()
+    return _shared_service
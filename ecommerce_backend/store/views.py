@@ -7,19 +7,26 @@ from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
 
 from .product_service import ProductService
-from .decorators import admin_required
+from .decorators import admin_required, idempotent
 from .cart_service import CartService # <-- Importado
 from .order_service import OrderService
+from .sales_rollups import GROUP_FIELDS
+from . import exports
+from .cart_pricing import CartPricer
+from .checkout_service import CheckoutService, CheckoutError
+from .reservation_service import get_reservation_service
+from .models import Cart
 
 
 from django.shortcuts import render, redirect
 from django.views import View
 from django.contrib import messages
 
-from .user_service import UserService 
+from .user_service import get_user_service
 from django.contrib import messages 
 from django.views.generic import TemplateView
 from uuid import uuid4
+from datetime import datetime
 import os
 from django.core.files.storage import default_storage
 from django.core.files.base import ContentFile
@@ -27,24 +34,52 @@ from django.core.files.base import ContentFile
 from .mixins import AdminRequiredMixin 
 
 from .branch_service import BranchService 
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.core.serializers.json import DjangoJSONEncoder
 import json
 
 
 # Inicializacion de los servicios (global para las vistas)
-user_service = UserService()
+# UserService compartido: índices username/id en memoria (ver user_service.py)
+user_service = get_user_service()
+# ProductService usa el catálogo compartido del proceso (ver catalog_repository.py):
+# todas las vistas leen de la misma copia en memoria.
 product_service = ProductService()
 branch_service = BranchService() 
+# Precios de carritos (una sola búsqueda de productos por carrito)
+# Reservas de stock con vencimiento (ver reservation_service.py)
+reservations = get_reservation_service()
+cart_pricer = CartPricer(product_service, reservations)
 cart_service = CartService() #  Instancia del servicio de carrito (Checkout y Órdenes)
 
+# Productos por página en /api/products/ cuando se pagina (?limit=...)
+PRODUCTS_PAGE_SIZE = 25
+
+
+def _product_range_filters(params):
+    """
+    Filtros extra del catálogo desde la URL (ver ProductFacetIndex):
+    ?branch_id=1&min_price=20000&max_price=35000&in_stock=1&min_weight=1&max_weight=2
+    (o ?price_bucket=3: un rango de la faceta de precio).
+    Lanza ValueError si un número no es válido.
+    """
+    filters = {'branch_id_filter': int(params['branch_id']) if params.get('branch_id') else None,
+               'price_bucket': int(params['price_bucket']) if params.get('price_bucket') else None}
+    for name in ('min_price', 'max_price', 'min_weight', 'max_weight'):
+        filters[name] = float(params[name]) if params.get(name) else None
+    # (Sin tildar no es un filtro: 'in_stock' solo va si se pidió)
+    if params.get('in_stock') in ('1', 'true'):
+        filters['in_stock'] = True
+    return filters
+
+
 class ProductListCreateAPIView(APIView):
     """
     Vista para listar productos (con filtros) y crear nuevos productos.
     Responde a la URL: /api/products/
     """
     def get(self, request):
-        service = ProductService()
+        service = product_service
         query_params = request.query_params
         
         name_filter = query_params.get('name', None)
@@ -57,12 +92,50 @@ class ProductListCreateAPIView(APIView):
             except (ValueError, TypeError):
                 return Response({"error": "category_id debe ser un número."}, status=status.HTTP_400_BAD_REQUEST)
 
-        products = service.get_all_products(name_filter, category_id_filter)
-        return Response(products, status=status.HTTP_200_OK)
+        # ?fields=id,title,price -> solo esos campos de cada producto
+        fields = [name for name in query_params.get('fields', '').split(',') if name] or None
+        unknown = [name for name in fields or () if name not in ProductService.FIELDS]
+        if unknown:
+            return Response({"error": f"Campos desconocidos: {', '.join(unknown)}."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            filters = _product_range_filters(query_params)
+        except ValueError:
+            return Response({"error": "branch_id, precios y pesos deben ser números."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        # ?facets=1: conteos por categoría, precio y stock (con o sin paginar)
+        with_facets = query_params.get('facets') in ('1', 'true')
+
+        if not any(name in query_params for name in ('limit', 'after', 'sort')):
+            # Sin paginar (como siempre): la lista entera
+            products = service.get_all_products(name_filter, category_id_filter, fields=fields, **filters)
+            if with_facets:
+                products = {
+                    'results': products,
+                    'facets': service.get_facets(name_filter, category_id_filter, **filters)
+                }
+            return Response(products, status=status.HTTP_200_OK)
+
+        # Paginado: ?limit=20&sort=-price&fields=id,title,price&after=<next_cursor>
+        try:
+            limit = min(max(int(query_params.get('limit', PRODUCTS_PAGE_SIZE)), 1), 100)
+        except ValueError:
+            return Response({"error": "limit debe ser un número."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            page = service.get_products_page(
+                name_filter, category_id_filter, sort=query_params.get('sort') or None,
+                after=query_params.get('after'), limit=limit, fields=fields, **filters
+            )
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if with_facets:
+            page['facets'] = service.get_facets(name_filter, category_id_filter, **filters)
+        return Response(page, status=status.HTTP_200_OK)
 
     @method_decorator(admin_required)
     def post(self, request):
-        service = ProductService()
+        service = product_service
         new_product = service.create_product(request.data)
         if new_product:
             return Response(new_product, status=status.HTTP_201_CREATED)
@@ -75,7 +148,7 @@ class ProductDetailAPIView(APIView):
     Responde a la URL: /api/products/<int:pk>/
     """
     def get(self, request, pk):
-        service = ProductService()
+        service = product_service
         product = service.get_product_by_id(pk)
         if product:
             return Response(product)
@@ -83,7 +156,7 @@ class ProductDetailAPIView(APIView):
 
     @method_decorator(admin_required)
     def put(self, request, pk):
-        service = ProductService()
+        service = product_service
         updated_product = service.update_product(pk, request.data)
         if updated_product:
             return Response(updated_product)
@@ -91,23 +164,46 @@ class ProductDetailAPIView(APIView):
 
     @method_decorator(admin_required)
     def delete(self, request, pk):
-        service = ProductService()
+        service = product_service
         if service.delete_product(pk):
             return Response(status=status.HTTP_204_NO_CONTENT)
         return Response(status=status.HTTP_404_NOT_FOUND) # Corregí el typo 44 a 404
 
+class ProductSuggestView(View):
+    """
+    Autocompletado del buscador del catálogo (se llama en cada tecla).
+    URL: /api/products/suggest/?q=choc&branch=1&limit=8
+    Sin 'branch' usa la sucursal elegida en la sesión (si hay).
+    Es una vista común (no de DRF) para que cada respuesta sea lo más
+    liviana posible.
+    """
+    def get(self, request):
+        params = request.GET
+        if params.get('branch', '').isdigit():
+            branch_id = int(params['branch'])
+        else:
+            selected = request.session.get('selected_branch_id')
+            branch_id = int(selected) if selected else None
+        try:
+            limit = min(max(int(params.get('limit', 8)), 1), 20)
+        except ValueError:
+            limit = 8
+        return JsonResponse(product_service.suggest(params.get('q', ''), branch_id, limit))
+
 # --- VISTAS HTML PARA PRODUCTOS ---
 
 class AdminProductView(AdminRequiredMixin,View):
     def get(self, request):
-        service = ProductService()
+        service = product_service
         
         # Verificar si hay un filtro de sucursal activo en la sesión del administrador
         branch_id_filter = request.session.get('admin_product_filter_branch_id')
         filter_message = "(Mostrando todos)"
         branch_name = None # Vble para el nombre de la sucursal filtrada
 
-        all_products = service.get_all_products()
+        # El catálogo ya armado de la sucursal (o el de todas), con el
+        # nombre de la categoría ya puesto en cada producto
+        all_products = service.get_branch_catalog(branch_id_filter or None)
 
         if branch_id_filter:
            # Obtener el nombre de la sucursal para mostrar en el título
@@ -120,23 +216,6 @@ class AdminProductView(AdminRequiredMixin,View):
                 filter_message = f" (Filtrado por Sucursal ID: {branch_id_filter}, nombre no encontrado)"
 
 
-            # Filtrar los productos localmente
-            all_products = [
-                p for p in all_products 
-                if p.get('branch_id') == branch_id_filter
-            ]
-            
-        
-        
-        # Enriquecer productos con el nombre de su categoría
-        all_categories = service.get_all_categories()
-        # Convertir a un mapa para búsqueda rápida: {1: 'Tortas', 2: 'Postres'}
-        category_map = {cat['id']: cat['name'] for cat in all_categories}
-        
-        # Añadir el nombre de la categoría a cada producto
-        for product in all_products:
-            product['category_name'] = category_map.get(product['category_id'], 'Sin Categoría')
-
         context = {
             'products': all_products,
             'filter_message': filter_message,
@@ -267,7 +346,7 @@ class DeleteProductHTMLView(AdminRequiredMixin,View):
     Vista específica para eliminar productos desde el HTML
     """
     def post(self, request, pk):
-        service = ProductService()
+        service = product_service
         
         if service.delete_product(pk):
             messages.success(request, f"Producto eliminado exitosamente")
@@ -283,22 +362,45 @@ class List_productView(View):
     Responde a la URL: /products/list
     """
     def get(self, request):
-        service = ProductService()
-        branch_service = BranchService()
+        service = product_service
 
         # Obtener la sucursal que el cliente eligió previamente
         selected_branch_id = request.session.get('selected_branch_id')
 
-        all_products = service.get_all_products() 
-
+        facets = None
+        filters = {}
         if selected_branch_id:
-            # Filtrar productos por sucursal
+            # Filtros combinados (categoría, precio, stock, peso) sobre la
+            # sucursal elegida; los conteos salen de los bitmaps del índice
             branch_id = int(selected_branch_id)
-            productos = [prod for prod in all_products if prod.get('branch_id') == branch_id]
+            try:
+                filters = _product_range_filters(request.GET)
+                category = request.GET.get('category')
+                filters['category_id_filter'] = int(category) if category else None
+            except ValueError:
+                messages.error(request, "Filtro no válido: se muestran todos los productos.")
+                filters = {}
+            filters['branch_id_filter'] = branch_id
+            # El catálogo ya armado de la sucursal (con 'category_name');
+            # con filtros, solo las filas de los productos que los cumplen
+            if any(value is not None for name, value in filters.items() if name != 'branch_id_filter'):
+                matching = [p['id'] for p in service.get_all_products(fields=['id'], **filters)]
+                productos = service.get_branch_catalog(branch_id, matching)
+            else:
+                productos = service.get_branch_catalog(branch_id)
+            facets = service.get_facets(**filters)
+            # Disponible = stock - lo que reservaron OTROS clientes (en memoria,
+            # sin releer archivos)
+            available = reservations.available_for(
+                {p['id']: p['stock'] for p in productos}, request.session.get('user_id')
+            )
+            # (Las filas del catálogo son de solo lectura: copias con 'available')
+            productos = [dict(p, available=available[p['id']]) for p in productos]
             
-            branches = branch_service.get_all_branches()
-            # Buscar el nombre de la sucursal para el título
-            branch_name = next((b['name'] for b in branches if b['id'] == branch_id), "Catálogo")
+            # Buscar el nombre de la sucursal para el título (servicio
+            # compartido del módulo: no se vuelve a leer 'branches')
+            branch = branch_service.get_branch_by_id(branch_id)
+            branch_name = branch['name'] if branch else "Catálogo"
             #branch_name = f" (Sucursal ID: {branch_id})"  # ME da el Id de la sucursal seleccionada
         else:
             # Si no hay sucursal seleccionada, No mostrar productos hasta que se seleccione una
@@ -308,6 +410,14 @@ class List_productView(View):
         # Preparar el contexto para el template
         context = {
             'productos': productos,
+            'facets': facets,
+            'filters': filters,
+            # Para los links de la faceta "categoría": [{id, name, count}]
+            'facet_categories': [
+                {'id': c['id'], 'name': c['name'], 'count': facets['categories'].get(c['id'], 0)}
+                for c in service.get_all_categories()
+            ] if facets else [],
+            'branch_selected': selected_branch_id is not None,
             'titulo': f'Catálogo de Productos - Sucursal {branch_name}',
             # Flag para JS: muestra el modal si la sucursal no está seleccionada
             'show_branch_modal': selected_branch_id is None, # Activa el modal si es necesario
@@ -322,21 +432,24 @@ class ProductDetailHTMLView(View):
     URL: /products/<pk>/view/  (nombre: product-detail-html)
     """
     def get(self, request, pk):
-        service = ProductService()
-        product = service.get_product_by_id(pk)
-
+        service = product_service
         selected_branch_id = request.session.get('selected_branch_id')
         is_admin = request.session.get('user_role') == 'admin'
 
+        # Si es cliente con sucursal elegida, el producto sale del catálogo
+        # de ESA sucursal (si no está ahí, no es de su sucursal)
+        if not is_admin and selected_branch_id:
+            product = service.get_branch_product(int(selected_branch_id), pk)
+            if not product and service.get_product_by_id(pk):
+                messages.warning(request, "El producto no está disponible en la sucursal seleccionada.")
+                return redirect('product-list-html')
+        else:
+            product = service.get_branch_product(None, pk)
+
         if not product:
             messages.error(request, "Producto no encontrado")
             return redirect('product-list-html')
 
-        # Si es cliente, verificar que el producto pertenezca a su sucursal seleccionada
-        if not is_admin and selected_branch_id and product.get('branch_id') != int(selected_branch_id):
-            messages.warning(request, "El producto no está disponible en la sucursal seleccionada.")
-            return redirect('product-list-html')
-
          # Preparar el contexto para el template
         
         context = {
@@ -357,7 +470,7 @@ class AdminCategoryView(AdminRequiredMixin,View):
     Vista para listar todas las categorías en una tabla HTML.
     """
     def get(self, request):
-        service = ProductService()
+        service = product_service
         all_categories = service.get_all_categories()
         context = {
             'categories': all_categories,
@@ -371,7 +484,7 @@ class CategoryFormView(AdminRequiredMixin,View):
     CREACIÓN o EDICIÓN de categorías.
     """
     def get(self, request, pk=None):
-        service = ProductService()
+        service = product_service
         category_data = None
         form_title = "Crear Nueva Categoría"
 
@@ -391,7 +504,7 @@ class CategoryFormView(AdminRequiredMixin,View):
         return render(request, 'store/category_form.html', context)
 
     def post(self, request, pk=None):
-        service = ProductService()
+        service = product_service
         category_name = request.POST.get('name')
 
         if not category_name:
@@ -420,7 +533,7 @@ class DeleteCategoryView(AdminRequiredMixin,View):
     Vista específica para eliminar categorías desde el HTML (POST).
     """
     def post(self, request, pk):
-        service = ProductService()
+        service = product_service
         
         if service.delete_category(pk):
             messages.success(request, f"Categoría eliminada exitosamente.")
@@ -435,7 +548,7 @@ class DeleteCategoryView(AdminRequiredMixin,View):
 class CartView(View):
     """
     Vista para mostrar y gestionar el carrito de un usuario.
-    Utiliza CartService para persistir los datos en carts.json.
+    Utiliza CartService para persistir los datos (un carrito por usuario).
     """
     
     def get(self, request):
@@ -450,29 +563,20 @@ class CartView(View):
         # Recuperar el carrito del usuario
         cart = cart_service.get_cart(user_id)
         
-        # Calcular totales y obtener detalles de productos
-        cart_items = []
-        total = 0
-        for item in cart.items.values():
-            product = product_service.get_product_by_id(item.product_id)
-            if product:
-                subtotal = product['price'] * item.quantity
-                cart_items.append({
-                    'product': product,
-                    'quantity': item.quantity,
-                    'subtotal': subtotal
-                })
-                total += subtotal
+        # Calcular totales (todos los productos en una sola búsqueda)
+        pricing = cart_pricer.price_cart(cart)
         
         context = {
-            'cart_items': cart_items,
-            'total': total
+            'cart_items': pricing['lines'],
+            'total': pricing['total']
         }
         return render(request, 'store/cart.html', context)
 
+    @idempotent
     def post(self, request):
         """
         Agrega o elimina productos del carrito del usuario logueado.
+        (Con clave de idempotencia, un reintento no suma dos veces.)
         """
         user_id = request.session.get('user_id')
         is_ajax = 'HTTP_X_REQUESTED_WITH' in request.META and request.META['HTTP_X_REQUESTED_WITH'] == 'XMLHttpRequest'
@@ -503,7 +607,10 @@ class CartView(View):
             if not product:
                 return JsonResponse({'success': False, 'error': 'Producto no encontrado'}, status=404)
             
-            if product['stock'] >= quantity:
+            # Reservamos la cantidad TOTAL que tendrá el carrito (lo que ya
+            # había más lo nuevo); falla si otros clientes ya lo reservaron.
+            current = cart.items[product_id].quantity if product_id in cart.items else 0
+            if reservations.hold(user_id, product_id, current + quantity, product['stock']):
                 cart.add_item(product_id, quantity)
                 cart_service.save_cart(cart)
                 # Responde JSON (esto arregla el error de "conexión")
@@ -514,6 +621,7 @@ class CartView(View):
         elif action == 'remove':
             cart.remove_item(product_id)
             cart_service.save_cart(cart)
+            reservations.release(user_id, [product_id])
             messages.success(request, "Producto eliminado del carrito")
             return redirect('cart') # Redirige de vuelta al carrito
         
@@ -541,27 +649,31 @@ class CheckoutView(View):
             messages.warning(request, "Tu carrito está vacío")
             return redirect('cart')
             
-        #Detalles de productos
-        cart_items = []
-        total = 0
-        for item in cart.items.values():
-            product = product_service.get_product_by_id(item.product_id)
-            if product:
-                item_total = product['price'] * item.quantity
-                cart_items.append({
-                    'product': product,
-                    'quantity': item.quantity,
-                    'total': item_total
-                })
-                total += item_total
+        #Detalles de productos (todos en una sola búsqueda)
+        pricing = cart_pricer.price_cart(cart)
+
+        # Al entrar al checkout se renuevan las reservas de todo el carrito
+        rejected = reservations.hold_many(
+            user_id,
+            {line['product_id']: line['quantity'] for line in pricing['lines']},
+            {line['product_id']: line['product']['stock'] for line in pricing['lines']}
+        )
+        for line in pricing['lines']:
+            if line['product_id'] in rejected:
+                messages.warning(request, f"'{line['product']['title']}': solo quedan {line['available']} disponibles.")
                 
         context = {
-            'cart_items': cart_items,
-            'total': total
+            'cart_items': pricing['lines'],
+            'total': pricing['total'],
+            # Una clave por formulario: si se envía dos veces, se compra una
+            'idempotency_key': uuid4().hex
         }
         return render(request, 'store/checkout.html', context)
 
+    @idempotent
     def post(self, request):
+        # Con el campo oculto 'idempotency_key', un doble envío del
+        # formulario recibe la misma respuesta y no crea otra orden.
         user_id = request.session.get('user_id')
         if not user_id:
             messages.error(request, "Tu sesión ha expirado.")
@@ -572,27 +684,6 @@ class CheckoutView(View):
             if not cart.items:
                 messages.error(request, "Tu carrito está vacío.")
                 return redirect('cart')
-
-            
-            # 1. Validar Datos del Formulario
-            items_con_detalles = []
-            total_verificado = 0
-            
-            for item in cart.items.values():
-                product = product_service.get_product_by_id(item.product_id)
-                if not product:
-                    messages.error(request, f"El producto ID {item.product_id} ya no existe.")
-                    return redirect('cart')
-                
-                if product['stock'] < item.quantity:
-                    messages.error(request, f"¡Stock insuficiente para '{product['title']}'! Disponible: {product['stock']}.")
-                    return redirect('cart')
-                
-                items_con_detalles.append({
-                    'product': product, 
-                    'quantity': item.quantity
-                })
-                total_verificado += product['price'] * item.quantity
             
             # Datos del formulario
             nombre = request.POST.get('nombre', '').strip()
@@ -610,21 +701,6 @@ class CheckoutView(View):
                 messages.error(request, "Por favor ingresa tu dirección de envío.")
                 return redirect('checkout')
             
-            try:
-                for item_detail in items_con_detalles:
-                    product = item_detail['product']
-                    cantidad_a_descontar = item_detail['quantity']
-                    
-                    # Descontar del stock
-                    product['stock'] -= cantidad_a_descontar
-                    
-                    # Guardar cambios en el producto
-                    product_service.update_product(product['id'], product)
-                    
-            except Exception as e:
-                messages.error(request, f"Hubo un error al actualizar el stock: {e}")
-                return redirect('checkout')
-            
             # Obtener información del usuario
             user = user_service.get_user_by_id(user_id)
             
@@ -638,20 +714,13 @@ class CheckoutView(View):
                 "payment_method": payment_method
             }
             
-            # Crear orden
-            order_service = OrderService()
-
-             # Obtener branch_id del primer producto
-            branch_id = items_con_detalles[0]['product']['branch_id'] if items_con_detalles else None
-            #Pasar los parámetros correctos al create_order
-            order = order_service.create_order(
-                user_id=user_id,
-                cart_data=cart.to_dict(),
-                user_data=user_data
-            )
-            
-            # Limpiar carrito
-            cart_service.remove_cart(user_id)
+            # Validar stock, descontarlo, crear la orden y vaciar el carrito:
+            # todo junto, "todo o nada" (ver checkout_service.py)
+            try:
+                order = CheckoutService().checkout(user_id, user_data)
+            except CheckoutError as e:
+                messages.error(request, str(e))
+                return redirect('cart')
             
             request.session['last_order_id'] = order['id']
             
@@ -710,55 +779,46 @@ class OrderDetailView(View):
 class AdminCartsView(AdminRequiredMixin, View):
     """
     Vista de administrador para ver todos los carritos de compras
-    almacenados en carts.json.
+    guardados (un registro por usuario).
     """
     def get(self, request):
-        # Cargar todos los carritos, devuelve un dict: {"user_id_1": {...}, "user_id_2": {...}}
-        all_carts_data = cart_service.get_all_carts()
+        # Recorremos los carritos de a uno: (user_id, cart_data)
+        # (los vacíos no se muestran)
+        carts = [
+            (user_id_str, Cart.from_dict(cart_data))
+            for user_id_str, cart_data in cart_service.iter_carts()
+            if cart_data.get('items')
+        ]
+        # Precios de TODOS los carritos con una sola búsqueda de productos
+        pricings = cart_pricer.price_carts(cart for _, cart in carts)
         
         processed_carts = []
         
-        all_users = user_service._load_users()
+        all_users = user_service.get_all_users()
         user_map = {str(u.user_id): u.username for u in all_users}
 
-        for user_id_str, cart_data in all_carts_data.items():
-            
-            if not cart_data.get('items'):
-                continue
+        for (user_id_str, cart), pricing in zip(carts, pricings):
 
             # Obtener info del usuario
             username = user_map.get(user_id_str, f"Usuario ID: {user_id_str} (No encontrado)")
 
+            lines = {line['product_id']: line for line in pricing['lines']}
             processed_items = []
-            cart_total = 0
             
-            for item_id_str, item_data in cart_data.get('items', {}).items():
-                product_id = item_data.get('product_id')
-                quantity = item_data.get('quantity', 0)
-                
-                product = product_service.get_product_by_id(product_id)
-                
-                if product:
-                    product_name = product.get('title')
-                    product_price = product.get('price', 0)
-                    subtotal = product_price * quantity
-                    cart_total += subtotal
-                else:
-                    product_name = f"Producto ID: {product_id} (No encontrado)"
-                    subtotal = 0
-                
+            for item in cart.items.values():
+                line = lines.get(item.product_id)
                 processed_items.append({
-                    'product_id': product_id,
-                    'product_name': product_name,
-                    'quantity': quantity,
-                    'subtotal': subtotal
+                    'product_id': item.product_id,
+                    'product_name': line['product']['title'] if line else f"Producto ID: {item.product_id} (No encontrado)",
+                    'quantity': item.quantity,
+                    'subtotal': line['subtotal'] if line else 0
                 })
             
             processed_carts.append({
                 'user_id': user_id_str,
                 'username': username,
                 'items': processed_items,
-                'total': cart_total
+                'total': pricing['total']
             })
 
         context = {
@@ -766,39 +826,194 @@ class AdminCartsView(AdminRequiredMixin, View):
         }
         return render(request, 'store/admin_carts.html', context)
 
+# Órdenes por página en el panel de admin (y en su API)
+ADMIN_ORDERS_PAGE_SIZE = 25
+
+
+def _admin_order_filters(request):
+    """
+    Lee los filtros del panel de órdenes desde la URL:
+    ?status=pending&branch=1&user=3&desde=2025-01-01&hasta=2025-01-31&after=<cursor>
+    (los que no vienen o no son válidos se ignoran).
+    """
+    params = request.GET
+    status_filter = params.get('status') or None
+    if status_filter not in OrderService.VALID_STATUSES:
+        status_filter = None
+    return {
+        'status': status_filter,
+        'branch_id': int(params['branch']) if params.get('branch', '').isdigit() else None,
+        'user_id': int(params['user']) if params.get('user', '').isdigit() else None,
+        'start': params.get('desde') or None,
+        'end': params.get('hasta') or None,
+    }
+
+
 class AdminOrdersView(AdminRequiredMixin, View):
     """
-    Vista de administrador para ver todas las órdenes
+    Vista de administrador para ver las órdenes, de a una página
+    (ADMIN_ORDERS_PAGE_SIZE) y con filtros (ver _admin_order_filters).
     """
     def get(self, request):
         order_service = OrderService()
-        orders = order_service.get_all_orders()
-        
-        # Ordenar por fecha más reciente primero
-        orders.sort(key=lambda x: x['created_at'], reverse=True)
-
-         # Calcular estadísticas x estado
-        status_counts = {
-            'total': len(orders),
-            'pending': 0,
-            'confirmed': 0,
-            'preparing': 0,
-            'ready': 0,
-            'completed': 0,
-            'cancelled': 0
-        }
-        
-        for order in orders:
-            status = order.get('status', 'pending')
-            if status in status_counts:
-                status_counts[status] += 1
+        filters = _admin_order_filters(request)
+        # Más reciente primero, solo la página pedida (paginación por cursor)
+        page = order_service.get_orders_page(
+            after=request.GET.get('after'), limit=ADMIN_ORDERS_PAGE_SIZE, **filters
+        )
+
+        # Estadísticas x estado (contadores que mantiene el índice)
+        status_counts = order_service.get_status_counts()
+
+        # Los filtros actuales, para armar el link a la página siguiente
+        query = request.GET.copy()
+        query.pop('after', None)
         
         context = {
-            'orders': orders,
+            'orders': page['orders'],
+            'next_cursor': page['next_cursor'],
+            'is_first_page': not request.GET.get('after'),
+            'filter_query': query.urlencode(),
+            'filters': filters,
+            'valid_statuses': OrderService.VALID_STATUSES,
+            'branches': branch_service.get_all_branches(),
             'status_counts': status_counts
         }
         return render(request, 'store/admin_orders.html', context)
 
+
+class AdminOrdersAPIView(View):
+    """
+    API JSON del panel de órdenes: mismos filtros y cursor que la página.
+    URL: /api/admin/orders/api/?status=...&after=...
+    """
+    @admin_required
+    def get(self, request):
+        order_service = OrderService()
+        try:
+            limit = min(int(request.GET.get('limit', ADMIN_ORDERS_PAGE_SIZE)), 100)
+        except ValueError:
+            limit = ADMIN_ORDERS_PAGE_SIZE
+        page = order_service.get_orders_page(
+            after=request.GET.get('after'), limit=max(limit, 1), **_admin_order_filters(request)
+        )
+        page['status_counts'] = order_service.get_status_counts()
+        return JsonResponse(page)
+
+# Agrupados que ofrece el panel de ventas (la API acepta cualquier combinación)
+ADMIN_SALES_GROUPS = [
+    ('day', 'Día'),
+    ('branch_id', 'Sucursal'),
+    ('product_id', 'Producto'),
+    ('status', 'Estado'),
+    ('day,branch_id', 'Día y sucursal'),
+    ('day,product_id', 'Día y producto'),
+]
+
+
+def _admin_sales_filters(request):
+    """
+    Filtros del reporte de ventas desde la URL:
+    ?desde=2025-01-01&hasta=2025-01-31&branch=1&product=102&status=completed&group=day,branch_id
+    (los que no vienen o no son válidos se ignoran; 'group' por defecto es 'day').
+    """
+    params = request.GET
+    filters = _admin_order_filters(request)
+    filters.pop('user_id')
+    filters['product_id'] = int(params['product']) if params.get('product', '').isdigit() else None
+    requested = params.get('group', 'day').split(',')
+    group_by = [field for field in GROUP_FIELDS if field in requested]
+    filters['group_by'] = group_by or ['day']
+    return filters
+
+
+class AdminAnalyticsView(AdminRequiredMixin, View):
+    """
+    Panel de ventas para el admin: recaudación, unidades y órdenes por
+    día/sucursal/producto/estado (ver OrderService.get_sales_report).
+    """
+    def get(self, request):
+        filters = _admin_sales_filters(request)
+        report = OrderService().get_sales_report(**filters)
+        context = {
+            'report': report,
+            'group_by': filters['group_by'],
+            'group': ','.join(filters['group_by']),
+            'group_options': ADMIN_SALES_GROUPS,
+            'filters': filters,
+            'totals': {
+                'revenue': round(sum(row['revenue'] for row in report), 2),
+                'units': sum(row['units'] for row in report),
+                'orders': sum(row['orders'] for row in report),
+            },
+            'valid_statuses': OrderService.VALID_STATUSES,
+            'branches': branch_service.get_all_branches(),
+        }
+        return render(request, 'store/admin_analytics.html', context)
+
+
+class AdminAnalyticsAPIView(View):
+    """
+    API JSON del reporte de ventas (mismos filtros que el panel).
+    URL: /api/admin/analytics/api/?desde=...&hasta=...&group=day,branch_id
+    """
+    @admin_required
+    def get(self, request):
+        filters = _admin_sales_filters(request)
+        return JsonResponse({
+            'group_by': filters['group_by'],
+            'rows': OrderService().get_sales_report(**filters)
+        })
+
+def _export_response(request, records, fields, name):
+    """
+    Respuesta "streaming" con las filas de 'records' en el formato pedido
+    (?format=csv o ndjson, ver exports.py). Las filas se generan a medida
+    que se envían: nunca está todo el archivo en memoria.
+    """
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in exports.FORMATS:
+        return JsonResponse({'error': f"Formato no válido: usar {', '.join(exports.FORMATS)}"}, status=400)
+    response = StreamingHttpResponse(
+        exports.stream_lines(records, fields, export_format),
+        content_type=exports.FORMATS[export_format]
+    )
+    file_name = f"{name}-{datetime.now():%Y%m%d-%H%M}.{export_format}"
+    response['Content-Disposition'] = f'attachment; filename="{file_name}"'
+    return response
+
+
+class AdminOrdersExportView(View):
+    """
+    Exporta las órdenes (calientes y archivadas) en CSV o NDJSON.
+    Mismos filtros que el panel (ver _admin_order_filters); con
+    ?flatten=1 sale una fila por item y los datos del cliente en columnas.
+    URL: /api/admin/orders/export/?format=csv&desde=2024-01-01&hasta=2024-12-31
+    """
+    @admin_required
+    def get(self, request):
+        flatten = request.GET.get('flatten') in ('1', 'true')
+        orders = OrderService().iter_orders(**_admin_order_filters(request))
+        return _export_response(request, exports.order_records(orders, flatten),
+                                exports.order_fields(flatten), 'ordenes')
+
+
+class AdminProductsExportView(View):
+    """
+    Exporta el catálogo en CSV o NDJSON (?branch=1&category=2 opcionales).
+    URL: /api/admin/products/export/?format=ndjson
+    """
+    @admin_required
+    def get(self, request):
+        params = request.GET
+        products = ProductService().iter_products(
+            category_id_filter=int(params['category']) if params.get('category', '').isdigit() else None,
+            branch_id_filter=int(params['branch']) if params.get('branch', '').isdigit() else None,
+            # Las mismas columnas en CSV y en NDJSON (sin campos internos como 'version')
+            fields=exports.PRODUCT_FIELDS
+        )
+        return _export_response(request, products, exports.PRODUCT_FIELDS, 'productos')
+
 class AdminOrderDetailView(AdminRequiredMixin, View):
     """
     Vista de administrador para ver y gestionar una orden específica
@@ -837,10 +1052,10 @@ class LoginView(View):
         return render(request, 'store/login.html')
 
     def post(self, request):
-        service = UserService()
+        service = user_service
         username = request.POST.get('username')
         password = request.POST.get('password')
-        # Forzar recarga para reconocer usuarios nuevos
+        # El servicio recarga solo si 'users' cambió (ej: registro en otro worker)
         user = service.get_user_by_username(username)
         
         if user and user.password == password:
@@ -875,7 +1090,7 @@ class RegisterView(View):
         })
 
     def post(self, request):
-        service = UserService()
+        service = user_service
         username = request.POST.get('username')
         pass1 = request.POST.get('password')
         pass2 = request.POST.get('password2')
@@ -933,11 +1148,7 @@ class AdminUserView(AdminRequiredMixin, View):
     Vista para listar todos los usuarios (Admin View).
     """
     def get(self, request):
-        user_service = UserService()
-
-        user_service._load_users() 
-        
-        all_users = user_service._users # Obtener todos los usuarios
+        all_users = user_service.get_all_users() # Obtener todos los usuarios
 
         # Obtener el ID del usuario logueado desde la sesión
         logged_in_user_id = request.session.get('user_id')
@@ -973,11 +1184,8 @@ def profile_view(request):
     if not logged_in_username:
         messages.warning(request, "Debes iniciar sesión para ver tu perfil.")
         return redirect('login') 
-    # Forzar la carga de usuarios para ver archivo JSON actualizado
-    service = UserService()
-    service._load_users()
-
-    user_object = service.get_user_by_username(logged_in_username)
+    # El servicio compartido ya detecta cambios en 'users'
+    user_object = user_service.get_user_by_username(logged_in_username)
     
     if not user_object:
         request.session.flush() 
@@ -1001,7 +1209,7 @@ class AdminBranchView(AdminRequiredMixin, View):
     Vista para listar todas las sucursales (solo admin).
     """
     template_name = 'store/admin_branches.html'
-    service = BranchService()
+    service = branch_service # El servicio compartido del módulo
 
     def get(self, request):
         branches = self.service.get_all_branches()